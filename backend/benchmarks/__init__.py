@@ -0,0 +1,3 @@
+"""
+Benchmarks del motor catastral (python -m benchmarks.suite)
+"""
@@ -0,0 +1,419 @@
+"""
+Prueba de carga HTTP de extremo a extremo
+Arranca el stub OVC y la API (uvicorn o gunicorn con N workers), lanza una
+mezcla de tráfico realista y mide latencias p50/p95/p99, rendimiento, errores
+y RSS de cada worker. Con --pesados reproduce el patrón de producción en el
+que una subida grande degrada al resto de peticiones.
+
+    python -m benchmarks.carga --duracion-s 30 --concurrencia 16
+    python -m benchmarks.carga --servidor gunicorn --workers 4 --pesados 2 --parcelas-pesado 5000
+    python -m benchmarks.carga --tasa 40 --mezcla catastro:1 --latencia-upstream lognormal:120:0.6
+    python -m benchmarks.carga --url http://127.0.0.1:8000   # contra un servidor ya arrancado
+
+La sonda GET /health (cada 200 ms) muestra directamente el bloqueo del bucle de eventos.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DIRECTORIO_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(DIRECTORIO_BACKEND)
+
+from benchmarks.tejido_sintetico import generar_tejido, escribir_dxf
+
+MEZCLA_POR_DEFECTO = "analyze:1,generate:2,catastro:5,ibi:4"
+
+
+@dataclass
+class Resultado:
+    operacion: str
+    inicio: float
+    segundos: float
+    estado_http: int
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.estado_http < 400 and not self.error
+
+
+@dataclass
+class Cargas:
+    """Cuerpos de petición preparados antes de empezar a medir"""
+    dxf_ligero: bytes
+    dxf_pesado: Optional[bytes]
+    parcelas: List[Dict[str, Any]] = field(default_factory=list)  # salida de /analyze, para /generate-*
+
+
+def parse_mezcla(texto: str) -> Dict[str, float]:
+    """'analyze:1,catastro:5' -> {'analyze': 1.0, 'catastro': 5.0}"""
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.strip().partition(":")
+        if nombre not in OPERACIONES:
+            raise ValueError(f"Operación desconocida: {nombre} (disponibles: {', '.join(OPERACIONES)})")
+        mezcla[nombre] = float(peso or 1)
+    return mezcla
+
+
+def resumir(resultados: List[Resultado], duracion_s: float) -> Dict[str, Dict[str, Any]]:
+    """Percentiles, rendimiento y tasa de error por operación (y 'total' sin sonda ni pesados)"""
+    grupos: Dict[str, List[Resultado]] = defaultdict(list)
+    for r in resultados:
+        grupos[r.operacion].append(r)
+        if r.operacion not in ("sonda", "analyze_pesado"):
+            grupos["total"].append(r)
+
+    resumen = {}
+    for nombre, rs in sorted(grupos.items()):
+        lat = np.array([r.segundos for r in rs]) * 1000
+        errores = sum(not r.ok for r in rs)
+        resumen[nombre] = {
+            "peticiones": len(rs),
+            "rps": round(len(rs) / duracion_s, 2) if duracion_s else 0.0,
+            "errores": errores,
+            "tasa_error": round(errores / len(rs), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 1),
+            "p95_ms": round(float(np.percentile(lat, 95)), 1),
+            "p99_ms": round(float(np.percentile(lat, 99)), 1),
+            "max_ms": round(float(lat.max()), 1),
+        }
+    return resumen
+
+
+# ===== OPERACIONES =====
+
+async def _analyze(cliente, cargas: Cargas, rnd: random.Random):
+    return await cliente.post("/analyze", files={"file": ("carga.dxf", cargas.dxf_ligero)})
+
+
+async def _generate(cliente, cargas: Cargas, rnd: random.Random):
+    ruta = rnd.choice(["/generate-kml", "/generate-dxf", "/generate-shape"])
+    return await cliente.post(ruta, json={"parcelas": cargas.parcelas, "epsg": "25830"})
+
+
+async def _catastro(cliente, cargas: Cargas, rnd: random.Random):
+    consulta = rnd.random()
+    if consulta < 0.4:
+        return await cliente.post("/catastro/buscar-rc", json={"referencia_catastral": "8409103VH0180N0001AI"})
+    if consulta < 0.7:
+        # Puntos distintos para no acertar siempre en la coalescencia
+        return await cliente.post("/catastro/buscar-por-coordenadas", json={
+            "lat": 38.0395 + rnd.uniform(-0.01, 0.01), "lon": -4.0571 + rnd.uniform(-0.01, 0.01),
+        })
+    return await cliente.post("/catastro/buscar-rustica", json={
+        "provincia": "23", "municipio": "39", "poligono": "49", "parcela": str(rnd.randint(1, 500)),
+    })
+
+
+async def _ibi(cliente, cargas: Cargas, rnd: random.Random):
+    return await cliente.post("/catastro/calcular-ibi", json={
+        "municipio": "Andújar", "clase": "urbano", "sup_parcela": rnd.uniform(100, 2000),
+        "valor_rep": 150, "sup_const": rnd.uniform(60, 400), "uso_const": "vivienda",
+        "categoria": rnd.randint(1, 9), "anio_const": rnd.randint(1950, 2020),
+    })
+
+
+OPERACIONES = {"analyze": _analyze, "generate": _generate, "catastro": _catastro, "ibi": _ibi}
+
+
+async def _medir(cliente, nombre: str, coro, resultados: List[Resultado]) -> None:
+    inicio = time.perf_counter()
+    try:
+        resp = await coro
+        await resp.aread()
+        resultados.append(Resultado(nombre, inicio, time.perf_counter() - inicio, resp.status_code))
+    except Exception as e:
+        resultados.append(Resultado(nombre, inicio, time.perf_counter() - inicio, 0, type(e).__name__))
+
+
+# ===== GENERADOR DE CARGA =====
+
+async def generar_carga(url: str, cargas: Cargas, mezcla: Dict[str, float], duracion_s: float,
+                        concurrencia: int = 16, tasa: float = 0.0, pesados: int = 0,
+                        semilla: int = 1, timeout_s: float = 120.0) -> Tuple[List[Resultado], float]:
+    """
+    Bucle cerrado (concurrencia usuarios sin pausa) o, con tasa > 0, bucle abierto
+    con llegadas de Poisson a 'tasa' peticiones/s (la concurrencia limita las que hay en vuelo).
+    Devuelve (resultados, duración real).
+    """
+    import httpx
+
+    rnd = random.Random(semilla)
+    nombres, pesos = list(mezcla), list(mezcla.values())
+    resultados: List[Resultado] = []
+    limites = httpx.Limits(max_connections=concurrencia + pesados + 4)
+    inicio = time.perf_counter()
+    fin = inicio + duracion_s
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout_s, limits=limites) as cliente:
+        async def usuario():
+            while time.perf_counter() < fin:
+                nombre = rnd.choices(nombres, pesos)[0]
+                await _medir(cliente, nombre, OPERACIONES[nombre](cliente, cargas, rnd), resultados)
+
+        async def pesado():
+            while time.perf_counter() < fin:
+                await _medir(cliente, "analyze_pesado",
+                             cliente.post("/analyze", files={"file": ("pesado.dxf", cargas.dxf_pesado)}),
+                             resultados)
+
+        async def sonda():
+            while time.perf_counter() < fin:
+                await _medir(cliente, "sonda", cliente.get("/health"), resultados)
+                await asyncio.sleep(0.2)
+
+        async def llegadas():
+            en_vuelo = asyncio.Semaphore(concurrencia)
+            tareas = set()
+
+            async def una(nombre):
+                async with en_vuelo:
+                    await _medir(cliente, nombre, OPERACIONES[nombre](cliente, cargas, rnd), resultados)
+
+            while time.perf_counter() < fin:
+                tarea = asyncio.ensure_future(una(rnd.choices(nombres, pesos)[0]))
+                tareas.add(tarea)
+                tarea.add_done_callback(tareas.discard)
+                await asyncio.sleep(rnd.expovariate(tasa))
+            if tareas:
+                await asyncio.wait(tareas)
+
+        tareas = [sonda()] + [pesado() for _ in range(pesados)]
+        tareas += [llegadas()] if tasa > 0 else [usuario() for _ in range(concurrencia)]
+        await asyncio.gather(*tareas)
+
+    return resultados, time.perf_counter() - inicio
+
+
+# ===== SERVIDOR Y MEMORIA =====
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_api(servidor: str, workers: int, puerto: int, entorno: Dict[str, str], log) -> subprocess.Popen:
+    if servidor == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "main:app", "-k", "uvicorn.workers.UvicornWorker",
+               "-w", str(workers), "-b", f"127.0.0.1:{puerto}", "--timeout", "300"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+               "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=DIRECTORIO_BACKEND, env={**os.environ, **entorno},
+                            stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def esperar_api(url: str, proceso: Optional[subprocess.Popen], timeout_s: float = 90.0) -> None:
+    import httpx
+    limite = time.monotonic() + timeout_s
+    while time.monotonic() < limite:
+        if proceso is not None and proceso.poll() is not None:
+            raise RuntimeError(f"La API terminó al arrancar (código {proceso.returncode})")
+        try:
+            if httpx.get(url + "/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise TimeoutError(f"La API no respondió en {timeout_s:.0f} s")
+
+
+def _rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _descendientes(pid: int) -> List[int]:
+    hijos = defaultdict(list)
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nombre}/stat") as f:
+                # El nombre del proceso va entre paréntesis y puede contener espacios
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        hijos[ppid].append(int(nombre))
+    pendientes, todos = [pid], []
+    while pendientes:
+        actual = pendientes.pop()
+        todos.append(actual)
+        pendientes.extend(hijos.get(actual, []))
+    return todos
+
+
+class MuestreadorRSS(threading.Thread):
+    """Muestrea la RSS del proceso maestro y de sus workers (Linux, /proc)"""
+
+    def __init__(self, pid: int, intervalo_s: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo_s = intervalo_s
+        self.maximo: Dict[int, int] = {}
+        self.ultimo: Dict[int, int] = {}
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            for pid in _descendientes(self.pid):
+                rss = _rss_kb(pid)
+                if rss is not None:
+                    self.ultimo[pid] = rss
+                    self.maximo[pid] = max(rss, self.maximo.get(pid, 0))
+            self._parar.wait(self.intervalo_s)
+
+    def parar(self) -> Dict[str, Dict[str, float]]:
+        self._parar.set()
+        self.join()
+        return {
+            ("maestro" if pid == self.pid else f"worker_{pid}"): {
+                "rss_max_mb": round(self.maximo[pid] / 1024, 1),
+                "rss_final_mb": round(self.ultimo[pid] / 1024, 1),
+            }
+            for pid in sorted(self.maximo)
+        }
+
+
+def preparar_cargas(url: str, parcelas_ligero: int, parcelas_pesado: int) -> Cargas:
+    """DXF sintéticos y, con una llamada a /analyze, las parcelas que recibirán los /generate-*"""
+    import httpx
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = escribir_dxf(generar_tejido(parcelas_ligero, semilla=3), os.path.join(tmp, "ligero.dxf"))
+        with open(ruta, "rb") as f:
+            ligero = f.read()
+        pesado = None
+        if parcelas_pesado:
+            ruta = escribir_dxf(generar_tejido(parcelas_pesado, semilla=4), os.path.join(tmp, "pesado.dxf"))
+            with open(ruta, "rb") as f:
+                pesado = f.read()
+    resp = httpx.post(url + "/analyze", files={"file": ("ligero.dxf", ligero)}, timeout=120)
+    resp.raise_for_status()
+    return Cargas(dxf_ligero=ligero, dxf_pesado=pesado, parcelas=resp.json()["parcelas"])
+
+
+def ejecutar(servidor: str = "uvicorn", workers: int = 1, duracion_s: float = 30.0, concurrencia: int = 16,
+             tasa: float = 0.0, mezcla: str = MEZCLA_POR_DEFECTO, pesados: int = 0, parcelas_ligero: int = 20,
+             parcelas_pesado: int = 1000, latencia_upstream: str = "lognormal:80:0.5",
+             tasa_error_upstream: float = 0.0, url: str = "", semilla: int = 1) -> Dict[str, Any]:
+    """Arranca stub y API (salvo con 'url'), genera la carga y devuelve el informe"""
+    from ovc_stub_server import crear_servidor
+
+    stub = proceso = muestreador = None
+    log = tempfile.NamedTemporaryFile(prefix="catastro-carga-", suffix=".log", delete=False)
+    try:
+        if not url:
+            stub = crear_servidor(puerto=0, latencia=latencia_upstream, tasa_error=tasa_error_upstream)
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+            puerto = _puerto_libre()
+            url = f"http://127.0.0.1:{puerto}"
+            proceso = arrancar_api(servidor, workers, puerto, {
+                "CATASTRO_OVC_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+                "CATASTRO_RPS": "100000", "CATASTRO_RAFAGA": "100000",
+                "PYTHONUNBUFFERED": "1",
+            }, log)
+        esperar_api(url, proceso)
+        cargas = preparar_cargas(url, parcelas_ligero, parcelas_pesado if pesados else 0)
+
+        if proceso is not None and os.path.isdir("/proc"):
+            muestreador = MuestreadorRSS(proceso.pid)
+            muestreador.start()
+        resultados, duracion = asyncio.run(generar_carga(
+            url, cargas, parse_mezcla(mezcla), duracion_s, concurrencia, tasa, pesados, semilla,
+        ))
+        memoria = muestreador.parar() if muestreador else {}
+    finally:
+        if proceso is not None:
+            os.killpg(proceso.pid, signal.SIGTERM)
+            try:
+                proceso.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(proceso.pid, signal.SIGKILL)
+        if stub is not None:
+            stub.shutdown()
+        log.close()
+
+    return {
+        "configuracion": {
+            "servidor": servidor if proceso is not None else "externo", "workers": workers, "url": url,
+            "duracion_s": duracion_s, "concurrencia": concurrencia, "tasa": tasa, "mezcla": mezcla,
+            "pesados": pesados, "parcelas_pesado": parcelas_pesado if pesados else 0,
+            "latencia_upstream": latencia_upstream, "tasa_error_upstream": tasa_error_upstream,
+        },
+        "duracion_real_s": round(duracion, 2),
+        "operaciones": resumir(resultados, duracion),
+        "memoria": memoria,
+        "log_servidor": log.name,
+    }
+
+
+def imprimir(informe: Dict[str, Any]) -> None:
+    print(f"{'operación':16s} {'peticiones':>10s} {'rps':>8s} {'error %':>8s} "
+          f"{'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    for nombre, r in informe["operaciones"].items():
+        print(f"{nombre:16s} {r['peticiones']:>10d} {r['rps']:>8.1f} {r['tasa_error'] * 100:>8.2f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    for proceso, m in informe["memoria"].items():
+        print(f"{proceso:16s} RSS máx {m['rss_max_mb']:.1f} MB, final {m['rss_final_mb']:.1f} MB")
+    print(f"Log del servidor: {informe['log_servidor']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga HTTP de la API catastral")
+    parser.add_argument("--servidor", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duracion-s", type=float, default=30.0)
+    parser.add_argument("--concurrencia", type=int, default=16, help="Usuarios simultáneos (máximo en vuelo con --tasa)")
+    parser.add_argument("--tasa", type=float, default=0.0, help="Peticiones/s en bucle abierto (0 = bucle cerrado)")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="Pesos por operación: analyze, generate, catastro, ibi")
+    parser.add_argument("--pesados", type=int, default=0, help="Subidas grandes de /analyze en paralelo durante toda la prueba")
+    parser.add_argument("--parcelas-ligero", type=int, default=20)
+    parser.add_argument("--parcelas-pesado", type=int, default=1000)
+    parser.add_argument("--latencia-upstream", default="lognormal:80:0.5", help="Latencia del stub OVC")
+    parser.add_argument("--tasa-error-upstream", type=float, default=0.0)
+    parser.add_argument("--url", default="", help="Usar un servidor ya arrancado (no se mide su memoria)")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default="", help="Ruta del JSON del informe")
+    args = parser.parse_args(argv)
+    if args.pesados > 0 and args.parcelas_pesado <= 0:
+        parser.error("--pesados necesita --parcelas-pesado mayor que 0")
+
+    informe = ejecutar(
+        servidor=args.servidor, workers=args.workers, duracion_s=args.duracion_s, concurrencia=args.concurrencia,
+        tasa=args.tasa, mezcla=args.mezcla, pesados=args.pesados, parcelas_ligero=args.parcelas_ligero,
+        parcelas_pesado=args.parcelas_pesado, latencia_upstream=args.latencia_upstream,
+        tasa_error_upstream=args.tasa_error_upstream, url=args.url, semilla=args.semilla,
+    )
+    imprimir(informe)
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Suite de benchmarks del motor (core) sobre tejido catastral sintético
+
+    python -m benchmarks.suite --tamanos 1000,10000 --salida benchmarks/resultados/baseline.json
+    python -m benchmarks.suite --tamanos 1000 --comparar benchmarks/resultados/baseline.json
+
+Cada benchmark se ejecuta en un proceso hijo (fork) para aislar la memoria pico
+y poder cortarlo por tiempo. Los algoritmos cuadráticos se omiten en tamaños
+donde la extrapolación desde el tamaño anterior supera el tiempo máximo.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.parcel_model import ParcelaInfo
+from core.dxf_reader import DXFReader
+from core.shp_reader import SHPReader
+from core.vector_reader import VectorReader
+from core.kml_reader import KMLReader
+from core.gml_reader import GMLReader
+from core.conflict_detector import ConflictDetector
+from core.coordinate_transformer import CoordinateTransformer
+from core.gml_generator import GMLGenerator
+from core.building_generator import BuildingGenerator
+from core.dxf_generator import DXFGenerator
+from core.shape_generator import ShapeGenerator
+from core.kml_generator import generate_kml_from_gml_features
+from core.tax_calculator import TaxCalculator
+from core.batch_tax_calculator import BatchTaxCalculator
+from benchmarks.tejido_sintetico import ParcelaSintetica, generar_tejido, escribir_todos
+
+VERSION_FORMATO = 1
+
+
+@dataclass
+class Contexto:
+    """Datos compartidos por los benchmarks de un tamaño (los hijos los heredan por fork)"""
+    tejido: List[ParcelaSintetica]
+    rutas: Dict[str, str]
+    directorio: str
+    epsg: str = "25830"
+
+    @property
+    def num_vertices(self) -> int:
+        return sum(p.num_vertices for p in self.tejido)
+
+
+@dataclass
+class Benchmark:
+    nombre: str
+    # preparar(ctx) -> datos (fuera del tiempo medido); ejecutar(ctx, datos) -> nº de entidades procesadas
+    ejecutar: Callable[[Contexto, Any], int]
+    preparar: Optional[Callable[[Contexto], Any]] = None
+    complejidad: int = 1                # exponente para extrapolar el tiempo al siguiente tamaño
+    max_parcelas: Optional[int] = None  # tope para los que escriben un archivo por parcela
+
+
+# ===== ENTRADAS EN MEMORIA =====
+
+def parcelas_como_dxf(ctx: Contexto) -> List[ParcelaInfo]:
+    """Lo que devuelve DXFReader: exteriores y huecos como entidades sueltas"""
+    parcelas = []
+    for p in ctx.tejido:
+        for anillo in [p.exterior] + p.huecos:
+            parcela = ParcelaInfo()
+            parcela.referencia_catastral = p.rc if anillo is p.exterior else None
+            parcela.nombre_archivo = p.rc
+            parcela.coordenadas = list(anillo)
+            parcela.area = DXFReader.calcular_area(anillo)
+            parcela.punto_referencia = DXFReader.calcular_centroide(anillo)
+            parcela.capa_origen = "PG-LP"
+            parcelas.append(parcela)
+    return parcelas
+
+
+def parcelas_agrupadas(ctx: Contexto) -> List[ParcelaInfo]:
+    """Parcelas tras agrupar huecos (entrada de detectar_conflictos y de los generadores)"""
+    parcelas = []
+    for p in ctx.tejido:
+        parcela = ParcelaInfo()
+        parcela.referencia_catastral = p.rc
+        parcela.nombre_archivo = p.rc
+        parcela.coordenadas = list(p.exterior)
+        parcela.interiores = [list(h) for h in p.huecos]
+        parcela.area = DXFReader.calcular_area(p.exterior)
+        parcela.punto_referencia = DXFReader.calcular_centroide(p.exterior)
+        parcelas.append(parcela)
+    return parcelas
+
+
+def features(ctx: Contexto) -> List[Dict[str, Any]]:
+    """Formato GmlFeature que reciben los endpoints /generate-*"""
+    return [{
+        "id": p.rc,
+        "geometry": [[list(c) for c in anillo] for anillo in [p.exterior] + p.huecos],
+        "area": DXFReader.calcular_area(p.exterior),
+        "cadastralReference": p.rc,
+        "hasConflict": p.solapada,
+        "isHole": False,
+    } for p in ctx.tejido]
+
+
+def inmuebles(ctx: Contexto) -> List[Dict[str, Any]]:
+    """Un inmueble urbano por parcela (mismo body que /catastro/calcular-ibi)"""
+    return [{
+        "municipio": "Andújar",
+        "clase": "urbano",
+        "sup_parcela": round(DXFReader.calcular_area(p.exterior), 2),
+        "valor_rep": 120.0 + i % 50,
+        "sup_const": 90 + i % 200,
+        "uso_const": ("vivienda", "comercial", "industrial")[i % 3],
+        "categoria": 1 + i % 9,
+        "anio_const": 1950 + i % 70,
+        "estado": "normal",
+    } for i, p in enumerate(ctx.tejido)]
+
+
+def _directorio_salida(ctx: Contexto) -> str:
+    return tempfile.mkdtemp(dir=ctx.directorio)
+
+
+def _anillos_latlon(ctx: Contexto) -> List[List[Tuple[float, float]]]:
+    return [CoordinateTransformer.utm_to_latlon(anillo, ctx.epsg) for p in ctx.tejido for anillo in [p.exterior] + p.huecos]
+
+
+def _ventana(ctx: Contexto, fraccion: float = 0.01) -> Tuple[float, float, float, float]:
+    """Cuadrado centrado con 'fraccion' del área del tejido (un barrio de la provincia)"""
+    xy = np.array([c for p in ctx.tejido for c in p.exterior])
+    (xmin, ymin), (xmax, ymax) = xy.min(axis=0), xy.max(axis=0)
+    cx, cy, lado = (xmin + xmax) / 2, (ymin + ymax) / 2, np.sqrt(fraccion * (xmax - xmin) * (ymax - ymin))
+    return cx - lado / 2, cy - lado / 2, cx + lado / 2, cy + lado / 2
+
+
+def _generar_gml(ctx: Contexto, datos) -> int:
+    parcelas, destino = datos
+    for parcela in parcelas:
+        GMLGenerator.generar_gml(parcela, destino, usar_epsg_urn=True, epsg_code=ctx.epsg)
+    return len(parcelas)
+
+
+def _generar_edificios(ctx: Contexto, datos) -> int:
+    parcelas, destino = datos
+    for parcela in parcelas:
+        BuildingGenerator.generar_gml_edificio(parcela, destino, ctx.epsg)
+    return len(parcelas)
+
+
+def _exportar_dxf(ctx: Contexto, f) -> int:
+    DXFGenerator.exportar_a_dxf(f, os.path.join(_directorio_salida(ctx), "s.dxf"), ctx.epsg)
+    return len(f)
+
+
+def _exportar_shape(ctx: Contexto, f) -> int:
+    ShapeGenerator.exportar_a_shape(f, os.path.join(_directorio_salida(ctx), "s"), ctx.epsg)
+    return len(f)
+
+
+def _exportar_kml(ctx: Contexto, f) -> int:
+    generate_kml_from_gml_features(f, os.path.join(_directorio_salida(ctx), "s.kml"), ctx.epsg)
+    return len(f)
+
+
+BENCHMARKS: List[Benchmark] = [
+    # Lectores
+    Benchmark("DXFReader.obtener_capas_con_detalle",
+              lambda ctx, _: len(DXFReader.obtener_capas_con_detalle(ctx.rutas["dxf"]))),
+    Benchmark("DXFReader.leer_borde_parcelas",
+              lambda ctx, _: len(DXFReader.leer_borde_parcelas(ctx.rutas["dxf"], ["PG-LP"], "PG-LT")),
+              complejidad=2),
+    Benchmark("SHPReader.leer_desde_zip", lambda ctx, _: len(SHPReader.leer_desde_zip(ctx.rutas["shp"]))),
+    Benchmark("KMLReader.leer_kml", lambda ctx, _: len(KMLReader.leer_desde_kmz(ctx.rutas["kml"], ctx.epsg))),
+    Benchmark("KMLReader.leer_desde_kmz", lambda ctx, _: len(KMLReader.leer_desde_kmz(ctx.rutas["kmz"], ctx.epsg))),
+    Benchmark("GMLReader.leer_gml", lambda ctx, _: len(GMLReader.leer_gml(ctx.rutas["gml"], ctx.epsg))),
+    Benchmark("VectorReader.leer (fgb)", lambda ctx, _: len(VectorReader.leer(ctx.rutas["fgb"], ctx.epsg))),
+    Benchmark("VectorReader.leer (fgb, bbox 1 %)",
+              lambda ctx, ventana: len(VectorReader.leer(ctx.rutas["fgb"], ctx.epsg, ventana)), preparar=_ventana),
+    Benchmark("VectorReader.leer (geojsonseq)",
+              lambda ctx, _: len(VectorReader.leer(ctx.rutas["geojsonseq"], ctx.epsg))),
+    # Motor
+    Benchmark("DXFReader.limpiar_topologia", lambda ctx, p: len(DXFReader.limpiar_topologia(p)),
+              preparar=parcelas_como_dxf),
+    Benchmark("DXFReader.detect_nesting", lambda ctx, p: len(DXFReader.detect_nesting(p)),
+              preparar=parcelas_como_dxf, complejidad=2),
+    Benchmark("ConflictDetector.detectar_conflictos", lambda ctx, p: len(ConflictDetector.detectar_conflictos(p)),
+              preparar=parcelas_agrupadas, complejidad=2),
+    Benchmark("CoordinateTransformer.utm_to_latlon",
+              lambda ctx, _: len(_anillos_latlon(ctx))),
+    Benchmark("CoordinateTransformer.latlon_to_utm",
+              lambda ctx, anillos: len([CoordinateTransformer.latlon_to_utm(a, ctx.epsg) for a in anillos]),
+              preparar=_anillos_latlon),
+    # Generadores
+    Benchmark("GMLGenerator.generar_gml", _generar_gml,
+              preparar=lambda ctx: (parcelas_agrupadas(ctx), _directorio_salida(ctx)), max_parcelas=2000),
+    Benchmark("BuildingGenerator.generar_gml_edificio", _generar_edificios,
+              preparar=lambda ctx: (parcelas_agrupadas(ctx), _directorio_salida(ctx)), max_parcelas=2000),
+    Benchmark("DXFGenerator.exportar_a_dxf", _exportar_dxf, preparar=features),
+    Benchmark("ShapeGenerator.exportar_a_shape", _exportar_shape, preparar=features),
+    Benchmark("generate_kml_from_gml_features", _exportar_kml, preparar=features),
+    # Valoración
+    Benchmark("TaxCalculator.calculate",
+              lambda ctx, inm: len([TaxCalculator.calculate(i) for i in inm]), preparar=inmuebles),
+    Benchmark("BatchTaxCalculator.calculate_records",
+              lambda ctx, inm: len(BatchTaxCalculator.calculate_records(inm)), preparar=inmuebles),
+]
+
+
+# ===== MEDICIÓN =====
+
+def _memoria_kb(campo: str) -> Optional[int]:
+    """VmRSS / VmHWM del proceso actual (Linux)"""
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reiniciar_pico() -> bool:
+    """Pone VmHWM = VmRSS (Linux >= 4.0) para medir solo el pico de la ejecución"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _hijo(bench: Benchmark, ctx: Contexto, conexion) -> None:
+    # Los módulos del core imprimen mucho DEBUG: se descarta la salida del hijo
+    nulo = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(nulo, 1)
+    try:
+        if bench.max_parcelas:
+            ctx = replace(ctx, tejido=ctx.tejido[:bench.max_parcelas])
+        datos = bench.preparar(ctx) if bench.preparar else None
+        pico_exacto = _reiniciar_pico()
+        rss_inicio = _memoria_kb("VmRSS") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        inicio = time.perf_counter()
+        entidades = bench.ejecutar(ctx, datos)
+        segundos = time.perf_counter() - inicio
+        pico = _memoria_kb("VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conexion.send({
+            "estado": "ok",
+            "segundos": segundos,
+            "entidades": int(entidades or 0),
+            "pico_mb": round(max(pico - rss_inicio, 0) / 1024, 1),
+            "pico_exacto": pico_exacto,
+        })
+    except BaseException as e:
+        conexion.send({"estado": "error", "detalle": f"{type(e).__name__}: {e}"})
+    finally:
+        conexion.close()
+
+
+def medir(bench: Benchmark, ctx: Contexto, timeout_s: float) -> Dict[str, Any]:
+    """Ejecuta un benchmark en un proceso hijo y devuelve su medición"""
+    mp = multiprocessing.get_context("fork")
+    receptor, emisor = mp.Pipe(duplex=False)
+    proceso = mp.Process(target=_hijo, args=(bench, ctx, emisor))
+    proceso.start()
+    emisor.close()
+    if receptor.poll(timeout_s):
+        try:
+            resultado = receptor.recv()
+        except EOFError:
+            resultado = {"estado": "error", "detalle": f"proceso terminado (código {proceso.exitcode})"}
+    else:
+        proceso.kill()
+        resultado = {"estado": "timeout", "detalle": f"más de {timeout_s:.0f} s"}
+    proceso.join()
+    return resultado
+
+
+def ejecutar_suite(tamanos: List[int], semilla: int = 42, timeout_s: float = 600.0, repeticiones: int = 1,
+                   filtro: str = "", directorio: Optional[str] = None,
+                   informar: Callable[[str], None] = print) -> Dict[str, Any]:
+    """Ejecuta todos los benchmarks para cada tamaño y devuelve el documento de baseline"""
+    resultados: List[Dict[str, Any]] = []
+    anteriores: Dict[str, Tuple[int, float]] = {}  # nombre -> (parcelas, segundos) del último tamaño medido
+    base_dir = directorio or tempfile.mkdtemp(prefix="catastro-bench-")
+    try:
+        for n in sorted(tamanos):
+            inicio = time.perf_counter()
+            tejido = generar_tejido(n, semilla=semilla)
+            dir_tamano = os.path.join(base_dir, str(n))
+            ctx = Contexto(tejido=tejido, rutas=escribir_todos(tejido, dir_tamano), directorio=dir_tamano)
+            informar(f"== {n} parcelas ({ctx.num_vertices} vértices), datos en {time.perf_counter() - inicio:.1f} s")
+
+            for bench in BENCHMARKS:
+                if filtro and filtro.lower() not in bench.nombre.lower():
+                    continue
+                parcelas = min(n, bench.max_parcelas or n)
+                fila = {"benchmark": bench.nombre, "parcelas": parcelas, "tejido": n}
+
+                previo = anteriores.get(bench.nombre)
+                if previo:
+                    estimado = previo[1] * (parcelas / previo[0]) ** bench.complejidad
+                    if estimado > timeout_s:
+                        fila.update(estado="omitido", detalle=f"estimado {estimado:.0f} s > {timeout_s:.0f} s")
+                        resultados.append(fila)
+                        informar(f"   {bench.nombre:42s} omitido (estimado {estimado:.0f} s)")
+                        continue
+
+                mediciones = [medir(bench, ctx, timeout_s) for _ in range(repeticiones)]
+                correctas = [m for m in mediciones if m["estado"] == "ok"]
+                if correctas:
+                    mejor = min(correctas, key=lambda m: m["segundos"])
+                    vertices = ctx.num_vertices * parcelas / n
+                    fila.update(
+                        estado="ok",
+                        segundos=round(mejor["segundos"], 4),
+                        entidades=mejor["entidades"],
+                        parcelas_s=round(parcelas / mejor["segundos"], 1) if mejor["segundos"] else None,
+                        vertices_s=round(vertices / mejor["segundos"], 1) if mejor["segundos"] else None,
+                        pico_mb=max(m["pico_mb"] for m in correctas),
+                    )
+                    anteriores[bench.nombre] = (parcelas, mejor["segundos"])
+                    informar(f"   {bench.nombre:42s} {mejor['segundos']:9.3f} s  "
+                             f"{fila['parcelas_s'] or 0:>10.0f} parc/s  {fila['pico_mb']:>7.1f} MB")
+                else:
+                    fila.update(estado=mediciones[0]["estado"], detalle=mediciones[0].get("detalle", ""))
+                    if fila["estado"] == "timeout":
+                        anteriores[bench.nombre] = (parcelas, timeout_s)
+                    informar(f"   {bench.nombre:42s} {fila['estado']}: {fila['detalle']}")
+                resultados.append(fila)
+    finally:
+        if directorio is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    return {
+        "version": VERSION_FORMATO,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "semilla": semilla,
+        "tamanos": sorted(tamanos),
+        "timeout_s": timeout_s,
+        "resultados": resultados,
+    }
+
+
+def comparar(actual: Dict[str, Any], baseline: Dict[str, Any], umbral: float = 1.2) -> List[Dict[str, Any]]:
+    """
+    Cociente de tiempos actual/baseline por (benchmark, tamaño).
+    'regresion' es True si el cociente supera 'umbral'.
+    """
+    previos = {(r["benchmark"], r["tejido"]): r for r in baseline.get("resultados", []) if r.get("estado") == "ok"}
+    filas = []
+    for r in actual["resultados"]:
+        previo = previos.get((r["benchmark"], r["tejido"]))
+        if r.get("estado") != "ok" or previo is None or not previo["segundos"]:
+            continue
+        cociente = r["segundos"] / previo["segundos"]
+        filas.append({
+            "benchmark": r["benchmark"], "tejido": r["tejido"],
+            "antes_s": previo["segundos"], "ahora_s": r["segundos"],
+            "cociente": round(cociente, 3), "regresion": cociente > umbral,
+        })
+    return filas
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del motor catastral con tejido sintético")
+    parser.add_argument("--tamanos", default="1000,10000,100000", help="Parcelas por tejido, separadas por comas")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--timeout-s", type=float, default=600.0, help="Tiempo máximo por benchmark")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se guarda la mejor de N ejecuciones")
+    parser.add_argument("--solo", default="", help="Ejecutar solo los benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--salida", default="", help="Ruta del JSON de resultados")
+    parser.add_argument("--comparar", default="", help="JSON de baseline con el que comparar")
+    parser.add_argument("--umbral", type=float, default=1.2, help="Cociente de tiempo que se considera regresión")
+    parser.add_argument("--conservar-datos", default="", help="Directorio donde dejar los archivos sintéticos")
+    args = parser.parse_args(argv)
+
+    documento = ejecutar_suite(
+        [int(t) for t in args.tamanos.split(",") if t.strip()],
+        semilla=args.semilla, timeout_s=args.timeout_s, repeticiones=args.repeticiones,
+        filtro=args.solo, directorio=args.conservar_datos or None,
+    )
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(documento, f, ensure_ascii=False, indent=1)
+        print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            filas = comparar(documento, json.load(f), args.umbral)
+        for fila in filas:
+            marca = "REGRESIÓN" if fila["regresion"] else ""
+            print(f"{fila['benchmark']:42s} {fila['tejido']:>7d}  {fila['antes_s']:9.3f} s -> "
+                  f"{fila['ahora_s']:9.3f} s  x{fila['cociente']:<6} {marca}")
+        if any(f["regresion"] for f in filas):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
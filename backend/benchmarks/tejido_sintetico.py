@@ -0,0 +1,250 @@
+"""
+Generador de tejido catastral sintético para benchmarks
+Parcelas tipo Voronoi (bordes compartidos con vértices idénticos), con huecos,
+etiquetas de referencia catastral y solapes deliberados, y escritura en los
+formatos de entrada del backend: DXF, SHP (ZIP), KML, KMZ y GML INSPIRE.
+"""
+
+import io
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import MultiPoint, Polygon, box
+
+Coordenadas = List[Tuple[float, float]]
+
+# Origen por defecto: Andújar (ETRS89 / UTM 30N)
+ORIGEN_UTM = (405000.0, 4210000.0)
+
+
+@dataclass
+class ParcelaSintetica:
+    rc: str
+    exterior: Coordenadas                       # anillo cerrado (primer punto == último)
+    huecos: List[Coordenadas] = field(default_factory=list)
+    etiqueta: Tuple[float, float] = (0.0, 0.0)  # dentro de la parcela y fuera de sus huecos
+    solapada: bool = False
+
+    @property
+    def num_vertices(self) -> int:
+        return len(self.exterior) + sum(len(h) for h in self.huecos)
+
+
+def referencia_sintetica(i: int) -> str:
+    """RC de 14 caracteres con el formato real (7 dígitos, 2 letras, 4 dígitos, 1 letra)"""
+    return f"{i + 1:07d}VH{i % 10000:04d}S"
+
+
+def generar_tejido(num_parcelas: int, semilla: int = 42, area_media_m2: float = 2500.0,
+                   tam_segmento_m: float = 8.0, frac_huecos: float = 0.1, frac_solapes: float = 0.02,
+                   origen: Tuple[float, float] = ORIGEN_UTM) -> List[ParcelaSintetica]:
+    """
+    Tejido de 'num_parcelas' celdas de Voronoi recortadas a un cuadrado.
+    Los bordes se densifican cada 'tam_segmento_m' y se redondean al milímetro,
+    así que dos parcelas vecinas comparten exactamente los vértices del lindero.
+    Una fracción de parcelas lleva un hueco (patio) y otra se amplía un 8 % para
+    solapar con sus vecinas. Determinista para una misma semilla.
+    """
+    rng = np.random.default_rng(semilla)
+    lado = float(np.sqrt(num_parcelas * area_media_m2))
+    x0, y0 = origen
+    puntos = rng.random((num_parcelas, 2)) * lado + (x0, y0)
+    marco = box(x0, y0, x0 + lado, y0 + lado)
+
+    celdas = shapely.get_parts(shapely.voronoi_polygons(MultiPoint(puntos), extend_to=marco))
+    celdas = shapely.intersection(celdas, marco)
+    celdas = celdas[(shapely.get_type_id(celdas) == 3) & ~shapely.is_empty(celdas)]
+    celdas = shapely.segmentize(celdas, tam_segmento_m)
+    centros = shapely.get_coordinates(shapely.centroid(celdas))
+    # Orden estable (de abajo arriba, de izquierda a derecha), independiente de GEOS
+    orden = np.lexsort((centros[:, 0], np.round(centros[:, 1] / np.sqrt(area_media_m2))))
+    celdas, centros = celdas[orden], centros[orden]
+
+    # Todos los vértices de una vez; redondeo al milímetro para que los linderos coincidan
+    coords, indices = shapely.get_coordinates(shapely.get_exterior_ring(celdas), return_index=True)
+    cortes = np.flatnonzero(np.diff(indices)) + 1
+    centro_vertice = centros[indices]
+    con_hueco = rng.random(len(celdas)) < frac_huecos
+    con_solape = rng.random(len(celdas)) < frac_solapes
+
+    factor = np.where(con_solape[indices], 1.08, 1.0)[:, None]
+    exteriores = np.split(np.round((coords - centro_vertice) * factor + centro_vertice, 3), cortes)
+    # Celda convexa: reducida al 30 % sobre su centroide queda dentro (orientación inversa)
+    huecos = np.split(np.round((coords - centro_vertice) * 0.3 + centro_vertice, 3), cortes)
+
+    tejido = []
+    for i, (exterior, hueco) in enumerate(zip(exteriores, huecos)):
+        cx, cy = centros[i]
+        # Etiqueta entre el centroide y el primer vértice, fuera del hueco
+        vx, vy = exterior[0]
+        tejido.append(ParcelaSintetica(
+            rc=referencia_sintetica(i),
+            exterior=list(map(tuple, exterior.tolist())),
+            huecos=[list(map(tuple, hueco[::-1].tolist()))] if con_hueco[i] else [],
+            etiqueta=(round(cx + 0.65 * (vx - cx), 3), round(cy + 0.65 * (vy - cy), 3)),
+            solapada=bool(con_solape[i]),
+        ))
+    return tejido
+
+
+# ===== ESCRITORES =====
+
+def escribir_dxf(tejido: List[ParcelaSintetica], ruta: str) -> str:
+    """
+    DXF con la convención del Catastro: linderos en PG-LP (los huecos como polilíneas
+    cerradas independientes, que el lector detecta por anidamiento) y RC en PG-LT.
+    """
+    import ezdxf
+    doc = ezdxf.new("R2010")
+    doc.layers.add(name="PG-LP", color=3)
+    doc.layers.add(name="PG-LT", color=7)
+    msp = doc.modelspace()
+    for p in tejido:
+        msp.add_lwpolyline(p.exterior[:-1], close=True, dxfattribs={"layer": "PG-LP"})
+        for hueco in p.huecos:
+            msp.add_lwpolyline(hueco[:-1], close=True, dxfattribs={"layer": "PG-LP"})
+        msp.add_text(p.rc, dxfattribs={"layer": "PG-LT", "height": 1.0, "insert": p.etiqueta})
+    doc.saveas(ruta)
+    return ruta
+
+
+def escribir_shp_zip(tejido: List[ParcelaSintetica], ruta_zip: str, epsg: str = "25830") -> str:
+    """Shapefile de polígonos (anillo exterior horario, huecos antihorarios) con REFCAT, en un ZIP"""
+    import shapefile
+    from core.shape_generator import PRJ_DEFINITIONS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "parcelas")
+        w = shapefile.Writer(base, shapeType=shapefile.POLYGON)
+        w.field("REFCAT", "C", 20)
+        w.field("AREA", "N", 18, 2)
+        for p in tejido:
+            exterior = p.exterior if not _es_antihorario(p.exterior) else p.exterior[::-1]
+            huecos = [h if _es_antihorario(h) else h[::-1] for h in p.huecos]
+            w.poly([exterior] + huecos)
+            w.record(p.rc, round(Polygon(p.exterior, p.huecos).area, 2))
+        w.close()
+        with open(base + ".prj", "w") as f:
+            f.write(PRJ_DEFINITIONS.get(str(epsg), PRJ_DEFINITIONS["25830"]))
+        with zipfile.ZipFile(ruta_zip, "w", zipfile.ZIP_DEFLATED) as z:
+            for ext in (".shp", ".shx", ".dbf", ".prj"):
+                z.write(base + ext, "parcelas" + ext)
+    return ruta_zip
+
+
+def _es_antihorario(anillo: Coordenadas) -> bool:
+    a = np.asarray(anillo)
+    return float(np.sum(a[:-1, 0] * a[1:, 1] - a[1:, 0] * a[:-1, 1])) > 0
+
+
+def _kml(tejido: List[ParcelaSintetica], epsg: str) -> str:
+    from pyproj import Transformer
+    transformador = Transformer.from_crs(f"EPSG:{epsg}", "EPSG:4326", always_xy=True)
+
+    def anillo(coords: Coordenadas) -> str:
+        a = np.asarray(coords)
+        lon, lat = transformador.transform(a[:, 0], a[:, 1])
+        return " ".join(f"{x:.8f},{y:.8f},0" for x, y in zip(lon, lat))
+
+    partes = ['<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n']
+    for p in tejido:
+        partes.append(f"<Placemark><name>{p.rc}</name><Polygon><outerBoundaryIs><LinearRing><coordinates>"
+                      f"{anillo(p.exterior)}</coordinates></LinearRing></outerBoundaryIs>")
+        for hueco in p.huecos:
+            partes.append(f"<innerBoundaryIs><LinearRing><coordinates>{anillo(hueco)}"
+                          f"</coordinates></LinearRing></innerBoundaryIs>")
+        partes.append("</Polygon></Placemark>\n")
+    partes.append("</Document></kml>\n")
+    return "".join(partes)
+
+
+def escribir_kml(tejido: List[ParcelaSintetica], ruta: str, epsg: str = "25830") -> str:
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(_kml(tejido, epsg))
+    return ruta
+
+
+def escribir_kmz(tejido: List[ParcelaSintetica], ruta: str, epsg: str = "25830") -> str:
+    with zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("doc.kml", _kml(tejido, epsg))
+    return ruta
+
+
+def escribir_gml(tejido: List[ParcelaSintetica], ruta: str, epsg: str = "25830") -> str:
+    """GML INSPIRE CadastralParcels 4.0 (WFS 2.0 FeatureCollection), como las descargas del Catastro"""
+    srs = f"http://www.opengis.net/def/crs/EPSG/0/{epsg}"
+
+    def pos_list(coords: Coordenadas) -> str:
+        return " ".join(f"{x:.2f} {y:.2f}" for x, y in coords)
+
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<FeatureCollection xmlns="http://www.opengis.net/wfs/2.0" '
+            'xmlns:gml="http://www.opengis.net/gml/3.2" '
+            'xmlns:cp="http://inspire.ec.europa.eu/schemas/cp/4.0" '
+            'xmlns:base="http://inspire.ec.europa.eu/schemas/base/3.3" '
+            f'numberMatched="{len(tejido)}" numberReturned="{len(tejido)}">\n'
+        )
+        for p in tejido:
+            buf = io.StringIO()
+            buf.write(f'<member><cp:CadastralParcel gml:id="ES.SDGC.CP.{p.rc}">'
+                      f'<cp:areaValue uom="m2">{int(Polygon(p.exterior, p.huecos).area)}</cp:areaValue>'
+                      f'<cp:geometry><gml:MultiSurface gml:id="MultiSurface_{p.rc}" srsName="{srs}">'
+                      f'<gml:surfaceMember><gml:Surface gml:id="Surface_{p.rc}.1" srsName="{srs}"><gml:patches>'
+                      f'<gml:PolygonPatch><gml:exterior><gml:LinearRing>'
+                      f'<gml:posList srsDimension="2" count="{len(p.exterior)}">{pos_list(p.exterior)}</gml:posList>'
+                      f'</gml:LinearRing></gml:exterior>')
+            for hueco in p.huecos:
+                buf.write(f'<gml:interior><gml:LinearRing>'
+                          f'<gml:posList srsDimension="2" count="{len(hueco)}">{pos_list(hueco)}</gml:posList>'
+                          f'</gml:LinearRing></gml:interior>')
+            buf.write(f'</gml:PolygonPatch></gml:patches></gml:Surface></gml:surfaceMember></gml:MultiSurface>'
+                      f'</cp:geometry><cp:inspireId><base:Identifier><base:localId>{p.rc}</base:localId>'
+                      f'<base:namespace>ES.SDGC.CP</base:namespace></base:Identifier></cp:inspireId>'
+                      f'<cp:label>{p.rc[-5:]}</cp:label>'
+                      f'<cp:nationalCadastralReference>{p.rc}</cp:nationalCadastralReference>'
+                      f'</cp:CadastralParcel></member>\n')
+            f.write(buf.getvalue())
+        f.write("</FeatureCollection>\n")
+    return ruta
+
+
+def _geodataframe(tejido: List[ParcelaSintetica], epsg: str):
+    import geopandas as gpd
+    return gpd.GeoDataFrame(
+        {"refcat": [p.rc for p in tejido]},
+        geometry=[Polygon(p.exterior, p.huecos) for p in tejido], crs=f"EPSG:{epsg}",
+    )
+
+
+def escribir_fgb(tejido: List[ParcelaSintetica], ruta: str, epsg: str = "25830") -> str:
+    """FlatGeobuf con índice espacial (R-tree Hilbert empaquetado), en UTM"""
+    _geodataframe(tejido, epsg).to_file(ruta, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+    return ruta
+
+
+def escribir_geojsonseq(tejido: List[ParcelaSintetica], ruta: str, epsg: str = "25830") -> str:
+    """GeoJSON por líneas (RFC 8142) en WGS84, como exigen los GeoJSON estándar"""
+    _geodataframe(tejido, epsg).to_crs(4326).to_file(ruta, driver="GeoJSONSeq")
+    return ruta
+
+
+def escribir_todos(tejido: List[ParcelaSintetica], directorio: str, epsg: str = "25830") -> dict:
+    """Escribe el tejido en todos los formatos; devuelve {formato: ruta}"""
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.join(directorio, "tejido")
+    return {
+        "dxf": escribir_dxf(tejido, base + ".dxf"),
+        "shp": escribir_shp_zip(tejido, base + ".zip", epsg),
+        "kml": escribir_kml(tejido, base + ".kml", epsg),
+        "kmz": escribir_kmz(tejido, base + ".kmz", epsg),
+        "gml": escribir_gml(tejido, base + ".gml", epsg),
+        "fgb": escribir_fgb(tejido, base + ".fgb", epsg),
+        "geojsonseq": escribir_geojsonseq(tejido, base + ".geojsonseq", epsg),
+    }
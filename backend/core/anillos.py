@@ -0,0 +1,88 @@
+"""
+Operaciones vectorizadas sobre anillos de parcelas
+Proyección en bloque y área/centroide de todos los anillos de un archivo a la vez
+(lectores KML, GML y DXF).
+"""
+
+import numpy as np
+from shapely.geometry import Polygon
+from typing import List, Optional
+from core.parcel_model import ParcelaInfo
+from core.coordinate_transformer import CoordinateTransformer, limpiar_epsg
+
+
+def proyectar_y_medir(parcelas: List[ParcelaInfo], anillos: List[List[np.ndarray]],
+                      epsg_origen: Optional[str], epsg_destino: Optional[str] = None) -> None:
+    """
+    Asigna coordenadas, interiores, área y punto de referencia a cada parcela a partir de
+    sus anillos (exterior primero) en epsg_origen. Todos los anillos se proyectan en una
+    sola transformación (buffer plano con desplazamientos; sin proyección si epsg_origen
+    es None o igual al destino) y el área y el centroide se calculan a la vez para todas.
+    Mismo criterio que shapely: área = exterior - huecos; si algún anillo tiene menos
+    de 4 vértices (cerrado), área 0 y sin centroide.
+    """
+    if not parcelas:
+        return
+
+    planos = [a for anillos_parcela in anillos for a in anillos_parcela]
+    longitudes = np.array([len(a) for a in planos])
+    fin = np.cumsum(longitudes)
+    inicio = fin - longitudes
+    origen = np.concatenate(planos)
+
+    if epsg_origen and limpiar_epsg(epsg_origen) != limpiar_epsg(epsg_destino):
+        xy = CoordinateTransformer.transformar_array(origen, epsg_origen, epsg_destino)
+    else:
+        xy = origen
+
+    # Anillos abiertos se cierran implícitamente (como hace shapely)
+    abierto = np.any(origen[inicio] != origen[fin - 1], axis=1)
+    anillo_valido = longitudes + abierto >= 4
+
+    # Shoelace por anillo, relativo a su primer vértice para no perder precisión en UTM
+    x0 = np.repeat(xy[inicio, 0], longitudes)
+    y0 = np.repeat(xy[inicio, 1], longitudes)
+    dx, dy = xy[:, 0] - x0, xy[:, 1] - y0
+    sig = np.arange(len(xy)) + 1
+    sig[fin - 1] = inicio
+    cruz = dx * dy[sig] - dx[sig] * dy
+    area2 = np.add.reduceat(cruz, inicio)
+    area_anillo = np.abs(area2) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cx_anillo = np.add.reduceat((dx + dx[sig]) * cruz, inicio) / (3 * area2) + xy[inicio, 0]
+        cy_anillo = np.add.reduceat((dy + dy[sig]) * cruz, inicio) / (3 * area2) + xy[inicio, 1]
+
+    # Parcela = exterior - huecos (áreas y momentos con signo)
+    num_anillos = np.array([len(a) for a in anillos])
+    parcela_de = np.repeat(np.arange(len(parcelas)), num_anillos)
+    signo = np.full(len(planos), -1.0)
+    signo[np.cumsum(num_anillos) - num_anillos] = 1.0
+    peso = signo * area_anillo
+    area = np.bincount(parcela_de, peso)
+    with np.errstate(invalid='ignore'):
+        cx = np.bincount(parcela_de, np.where(peso != 0, peso * cx_anillo, 0.0)) / area
+        cy = np.bincount(parcela_de, np.where(peso != 0, peso * cy_anillo, 0.0)) / area
+    valida = np.bincount(parcela_de, ~anillo_valido, minlength=len(parcelas)) == 0
+
+    puntos = list(zip(xy[:, 0].tolist(), xy[:, 1].tolist()))
+    inicio, fin = inicio.tolist(), fin.tolist()
+    area, cx, cy, valida = area.tolist(), cx.tolist(), cy.tolist(), valida.tolist()
+
+    k = 0
+    for i, parcela in enumerate(parcelas):
+        n = len(anillos[i])
+        parcela.coordenadas = puntos[inicio[k]:fin[k]]
+        parcela.interiores = [puntos[inicio[j]:fin[j]] for j in range(k + 1, k + n)]
+        k += n
+
+        if not valida[i]:
+            print(f"Error calculando geometría: anillo con menos de 4 vértices en {parcela.nombre_archivo}")
+            parcela.area = 0.0
+        elif area[i] != 0:
+            parcela.area = area[i]
+            parcela.punto_referencia = (cx[i], cy[i])
+        else:
+            # Degenerada (área nula): shapely da el centroide de las líneas
+            shapely_poly = Polygon(parcela.coordenadas, parcela.interiores)
+            parcela.area = shapely_poly.area
+            parcela.punto_referencia = (shapely_poly.centroid.x, shapely_poly.centroid.y)
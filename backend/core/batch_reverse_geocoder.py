@@ -0,0 +1,172 @@
+"""
+Geocodificación inversa por lotes (punto -> referencia catastral)
+Los puntos cercanos se agrupan en celdas de rejilla y cada celda se
+consulta una sola vez a Consulta_RCCOOR; las consultas restantes se
+lanzan en paralelo y el resultado se emite por punto de entrada.
+"""
+
+import csv
+import io
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from pyproj.exceptions import CRSError
+
+from .coordinate_transformer import CoordinateTransformer
+from .upstream import en_paralelo
+from .zone_cache import celda_rejilla
+
+
+@dataclass
+class PuntoEntrada:
+    indice: int
+    lat: float
+    lon: float
+    id: Optional[str] = None
+
+
+# Nombres de columna aceptados en CSV (en minúsculas)
+_COLUMNAS_LAT = ("lat", "latitud", "latitude")
+_COLUMNAS_LON = ("lon", "lng", "longitud", "longitude")
+# x/y suelen venir en UTM en las exportaciones catastrales: solo con EPSG explícito
+_COLUMNAS_Y = ("y", "utm_y")
+_COLUMNAS_X = ("x", "utm_x")
+_COLUMNAS_ID = ("id", "nombre", "name", "punto")
+
+
+class BatchReverseGeocoder:
+    """Agrupa puntos por celda y resuelve cada celda una vez"""
+
+    @staticmethod
+    def agrupar(puntos: List[PuntoEntrada], tam_celda_m: float) -> "OrderedDict[tuple, List[PuntoEntrada]]":
+        """
+        Puntos por celda de rejilla, en orden de primera aparición.
+        Con tam_celda_m <= 0 solo se fusionan puntos idénticos.
+        """
+        grupos: "OrderedDict[tuple, List[PuntoEntrada]]" = OrderedDict()
+        for p in puntos:
+            clave = celda_rejilla(p.lat, p.lon, tam_celda_m) if tam_celda_m > 0 else (p.lat, p.lon)
+            grupos.setdefault(clave, []).append(p)
+        return grupos
+
+    @staticmethod
+    def resolver(puntos: List[PuntoEntrada], consultar: Callable[[float, float], Dict[str, Any]],
+                 tam_celda_m: float = 5.0, max_concurrencia: int = 8) -> Iterator[Dict[str, Any]]:
+        """
+        Emite un dict por punto de entrada (según terminan las consultas) y un
+        resumen final {"resumen": {...}}.
+        Cada celda se consulta con su primer punto (un punto real del levantamiento,
+        no el centro de la celda, que podría caer en un vial).
+        """
+        grupos = BatchReverseGeocoder.agrupar(puntos, tam_celda_m)
+        representantes = [(clave, grupo[0]) for clave, grupo in grupos.items()]
+        encontrados = 0
+
+        def consultar_celda(item):
+            _, p = item
+            return consultar(p.lat, p.lon)
+
+        for (clave, _), resultado, error in en_paralelo(consultar_celda, representantes, max_concurrencia):
+            if error is not None:
+                resultado = {"encontrado": False, "error": f"Error consultando el Catastro: {error}"}
+            for p in grupos[clave]:
+                if resultado.get("encontrado"):
+                    encontrados += 1
+                yield {"indice": p.indice, "id": p.id, "lat": p.lat, "lon": p.lon, **resultado}
+
+        yield {"resumen": {
+            "puntos": len(puntos),
+            "consultas": len(grupos),
+            "deduplicados": len(puntos) - len(grupos),
+            "encontrados": encontrados,
+            "tam_celda_m": tam_celda_m,
+        }}
+
+    @staticmethod
+    def leer_puntos(contenido: bytes, nombre_archivo: str, epsg: Optional[str] = None) -> List[PuntoEntrada]:
+        """
+        Lee puntos de un GeoJSON (Point / MultiPoint, EPSG:4326) o de un CSV con
+        columnas lat/lon (también latitud/longitud) y un id opcional.
+        Un CSV con columnas x/y solo se acepta indicando su 'epsg' (se reproyecta a WGS84).
+        """
+        nombre = nombre_archivo.lower()
+        if nombre.endswith((".geojson", ".json")):
+            return BatchReverseGeocoder._leer_geojson(json.loads(contenido.decode("utf-8-sig")))
+        if nombre.endswith(".csv"):
+            return BatchReverseGeocoder._leer_csv(contenido.decode("utf-8-sig", errors="replace"), epsg)
+        raise ValueError("Formato no soportado: use GeoJSON o CSV")
+
+    @staticmethod
+    def _leer_geojson(data: Dict[str, Any]) -> List[PuntoEntrada]:
+        if data.get("type") == "FeatureCollection":
+            features = data.get("features", [])
+        elif data.get("type") == "Feature":
+            features = [data]
+        else:
+            features = [{"type": "Feature", "geometry": data, "properties": {}}]
+
+        puntos = []
+        for n, f in enumerate(features):
+            geom = f.get("geometry") or {}
+            props = f.get("properties") or {}
+            ident = props.get("id", f.get("id", props.get("name")))
+            if geom.get("type") == "Point":
+                coords = [geom["coordinates"]]
+            elif geom.get("type") == "MultiPoint":
+                coords = geom["coordinates"]
+            else:
+                continue
+            for k, c in enumerate(coords):
+                sufijo = f"-{k}" if len(coords) > 1 else ""
+                puntos.append(PuntoEntrada(
+                    indice=len(puntos), lat=float(c[1]), lon=float(c[0]),
+                    id=f"{ident if ident is not None else n}{sufijo}",
+                ))
+        return puntos
+
+    @staticmethod
+    def _leer_csv(texto: str, epsg: Optional[str] = None) -> List[PuntoEntrada]:
+        cabecera = texto.split("\n", 1)[0]
+        sep = ";" if cabecera.count(";") > cabecera.count(",") else ","
+        lector = csv.DictReader(io.StringIO(texto), delimiter=sep)
+        columnas = {c.strip().lower(): c for c in (lector.fieldnames or [])}
+
+        col_lat = next((columnas[c] for c in _COLUMNAS_LAT if c in columnas), None)
+        col_lon = next((columnas[c] for c in _COLUMNAS_LON if c in columnas), None)
+        col_id = next((columnas[c] for c in _COLUMNAS_ID if c in columnas), None)
+        proyectadas = False
+        if not col_lat or not col_lon:
+            col_lat = next((columnas[c] for c in _COLUMNAS_Y if c in columnas), None)
+            col_lon = next((columnas[c] for c in _COLUMNAS_X if c in columnas), None)
+            if not col_lat or not col_lon:
+                raise ValueError("El CSV debe tener columnas lat y lon (o latitud/longitud)")
+            if not epsg:
+                raise ValueError("Las columnas x/y necesitan el parámetro epsg de sus coordenadas (p. ej. 25830)")
+            proyectadas = True
+
+        # El índice es el de la fila de datos, aunque se salten filas sin coordenadas
+        puntos = []
+        for n, fila in enumerate(lector):
+            try:
+                lat = float(fila[col_lat].replace(",", "."))
+                lon = float(fila[col_lon].replace(",", "."))
+            except (ValueError, AttributeError):
+                continue
+            puntos.append(PuntoEntrada(
+                indice=n, lat=lat, lon=lon,
+                id=fila[col_id] if col_id else None,
+            ))
+
+        if proyectadas and puntos:
+            # Una sola llamada a PROJ para todo el CSV; las columnas leídas como lat/lon son y/x
+            xy = np.array([(p.lon, p.lat) for p in puntos], dtype=float)
+            try:
+                lonlat = CoordinateTransformer.transformar_array(xy, epsg, "4326")
+            except CRSError:
+                raise ValueError(f"EPSG no válido: {epsg}")
+            for p, (lon, lat) in zip(puntos, lonlat.tolist()):
+                p.lat, p.lon = lat, lon
+        return puntos
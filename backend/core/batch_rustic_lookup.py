@@ -0,0 +1,116 @@
+"""
+Búsqueda masiva de parcelas rústicas por polígono
+Expande rangos de polígonos/parcelas ("1-300", "4,7,10-12"), resuelve cada
+parcela (Consulta_DNPPP + Consulta_CPMRC) en paralelo acotado, reutiliza
+resultados cacheados y emite los resultados según terminan.
+"""
+
+import os
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from .ttl_cache import TTLCache
+from .upstream import en_paralelo
+
+# Resultados por (provincia, municipio, polígono, parcela); se comparte con la búsqueda individual
+rustica_cache = TTLCache(
+    max_entradas=int(os.getenv("RUSTICA_CACHE_MAX", "20000")),
+    ttl_segundos=float(os.getenv("RUSTICA_CACHE_TTL_S", "86400")),
+)
+
+
+def expandir_rango(texto: str, maximo: int = 100000) -> List[str]:
+    """
+    "1-3,7, 10-11" -> ["1", "2", "3", "7", "10", "11"] (sin duplicados, en orden).
+    Lanza ValueError si el texto no es válido o supera 'maximo' elementos.
+    """
+    valores: List[str] = []
+    vistos = set()
+    for parte in str(texto).replace(";", ",").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if "-" in parte:
+            inicio, fin = (int(x) for x in parte.split("-", 1))
+            if fin < inicio:
+                raise ValueError(f"Rango inválido: {parte}")
+            numeros = range(inicio, fin + 1)
+        else:
+            numeros = [int(parte)]
+        for n in numeros:
+            if n < 0:
+                raise ValueError(f"Número inválido: {n}")
+            if n not in vistos:
+                vistos.add(n)
+                valores.append(str(n))
+            if len(valores) > maximo:
+                raise ValueError(f"Demasiadas parcelas (máximo {maximo})")
+    if not valores:
+        raise ValueError("Rango vacío")
+    return valores
+
+
+def clave_rustica(provincia: str, municipio: str, poligono: str, parcela: str) -> Tuple[str, str, str, str]:
+    """Clave de caché normalizada (mayúsculas, sin ceros a la izquierda en polígono/parcela)"""
+    return (
+        provincia.strip().upper(), municipio.strip().upper(),
+        poligono.strip().lstrip("0") or "0", parcela.strip().lstrip("0") or "0",
+    )
+
+
+def consultar_con_cache(consultar: Callable[[str, str, str, str], Dict[str, Any]],
+                        provincia: str, municipio: str, poligono: str, parcela: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Resultado de la parcela desde la caché o consultando al Catastro.
+    Solo se cachean respuestas del Catastro (encontrada o no); los fallos de red
+    (excepciones de 'consultar') se propagan y no se guardan.
+    Devuelve (resultado, desde_cache).
+    """
+    clave = clave_rustica(provincia, municipio, poligono, parcela)
+    resultado = rustica_cache.get(clave)
+    if resultado is not None:
+        return resultado, True
+    resultado = consultar(provincia, municipio, poligono, parcela)
+    rustica_cache.put(clave, resultado)
+    return resultado, False
+
+
+class BatchRusticLookup:
+    """Resolución concurrente de listas de parcelas rústicas"""
+
+    @staticmethod
+    def resolver(provincia: str, municipio: str, parcelas: List[Tuple[str, str]],
+                 consultar: Callable[[str, str, str, str], Dict[str, Any]],
+                 max_concurrencia: int = 8) -> Iterator[Dict[str, Any]]:
+        """
+        Emite un dict por (polígono, parcela) según se resuelven y un resumen final.
+        Los aciertos de caché se emiten primero, sin esperar a la red.
+        """
+        encontradas = errores = desde_cache = 0
+        pendientes = []
+        for poligono, parcela in parcelas:
+            cacheado = rustica_cache.get(clave_rustica(provincia, municipio, poligono, parcela))
+            if cacheado is None:
+                pendientes.append((poligono, parcela))
+                continue
+            desde_cache += 1
+            encontradas += bool(cacheado.get("encontrado"))
+            yield {"poligono": poligono, "parcela": parcela, "desde_cache": True, **cacheado}
+
+        def consultar_parcela(item):
+            resultado = consultar(provincia, municipio, *item)
+            rustica_cache.put(clave_rustica(provincia, municipio, *item), resultado)
+            return resultado
+
+        for (poligono, parcela), resultado, error in en_paralelo(consultar_parcela, pendientes, max_concurrencia):
+            if error is not None:
+                errores += 1
+                resultado = {"encontrado": False, "error": f"Error consultando el Catastro: {error}"}
+            encontradas += bool(resultado.get("encontrado"))
+            yield {"poligono": poligono, "parcela": parcela, "desde_cache": False, **resultado}
+
+        yield {"resumen": {
+            "parcelas": len(parcelas),
+            "encontradas": encontradas,
+            "desde_cache": desde_cache,
+            "errores": errores,
+        }}
@@ -0,0 +1,274 @@
+"""
+Valoración catastral masiva (padrón completo) vectorizada con NumPy
+Reproduce fila a fila el resultado de TaxCalculator.calculate
+"""
+
+import io
+import json
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .tax_calculator import (
+    MUNICIPIOS_COMPILADOS, MUNICIPIO_POR_DEFECTO, COEF_SUELO_OCUPADO_RUSTICO,
+    codigos_uso, codigos_estado, coef_tipologia_vec, coef_antiguedad_vec, coef_conservacion_vec,
+)
+
+# Columnas de salida (mismo orden y nombres que TaxCalculator.calculate)
+COLUMNAS_RESULTADO = [
+    "municipio", "provincia", "suelo_urbano", "suelo_rustico_no_ocupado",
+    "suelo_rustico_ocupado", "construccion", "valor_catastral_total",
+    "base_ibi", "tipo_aplicado", "cuota_ibi_anual",
+]
+
+
+def _round2(valores: np.ndarray) -> np.ndarray:
+    """
+    Redondeo a 2 decimales idéntico a round() de Python.
+    np.round escala por 100 y puede discrepar en los empates aparentes (x.xx5),
+    así que esos pocos casos se resuelven con round().
+    """
+    valores = np.asarray(valores, dtype=float)
+    resultado = np.round(valores, 2)
+    escalado = valores * 100.0
+    tolerancia = 1e-9 + np.abs(escalado) * 1e-15
+    dudosos = np.abs(escalado - np.floor(escalado) - 0.5) < tolerancia
+    if dudosos.any():
+        resultado[dudosos] = [round(v, 2) for v in valores[dudosos].tolist()]
+    return resultado
+
+
+def _factorizar(*columnas) -> tuple:
+    """
+    Códigos enteros + lista de combinaciones únicas de varias columnas.
+    Cada columna se factoriza por separado y los códigos se combinan en un único entero.
+    """
+    codigos_col, unicos_col = zip(*(pd.factorize(np.asarray(c)) for c in columnas))
+    dims = tuple(max(len(u), 1) for u in unicos_col)
+    combinado = np.ravel_multi_index(codigos_col, dims)
+    unicos, codigos = np.unique(combinado, return_inverse=True)
+    indices = np.unravel_index(unicos, dims)
+    combos = list(zip(*(np.asarray(u, dtype=object)[i].tolist() for u, i in zip(unicos_col, indices))))
+    return codigos.reshape(-1), combos
+
+
+class BatchTaxCalculator:
+    """Calculadora catastral por lotes (tabla columnar de inmuebles)"""
+
+    @staticmethod
+    def _num(df: pd.DataFrame, columna: str, defecto: float) -> np.ndarray:
+        """Columna numérica con el valor por defecto en huecos/ausencias"""
+        if columna not in df:
+            return np.full(len(df), float(defecto))
+        return pd.to_numeric(df[columna], errors="coerce").fillna(defecto).to_numpy(dtype=float)
+
+    @staticmethod
+    def _override(df: pd.DataFrame, columna: str) -> np.ndarray:
+        """Columna de override custom_*: NaN donde no se aplica (ausente, nulo o 0)"""
+        if columna not in df:
+            return np.full(len(df), np.nan)
+        valores = pd.to_numeric(df[columna], errors="coerce").to_numpy(dtype=float)
+        return np.where(valores == 0, np.nan, valores)
+
+    @staticmethod
+    def _texto(df: pd.DataFrame, columna: str, defecto: str) -> np.ndarray:
+        if columna not in df:
+            return np.full(len(df), defecto, dtype=object)
+        return df[columna].astype(object).where(df[columna].notna(), defecto).to_numpy(dtype=object)
+
+    @staticmethod
+    def _coeficientes_construccion(uso, categoria, anio_const, estado, anio_ponencia) -> tuple:
+        """
+        Coeficientes de tipología (C), antigüedad (H) y conservación (I)
+        leídos de las tablas densas en una sola operación por columna.
+        """
+        cod_uso = codigos_uso(uso)
+        coef_tipo = coef_tipologia_vec(cod_uso, categoria)
+        coef_h = coef_antiguedad_vec(anio_ponencia, anio_const, cod_uso, categoria)
+        coef_i = coef_conservacion_vec(codigos_estado(estado))
+        return coef_tipo, coef_h, coef_i
+
+    @staticmethod
+    def _explotar_construcciones(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convierte la columna 'construcciones' (lista de dicts o JSON en CSV)
+        en una tabla larga con el índice de la fila a la que pertenece cada construcción.
+        """
+        filas = []
+        for idx, valor in enumerate(df["construcciones"].tolist()):
+            if isinstance(valor, str) and valor.strip():
+                valor = json.loads(valor)
+            if isinstance(valor, np.ndarray):
+                valor = valor.tolist()
+            if not isinstance(valor, list):
+                continue
+            for c in valor:
+                filas.append((
+                    idx,
+                    c.get("uso", "vivienda"),
+                    int(c.get("categoria", 3)),
+                    int(c.get("anio_const", 2000)),
+                    c.get("estado", "normal"),
+                    float(c.get("sup_const", 0)),
+                ))
+        return pd.DataFrame(filas, columns=["fila", "uso", "categoria", "anio_const", "estado", "sup_const"])
+
+    @staticmethod
+    def calculate(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calcula valor de suelo, construcción, valor catastral y cuota IBI para cada fila.
+        Las columnas de entrada son los mismos parámetros que TaxCalculator.calculate.
+        Los nulos (celdas vacías en CSV) se tratan como parámetros ausentes.
+        """
+        df = df.reset_index(drop=True)
+        n = len(df)
+        if n == 0:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        # --- Datos del municipio (una búsqueda por municipio distinto) ---
+        municipio = BatchTaxCalculator._texto(df, "municipio", "Andújar")
+        cod_muni, munis = _factorizar(municipio)
+        datos = [MUNICIPIOS_COMPILADOS.get(m, MUNICIPIO_POR_DEFECTO) for (m,) in munis]
+
+        def por_muni(fn, dtype=float):
+            return np.array([fn(d) for d in datos], dtype=dtype)[cod_muni]
+
+        mbc = por_muni(lambda d: d.mbc)
+        mbr = por_muni(lambda d: d.mbr)
+        rm = por_muni(lambda d: d.rm)
+        gb = por_muni(lambda d: d.gb)
+        mbr_rustico = por_muni(lambda d: d.mbr_rustico)
+        anio_ponencia = por_muni(lambda d: d.anio_ponencia, dtype=np.int64)
+        coef_ibi_rustica = por_muni(lambda d: d.coef_ibi_rustica)
+        provincia = por_muni(lambda d: d.provincia, dtype=object)
+        tipo_urbano = por_muni(lambda d: d.tipo_ibi.get("urbano", 0.005))
+        tipo_rustico = por_muni(lambda d: d.tipo_ibi.get("rustico", 0.005))
+        tipo_bice = por_muni(lambda d: d.tipo_ibi.get("bice", 0.005))
+
+        # --- Overrides por fila (custom_*) ---
+        def aplicar_override(valores, columna):
+            override = BatchTaxCalculator._override(df, columna)
+            return np.where(np.isnan(override), valores, override)
+
+        mbc = aplicar_override(mbc, "custom_mbc")
+        mbr = aplicar_override(mbr, "custom_mbr")
+        rm = aplicar_override(rm, "custom_rm")
+        gb = aplicar_override(gb, "custom_gb")
+        tipo_urbano = aplicar_override(tipo_urbano, "custom_tipo_urbano")
+        tipo_rustico = aplicar_override(tipo_rustico, "custom_tipo_rustico")
+        anio_ponencia = aplicar_override(anio_ponencia, "custom_anio_ponencia").astype(np.int64)
+
+        clase = BatchTaxCalculator._texto(df, "clase", "urbano")
+        es_urbano = clase == "urbano"
+        es_rustico = clase == "rustico"
+
+        # 1. VALOR SUELO URBANO
+        sup_parcela = BatchTaxCalculator._num(df, "sup_parcela", 0)
+        valor_rep = BatchTaxCalculator._num(df, "valor_rep", 0)
+        uso_const = BatchTaxCalculator._texto(df, "uso_const", "vivienda")
+        if "zona_valor" in df:
+            zona = BatchTaxCalculator._texto(df, "zona_valor", "")
+            necesita_zona = es_urbano & (valor_rep == 0)
+            if necesita_zona.any():
+                idx = np.flatnonzero(necesita_zona)
+                cod_z, combos = _factorizar(cod_muni[idx], zona[idx], uso_const[idx])
+                tabla_z = np.array([
+                    datos[cm].zonas_valor[z].get(u, 0) if z in datos[cm].zonas_valor else 0.0
+                    for cm, z, u in combos
+                ], dtype=float)
+                valor_rep[idx] = tabla_z[cod_z]
+
+        edif_max = BatchTaxCalculator._num(df, "edif_max", 0)
+        edif_real = BatchTaxCalculator._num(df, "edif_real", 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(edif_max > 0, edif_real / np.where(edif_max > 0, edif_max, 1.0), 0.0)
+        coef_edif = np.select(
+            [edif_max <= 0, ratio < 0.50, ratio < 0.90, ratio <= 1.10],
+            [1.00, 0.80, 0.90, 1.00],
+            default=1.10,
+        )
+        suelo_urb = np.where(es_urbano, _round2(sup_parcela * valor_rep * coef_edif * rm * gb), 0.0)
+
+        # 2. VALOR SUELO RÚSTICO
+        ha = BatchTaxCalculator._num(df, "ha", 0)
+        tipo_eval = BatchTaxCalculator._num(df, "tipo_eval", 0)
+        suelo_rust_no = np.where(es_rustico, _round2(ha * tipo_eval), 0.0)
+
+        uso_suelo = BatchTaxCalculator._texto(df, "uso_suelo_rust", "residencial")
+        cod_us, usos_suelo = _factorizar(uso_suelo)
+        config = [COEF_SUELO_OCUPADO_RUSTICO.get(u, {"mbr_type": "rustico", "coef": 0.50}) for (u,) in usos_suelo]
+        coef_suelo = np.array([c["coef"] for c in config], dtype=float)[cod_us]
+        mbr_es_urbano = np.array([c["mbr_type"] == "urbano" for c in config], dtype=bool)[cod_us]
+        mbr_aplicar = aplicar_override(np.where(mbr_es_urbano, mbr, mbr_rustico), "custom_mbr_rustico")
+        sup_oc = BatchTaxCalculator._num(df, "sup_ocupada", 0)
+        suelo_rust_oc = np.where(es_rustico, _round2(sup_oc * (mbr_aplicar * coef_suelo) * rm * gb), 0.0)
+
+        # 3. VALOR CONSTRUCCIÓN
+        sup_const = BatchTaxCalculator._num(df, "sup_const", 0)
+        categoria = BatchTaxCalculator._num(df, "categoria", 3).astype(np.int64)
+        anio_const = BatchTaxCalculator._num(df, "anio_const", 2000).astype(np.int64)
+        estado = BatchTaxCalculator._texto(df, "estado", "normal")
+        coef_tipo, coef_h, coef_i = BatchTaxCalculator._coeficientes_construccion(
+            uso_const, categoria, anio_const, estado, anio_ponencia)
+        tiene_const = sup_const > 0
+        construccion = np.where(tiene_const, _round2(sup_const * mbc * coef_tipo * coef_h * coef_i * rm * gb), 0.0)
+
+        # Soporte de array de construcciones: sustituye a la construcción simple
+        if "construcciones" in df:
+            tiene_lista = np.array([isinstance(v, (list, np.ndarray)) or (isinstance(v, str) and v.strip().startswith("["))
+                                    for v in df["construcciones"].tolist()], dtype=bool) & tiene_const
+            if tiene_lista.any():
+                largas = BatchTaxCalculator._explotar_construcciones(df)
+                fila = largas["fila"].to_numpy(dtype=np.int64)
+                c_tipo, c_h, c_i = BatchTaxCalculator._coeficientes_construccion(
+                    largas["uso"].to_numpy(dtype=object), largas["categoria"].to_numpy(dtype=np.int64),
+                    largas["anio_const"].to_numpy(dtype=np.int64), largas["estado"].to_numpy(dtype=object),
+                    anio_ponencia[fila])
+                c_valor = _round2(largas["sup_const"].to_numpy(dtype=float) * mbc[fila] * c_tipo * c_h * c_i * rm[fila] * gb[fila])
+                # bincount acumula en orden de entrada: misma suma que el bucle escalar
+                suma = np.bincount(fila, weights=c_valor, minlength=n)
+                construccion = np.where(tiene_lista, suma, construccion)
+
+        # TOTAL CATASTRAL
+        total = _round2(suelo_urb + suelo_rust_no + suelo_rust_oc + construccion)
+
+        # IBI
+        base_ibi = np.where(es_rustico, _round2(total * coef_ibi_rustica), total)
+        tipo_ibi = np.select([es_urbano, es_rustico, clase == "bice"], [tipo_urbano, tipo_rustico, tipo_bice], default=0.005)
+        cuota = _round2(base_ibi * tipo_ibi)
+
+        return pd.DataFrame({
+            "municipio": municipio,
+            "provincia": provincia,
+            "suelo_urbano": suelo_urb,
+            "suelo_rustico_no_ocupado": suelo_rust_no,
+            "suelo_rustico_ocupado": suelo_rust_oc,
+            "construccion": construccion,
+            "valor_catastral_total": total,
+            "base_ibi": base_ibi,
+            "tipo_aplicado": tipo_ibi,
+            "cuota_ibi_anual": cuota,
+        }, columns=COLUMNAS_RESULTADO)
+
+    @staticmethod
+    def calculate_records(registros: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Atajo para listas de dicts (mismo formato que el body de /catastro/calcular-ibi)"""
+        return BatchTaxCalculator.calculate(pd.DataFrame.from_records(registros)).to_dict("records")
+
+    @staticmethod
+    def leer_tabla(contenido: bytes, nombre_archivo: str) -> pd.DataFrame:
+        """
+        Lee la tabla de inmuebles desde CSV (',' o ';'), Parquet o JSON (array de objetos).
+        """
+        nombre = nombre_archivo.lower()
+        if nombre.endswith(".parquet"):
+            return pd.read_parquet(io.BytesIO(contenido))
+        if nombre.endswith(".json"):
+            return pd.DataFrame.from_records(json.loads(contenido.decode("utf-8")))
+        if nombre.endswith(".csv"):
+            texto = contenido.decode("utf-8-sig", errors="replace")
+            cabecera = texto.split("\n", 1)[0]
+            sep = ";" if cabecera.count(";") > cabecera.count(",") else ","
+            return pd.read_csv(io.StringIO(texto), sep=sep)
+        raise ValueError("Formato no soportado: use CSV, Parquet o JSON")
@@ -0,0 +1,269 @@
+"""
+Parser de respuestas XML del Catastro (OVC)
+Una sola pasada (iterparse) sobre Consulta_DNPRC, Consulta_DNPPP,
+Consulta_CPMRC y Consulta_RCCOOR, ignorando namespaces y prefijos.
+Devuelve registros tipados; en referencias con varias unidades
+(lrcdnp) se devuelven TODAS, no solo la primera.
+"""
+
+import io
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+# Importaciones condicionales
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
+
+
+@dataclass
+class ErrorCatastro:
+    cod: int
+    des: str
+
+
+@dataclass
+class Construccion:
+    """Elemento de <lcons>: uso, superficie y localización interior"""
+    uso: str = ""
+    superficie: float = 0.0
+    escalera: str = ""
+    planta: str = ""
+    puerta: str = ""
+
+
+@dataclass
+class Cultivo:
+    """Subparcela rústica de <lspr>"""
+    codigo: str = ""
+    descripcion: str = ""
+    intensidad: str = ""
+    superficie: float = 0.0
+
+
+@dataclass
+class UnidadCatastral:
+    """Inmueble (bico en el detalle, rcdnp en la lista de unidades)"""
+    pc1: str = ""
+    pc2: str = ""
+    car: str = ""
+    cc1: str = ""
+    cc2: str = ""
+    clase: str = ""
+    direccion: str = ""
+    municipio: str = ""
+    provincia: str = ""
+    uso: str = ""
+    superficie_construida: float = 0.0
+    superficie_parcela: float = 0.0
+    coef_participacion: float = 0.0
+    anio_const: int = 0
+    poligono: str = ""
+    parcela: str = ""
+    tipo_via: str = ""
+    nombre_via: str = ""
+    numero: str = ""
+    escalera: str = ""
+    planta: str = ""
+    puerta: str = ""
+    construcciones: List[Construccion] = field(default_factory=list)
+    cultivos: List[Cultivo] = field(default_factory=list)
+
+    @property
+    def rc14(self) -> str:
+        return self.pc1 + self.pc2
+
+    @property
+    def rc(self) -> str:
+        """Referencia completa (20 caracteres si la respuesta trae cargo y dígitos de control)"""
+        return self.pc1 + self.pc2 + self.car + self.cc1 + self.cc2
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "rc": self.rc,
+            "clase": self.clase,
+            "direccion": self.direccion,
+            "municipio": self.municipio,
+            "provincia": self.provincia,
+            "uso": self.uso,
+            "superficie_construida": self.superficie_construida,
+            "superficie_parcela": self.superficie_parcela,
+            "coef_participacion": self.coef_participacion,
+            "anio_const": self.anio_const,
+            "escalera": self.escalera,
+            "planta": self.planta,
+            "puerta": self.puerta,
+            "construcciones": [c.__dict__ for c in self.construcciones],
+            "cultivos": [c.__dict__ for c in self.cultivos],
+        }
+
+
+@dataclass
+class CoordenadaCatastro:
+    """Elemento <coord> de Consulta_CPMRC / Consulta_RCCOOR"""
+    pc1: str = ""
+    pc2: str = ""
+    lon: Optional[float] = None
+    lat: Optional[float] = None
+    srs: str = ""
+    direccion: str = ""
+
+    @property
+    def rc14(self) -> str:
+        return self.pc1 + self.pc2
+
+
+@dataclass
+class RespuestaCatastro:
+    unidades: List[UnidadCatastral] = field(default_factory=list)
+    coordenadas: List[CoordenadaCatastro] = field(default_factory=list)
+    errores: List[ErrorCatastro] = field(default_factory=list)
+    es_lista: bool = False  # True si es una lista de unidades (lrcdnp) sin detalle
+
+    @property
+    def error(self) -> Optional[str]:
+        """Primer mensaje de error del Catastro (código > 0), o None"""
+        for e in self.errores:
+            if e.cod > 0:
+                return e.des
+        return None
+
+
+def _float(texto: str) -> float:
+    try:
+        return float(texto.replace(",", "."))
+    except ValueError:
+        return 0.0
+
+
+def _int(texto: str) -> int:
+    try:
+        return int(texto)
+    except ValueError:
+        return 0
+
+
+# Contenedores que abren un registro nuevo
+_CONTENEDORES = {"bico", "rcdnp", "cons", "spr", "err", "coord"}
+
+# Hojas que interesan en cada tipo de registro: etiqueta -> (atributo, conversor)
+_CAMPOS_UNIDAD = {
+    "pc1": ("pc1", str), "pc2": ("pc2", str), "car": ("car", str),
+    "cc1": ("cc1", str), "cc2": ("cc2", str), "cn": ("clase", str),
+    "ldt": ("direccion", str), "nm": ("municipio", str), "np": ("provincia", str),
+    "luso": ("uso", str), "sfc": ("superficie_construida", _float),
+    "ssf": ("superficie_parcela", _float), "spt": ("superficie_parcela", _float),
+    "cpt": ("coef_participacion", _float), "ant": ("anio_const", _int),
+    "cpo": ("poligono", str), "cpa": ("parcela", str),
+    "tv": ("tipo_via", str), "nv": ("nombre_via", str), "pnp": ("numero", str),
+    "es": ("escalera", str), "pt": ("planta", str), "pu": ("puerta", str),
+}
+_CAMPOS_CONSTRUCCION = {
+    "lcd": ("uso", str), "stl": ("superficie", _float),
+    "es": ("escalera", str), "pt": ("planta", str), "pu": ("puerta", str),
+}
+_CAMPOS_CULTIVO = {
+    "ccc": ("codigo", str), "dcc": ("descripcion", str),
+    "ip": ("intensidad", str), "ssp": ("superficie", _float),
+}
+_CAMPOS_COORD = {
+    "pc1": ("pc1", str), "pc2": ("pc2", str), "xcen": ("lon", _float),
+    "ycen": ("lat", _float), "srs": ("srs", str), "ldt": ("direccion", str),
+}
+_CAMPOS_ERROR = {"cod": ("cod", _int), "des": ("des", str)}
+
+_CAMPOS = {
+    "bico": _CAMPOS_UNIDAD, "rcdnp": _CAMPOS_UNIDAD, "cons": _CAMPOS_CONSTRUCCION,
+    "spr": _CAMPOS_CULTIVO, "coord": _CAMPOS_COORD, "err": _CAMPOS_ERROR,
+}
+
+
+def _local(tag) -> str:
+    """Nombre de etiqueta sin namespace ({uri}tag -> tag)"""
+    if not isinstance(tag, str):
+        return ""
+    return tag.rsplit("}", 1)[-1]
+
+
+class CatastroParser:
+    """Convierte las respuestas XML del Catastro en registros tipados"""
+
+    @staticmethod
+    def parse(xml: Union[str, bytes]) -> RespuestaCatastro:
+        """
+        Recorre el documento una vez. Cada hoja se asigna al registro abierto más
+        interno que la reconoce (construcción > unidad, etc.) y los contenedores
+        se liberan al cerrarse.
+        Lanza ValueError si la respuesta no es XML válido.
+        """
+        if isinstance(xml, str):
+            xml = xml.encode("utf-8")
+
+        resultado = RespuestaCatastro()
+        pila = []  # [(etiqueta, registro)]
+
+        try:
+            for evento, elem in ET.iterparse(io.BytesIO(xml), events=("start", "end")):
+                tag = _local(elem.tag)
+
+                if evento == "start":
+                    if tag in _CONTENEDORES:
+                        if tag in ("bico", "rcdnp"):
+                            registro = UnidadCatastral()
+                        elif tag == "cons":
+                            registro = Construccion()
+                        elif tag == "spr":
+                            registro = Cultivo()
+                        elif tag == "coord":
+                            registro = CoordenadaCatastro()
+                        else:
+                            registro = ErrorCatastro(0, "")
+                        pila.append((tag, registro))
+                    elif tag == "lrcdnp":
+                        resultado.es_lista = True
+                    continue
+
+                if tag in _CONTENEDORES:
+                    _, registro = pila.pop()
+                    if tag in ("bico", "rcdnp"):
+                        resultado.unidades.append(registro)
+                    elif tag == "cons" and pila:
+                        pila[-1][1].construcciones.append(registro)
+                    elif tag == "spr" and pila:
+                        pila[-1][1].cultivos.append(registro)
+                    elif tag == "coord":
+                        resultado.coordenadas.append(registro)
+                    elif tag == "err":
+                        resultado.errores.append(registro)
+                    elem.clear()
+                    continue
+
+                texto = (elem.text or "").strip()
+                if not texto:
+                    continue
+                for contenedor, registro in reversed(pila):
+                    campo = _CAMPOS[contenedor].get(tag)
+                    if campo:
+                        atributo, conversor = campo
+                        # La primera aparición manda (p. ej. ldt de bi frente a finca)
+                        if not getattr(registro, atributo):
+                            setattr(registro, atributo, conversor(texto))
+                        break
+        except ET.ParseError as e:
+            raise ValueError(f"Respuesta del Catastro no es XML válido: {e}")
+
+        for unidad in resultado.unidades:
+            # Si el detalle no trae uso general, usar el de la primera construcción
+            if not unidad.uso and unidad.construcciones:
+                unidad.uso = unidad.construcciones[0].uso
+            # La lista de unidades no trae <ldt>: componerla a partir de la localización
+            if not unidad.direccion and unidad.nombre_via:
+                partes = [unidad.tipo_via, unidad.nombre_via, unidad.numero]
+                if unidad.escalera: partes.append(f"Es:{unidad.escalera}")
+                if unidad.planta: partes.append(f"Pl:{unidad.planta}")
+                if unidad.puerta: partes.append(f"Pt:{unidad.puerta}")
+                unidad.direccion = " ".join(p for p in partes if p)
+        return resultado
@@ -3,66 +3,79 @@ Transformador de coordenadas entre sistemas de referencia
 Convierte UTM a Lat/Lon para visualización en mapas web
 """
 
+from functools import lru_cache
+import numpy as np
 from pyproj import Transformer
 from typing import List, Tuple
 
 
+def limpiar_epsg(epsg: str) -> str:
+    """Sanitizar EPSG para evitar duplicados (ej: EPSG:EPSG:25830)"""
+    return str(epsg).upper().replace("EPSG:", "")
+
+
+@lru_cache(maxsize=32)
+def _transformer(origen: str, destino: str) -> Transformer:
+    """
+    Transformer cacheado por par de EPSG: crearlo cuesta milisegundos (base de datos
+    de PROJ) y antes se creaba en cada llamada. Desde pyproj 3.1 es seguro entre hilos.
+    """
+    return Transformer.from_crs(f"EPSG:{origen}", f"EPSG:{destino}", always_xy=True)
+
+
 class CoordinateTransformer:
     """Transforma coordenadas entre sistemas de referencia"""
-    
+
     @staticmethod
     def utm_to_latlon(coords: List[Tuple[float, float]], epsg_utm: str = "25830") -> List[Tuple[float, float]]:
         """
         Convierte coordenadas UTM a Lat/Lon (EPSG:4326)
-        
+
         Args:
             coords: Lista de tuplas (x, y) en UTM
             epsg_utm: Código EPSG fuente (25829, 25830, 25831, 32628)
-        
+
         Returns:
             Lista de tuplas (lon, lat) en WGS84
         """
-        # Sanitizar EPSG para evitar duplicados (ej: EPSG:EPSG:25830)
-        clean_epsg = str(epsg_utm).upper().replace("EPSG:", "")
-        
-        # Crear transformador
-        transformer = Transformer.from_crs(
-            f"EPSG:{clean_epsg}",
-            "EPSG:4326",
-            always_xy=True
-        )
-        
-        transformed = []
-        for x, y in coords:
-            lon, lat = transformer.transform(x, y)
-            transformed.append((lon, lat))
-        
-        return transformed
-    
+        if not coords:
+            return []
+        lonlat = CoordinateTransformer.transformar_array(np.asarray(coords, dtype=float)[:, :2], epsg_utm, "4326")
+        return list(zip(lonlat[:, 0].tolist(), lonlat[:, 1].tolist()))
+
     @staticmethod
     def latlon_to_utm(coords: List[Tuple[float, float]], epsg_utm: str = "25830") -> List[Tuple[float, float]]:
         """
         Convierte coordenadas Lat/Lon (EPSG:4326) a UTM
-        
+
         Args:
             coords: Lista de tuplas (lon, lat) en WGS84
             epsg_utm: Código EPSG destino (25829, 25830, 25831, 32628)
-        
+
         Returns:
             Lista de tuplas (x, y) en UTM
         """
-        # Sanitizar EPSG para evitar duplicados
-        clean_epsg = str(epsg_utm).upper().replace("EPSG:", "")
-        
-        transformer = Transformer.from_crs(
-            "EPSG:4326",
-            f"EPSG:{clean_epsg}",
-            always_xy=True
-        )
-        
-        transformed = []
-        for lon, lat in coords:
-            x, y = transformer.transform(lon, lat)
-            transformed.append((x, y))
-        
-        return transformed
+        if not coords:
+            return []
+        xy = CoordinateTransformer.transformar_array(np.asarray(coords, dtype=float)[:, :2], "4326", epsg_utm)
+        return list(zip(xy[:, 0].tolist(), xy[:, 1].tolist()))
+
+    @staticmethod
+    def transformar_array(xy: np.ndarray, epsg_origen: str, epsg_destino: str) -> np.ndarray:
+        """
+        Reproyecta un array (N, 2) en una sola llamada a PROJ.
+        Para agrupar muchos anillos: concatenarlos, transformar y volver a partir.
+        """
+        transformer = _transformer(limpiar_epsg(epsg_origen), limpiar_epsg(epsg_destino))
+        x, y = transformer.transform(xy[:, 0], xy[:, 1])
+        return np.column_stack((x, y))
+
+    @staticmethod
+    def transformar_bbox(bbox: Tuple[float, float, float, float], epsg_origen: str,
+                         epsg_destino: str) -> Tuple[float, float, float, float]:
+        """
+        Reproyecta un rectángulo (xmin, ymin, xmax, ymax) devolviendo el rectángulo que lo
+        contiene en destino (densificando los bordes, que en destino pueden ser curvos).
+        """
+        transformer = _transformer(limpiar_epsg(epsg_origen), limpiar_epsg(epsg_destino))
+        return tuple(transformer.transform_bounds(*bbox, densify_pts=21))
@@ -1,7 +1,17 @@
 
+import os
+import itertools
 import ezdxf
+import numpy as np
+import shapely
 from typing import List, Tuple, Optional, Dict
 from core.parcel_model import ParcelaInfo, sanitizar_nombre_catastral
+from core.ventana import BBox, corta_ventana
+from core.anillos import proyectar_y_medir
+from core.poligonizacion import poligonizar, segmentos_de_arco
+
+# Distancia (unidades del DXF, normalmente m) a la que se unen extremos de segmentos sueltos
+DXF_TOLERANCIA_AJUSTE = float(os.getenv("DXF_TOLERANCIA_AJUSTE", "0.01"))
 
 class DXFReader:
     """Lector de archivos DXF para catastro"""
@@ -10,7 +20,7 @@ class DXFReader:
     def obtener_capas_con_detalle(ruta_dxf: str) -> List[Tuple[str, int, int]]:
         """
         Devuelve lista de (nombre_capa, num_geometrias, num_textos).
-        Geometrías incluye: LWPOLYLINE, POLYLINE, LINE (cerradas o no, para dar pistas)
+        Geometrías incluye: LWPOLYLINE, POLYLINE, LINE, ARC (cerradas o no; LINE y ARC se poligonizan)
         Textos incluye: TEXT, MTEXT
         """
         try:
@@ -35,7 +45,7 @@ class DXFReader:
                 if layer not in layer_stats:
                     layer_stats[layer] = {'geom': 0, 'text': 0}
                 
-                if dxftype in ['LWPOLYLINE', 'POLYLINE', 'LINE']:
+                if dxftype in ['LWPOLYLINE', 'POLYLINE', 'LINE', 'ARC']:
                     layer_stats[layer]['geom'] += 1
                 elif dxftype in ['TEXT', 'MTEXT']:
                     layer_stats[layer]['text'] += 1
@@ -51,16 +61,41 @@ class DXFReader:
         except Exception as e:
             raise Exception(f"Error analizando capas: {e}")
 
+    @staticmethod
+    def seleccionar_capas(capas_info: List[Tuple[str, int, int]], tipo_entidad: str = "CP") -> Tuple[List[str], str]:
+        """
+        Capas de geometría y capa de textos a leer, a partir de (nombre, num_geometrias, num_textos).
+        Parcelas: capas LP (o todas las que tengan geometría) y textos de LT.
+        Edificios: más permisivo, todas las capas con geometría y la primera con textos.
+        """
+        if tipo_entidad == "BU":
+            capas_parcelas = [c[0] for c in capas_info if c[1] > 0]
+            capas_textos = [c[0] for c in capas_info if c[2] > 0]
+        else:
+            capas_parcelas = [c[0] for c in capas_info if 'LP' in c[0].upper() and c[1] > 0]
+            capas_textos = [c[0] for c in capas_info if 'LT' in c[0].upper() and c[2] > 0]
+
+            if not capas_parcelas:
+                capas_parcelas = [c[0] for c in capas_info if c[1] > 0]
+
+        return capas_parcelas, (capas_textos[0] if capas_textos else "")
+
     @staticmethod
     def obtener_capas(ruta_dxf: str) -> List[str]:
         # Deprecated/Simple wrapper
         return [l[0] for l in DXFReader.obtener_capas_con_detalle(ruta_dxf)]
 
     @staticmethod
-    def leer_borde_parcelas(ruta_dxf: str, capas_parcelas: List[str], capa_textos: str) -> List[ParcelaInfo]:
+    def leer_borde_parcelas(ruta_dxf: str, capas_parcelas: List[str], capa_textos: str,
+                            bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
         """
         Lee el DXF y extrae las parcelas cruzando geometrías con textos.
         capas_parcelas: Lista de nombres de capas de geometría (e.g. ['PG-LP', 'PG-LI'])
+        bbox: ventana (xmin, ymin, xmax, ymax) en las coordenadas del DXF; las polilíneas
+        cuya envolvente no la corta se descartan antes de crear la parcela y buscar su texto.
+        Si una capa tiene LINE/ARC, sus segmentos y los de las polilíneas abiertas se
+        poligonizan (extremos unidos a DXF_TOLERANCIA_AJUSTE) y cada cara es una parcela;
+        las polilíneas abiertas que no bordean ninguna cara se cierran a la fuerza.
         """
         import os
         nombre_base_dxf = os.path.splitext(os.path.basename(ruta_dxf))[0]
@@ -84,6 +119,41 @@ class DXFReader:
             
             print(f"DEBUG: Candidatos Textos -> {len(todos_textos)} ent.")
 
+            def nombrar_parcela(parcela: ParcelaInfo) -> None:
+                # Buscar texto dentro del polígono
+                referencia = DXFReader.buscar_texto_dentro(parcela, todos_textos)
+                
+                if referencia:
+                    referencia_limpia = referencia.replace(" ", "").upper()
+                    if len(referencia_limpia) in [14, 20] and referencia_limpia.isalnum():
+                        parcela.referencia_catastral = referencia_limpia
+                        parcela.nombre_archivo = referencia_limpia
+                    else:
+                        parcela.referencia_catastral = None
+                        parcela.nombre_archivo = referencia
+                else:
+                    # Naming fallback
+                    # 1. Intentar usar el nombre del archivo si parece una RC (14 caracteres)
+                    nombre_limpio = nombre_base_dxf.strip().upper()
+                    # Validación simple de RC: 14 caracteres alfanuméricos (o 20)
+                    es_rc_valida = (len(nombre_limpio) == 14 and nombre_limpio.isalnum())
+                    
+                    if es_rc_valida:
+                         parcela.referencia_catastral = nombre_limpio
+                         parcela.nombre_archivo = nombre_limpio
+                    else:
+                         # Caso Local / Nombre de archivo genérico
+                         parcela.referencia_catastral = None
+                         
+                         # Un solo objeto o varios: el nombre es el archivo
+                         # El usuario pide: ES.LOCAL.CP.NOMBRE_ARCHIVO
+                         # Si hay VARIAS, deberían ser Partes del mismo...
+                         # Vamos a asumir que si no es RC, también queremos agrupar por nombre de archivo
+                         # pero cuidado con IDs duplicados si no se agrupan.
+                         # La agrupación se hace en main_window por identificador.
+                         # ASÍ QUE USAMOS EL MISMO NOMBRE BASE
+                         parcela.nombre_archivo = nombre_base_dxf
+
             # Iterar sobre las capas de geometría
             count_total_polys = 0
             
@@ -96,91 +166,145 @@ class DXFReader:
                 print(f"DEBUG: Procesando capa '{capa}' [Tipo: {tipo_capa}]")
 
                 # Extraer Polilíneas de esta capa
-                lw_polys = msp.query(f'LWPOLYLINE[layer=="{capa}"]')
-                legacy_polys = msp.query(f'POLYLINE[layer=="{capa}"]')
-                polilineas = list(lw_polys) + list(legacy_polys)
+                lw_polys = list(msp.query(f'LWPOLYLINE[layer=="{capa}"]'))
+                legacy_polys = list(msp.query(f'POLYLINE[layer=="{capa}"]'))
+                polilineas = lw_polys + legacy_polys
+                # Vértices (N, 2): vistas sobre el array de ezdxf y una pasada para las POLYLINE
+                vertices = [DXFReader.vertices_lwpolyline(p) for p in lw_polys] + \
+                    DXFReader.vertices_polylines(legacy_polys)
                 
                 print(f"DEBUG: Capa '{capa}' -> {len(polilineas)} geometrías")
                 count_total_polys += len(polilineas)
             
+                # Segmentos sueltos (LINE, ARC): si hay, las polilíneas abiertas también van a
+                # poligonización; las que no acaban en ninguna cara se cierran a la fuerza como siempre
+                sueltos = list(msp.query(f'LINE[layer=="{capa}"]')) + list(msp.query(f'ARC[layer=="{capa}"]'))
+                segmentos = []  # arrays (N, 2, 2)
+                abiertas = []  # (índice, vértices) de las polilíneas abiertas enviadas a poligonizar
+                anillos = []  # anillos cerrados (N, 2) de la capa, uno por parcela
+
                 # Procesar cada polilínea
-                for i, poly in enumerate(polilineas):
+                for i, (poly, xy) in enumerate(zip(polilineas, vertices)):
                     # Verificar si está cerrada
                     is_closed = poly.is_closed
-                    
-                    # Obtener puntos según el tipo
-                    if poly.dxftype() == 'LWPOLYLINE':
-                       puntos_raw = poly.get_points()
-                       coordenadas = [(p[0], p[1]) for p in puntos_raw]
-                    else:
-                       coordenadas = [(v.dxf.location.x, v.dxf.location.y) for v in poly.vertices]
-                    
-                    # Intento de cerrar manualmente si coincide start/end
-                    if len(coordenadas) > 2:
-                        start = coordenadas[0]
-                        end = coordenadas[-1]
-                        if start != end:
-                            coordenadas.append(start)
-                        is_closed = True
-                    
-                    if not is_closed or len(coordenadas) < 3:
-                        if i < 5: print(f"DEBUG: Polilínea {i} ignorada en {capa}. Puntos: {len(coordenadas)}")
+                    if sueltos and not is_closed and len(xy) >= 2 and np.any(xy[0] != xy[-1]):
+                        # Se filtra por cara (o al cerrarla si no forma ninguna), no por polilínea
+                        segmentos.append(np.stack((xy[:-1], xy[1:]), axis=1))
+                        abiertas.append((i, xy))
+                        continue
+                    if bbox is not None and not corta_ventana(xy, bbox):
+                        continue
+
+                    anillo = DXFReader._cerrar_anillo(xy, is_closed)
+                    if anillo is None:
+                        if i < 5: print(f"DEBUG: Polilínea {i} ignorada en {capa}. Puntos: {len(xy)}")
                         continue
                     
-                    # Crear parcela preliminar
+                    anillos.append(anillo)
+
+                # Linderos dibujados con segmentos: ajuste de extremos, nodado y polygonize
+                if sueltos:
+                    extremos = [(e.dxf.start.x, e.dxf.start.y, e.dxf.end.x, e.dxf.end.y)
+                                for e in sueltos if e.dxftype() == 'LINE']
+                    segmentos.append(np.asarray(extremos, dtype=float).reshape(-1, 2, 2))
+                    for arco in (e for e in sueltos if e.dxftype() == 'ARC'):
+                        segmentos.append(segmentos_de_arco(
+                            arco.dxf.center.x, arco.dxf.center.y, arco.dxf.radius,
+                            arco.dxf.start_angle, arco.dxf.end_angle, DXF_TOLERANCIA_AJUSTE
+                        ))
+                    segmentos = np.concatenate(segmentos)
+                    caras = poligonizar(segmentos, DXF_TOLERANCIA_AJUSTE)
+                    print(f"DEBUG: Capa '{capa}' -> {len(segmentos)} segmentos sueltos, {len(caras)} polígonos")
+
+                    exteriores = shapely.get_exterior_ring(caras)
+                    for anillo in exteriores:
+                        xy = shapely.get_coordinates(anillo)
+                        if corta_ventana(xy, bbox):
+                            anillos.append(xy)
+
+                    # Polilíneas abiertas que no bordean ninguna cara (p. ej. una LINE suelta de
+                    # acotación en la capa de linderos): se cierran como si no hubiera LINE/ARC
+                    en_caras = DXFReader._tocan_caras([xy for _, xy in abiertas], exteriores)
+                    for (i, xy), usada in zip(abiertas, en_caras):
+                        if usada or not corta_ventana(xy, bbox):
+                            continue
+                        anillo = DXFReader._cerrar_anillo(xy, False)
+                        if anillo is None:
+                            if i < 5: print(f"DEBUG: Polilínea {i} ignorada en {capa}. Puntos: {len(xy)}")
+                            continue
+                        anillos.append(anillo)
+
+                # Coordenadas, área y centroide de todos los anillos de la capa a la vez
+                nuevas = []
+                for _ in anillos:
                     parcela = ParcelaInfo()
-                    parcela.coordenadas = coordenadas
-                    parcela.area = DXFReader.calcular_area(coordenadas)
-                    parcela.punto_referencia = DXFReader.calcular_centroide(coordenadas)
                     parcela.capa_origen = capa # GUARDAR CAPA ORIGEN
-                    
-                    # Buscar texto dentro del polígono
-                    referencia = DXFReader.buscar_texto_dentro(parcela, todos_textos)
-                    
-                    if referencia:
-                        referencia_limpia = referencia.replace(" ", "").upper()
-                        if len(referencia_limpia) in [14, 20] and referencia_limpia.isalnum():
-                            parcela.referencia_catastral = referencia_limpia
-                            parcela.nombre_archivo = referencia_limpia
-                        else:
-                            parcela.referencia_catastral = None
-                            parcela.nombre_archivo = referencia
-                    else:
-                        # Naming fallback
-                        # 1. Intentar usar el nombre del archivo si parece una RC (14 caracteres)
-                        nombre_limpio = nombre_base_dxf.strip().upper()
-                        # Validación simple de RC: 14 caracteres alfanuméricos (o 20)
-                        es_rc_valida = (len(nombre_limpio) == 14 and nombre_limpio.isalnum())
-                        
-                        if es_rc_valida:
-                             parcela.referencia_catastral = nombre_limpio
-                             parcela.nombre_archivo = nombre_limpio
-                        else:
-                             # Caso Local / Nombre de archivo genérico
-                             parcela.referencia_catastral = None
-                             
-                             # Si es un solo objeto, el nombre es el archivo
-                             if len(polilineas) == 1 and len(capas_parcelas) == 1:
-                                 nombre = nombre_base_dxf
-                             else:
-                                 # Multiples objetos: Nombre + Indice para diferenciar (si no se agrupan luego)
-                                 # El usuario pide: ES.LOCAL.CP.NOMBRE_ARCHIVO
-                                 # Si hay VARIAS, deberían ser Partes del mismo...
-                                 # Vamos a asumir que si no es RC, también queremos agrupar por nombre de archivo
-                                 # pero cuidado con IDs duplicados si no se agrupan.
-                                 # La agrupación se hace en main_window por identificador.
-                                 # ASÍ QUE USAMOS EL MISMO NOMBRE BASE
-                                 nombre = nombre_base_dxf
-                                 
-                             parcela.nombre_archivo = nombre
-                    
-                    parcelas.append(parcela)
+                    nuevas.append(parcela)
+                proyectar_y_medir(nuevas, [[xy] for xy in anillos], None)
+
+                for parcela in nuevas:
+                    nombrar_parcela(parcela)
+                parcelas.extend(nuevas)
                 
             return parcelas
             
         except Exception as e:
             raise Exception(f"Error al leer DXF: {str(e)}")
 
+    @staticmethod
+    def _cerrar_anillo(xy: np.ndarray, is_closed: bool) -> Optional[np.ndarray]:
+        """
+        Anillo cerrado de una polilínea: con más de 2 vértices se cierra a la fuerza
+        (repitiendo el primero si no coincide con el último). None si no es un polígono.
+        """
+        if len(xy) > 2:
+            if np.any(xy[0] != xy[-1]):
+                xy = np.concatenate((xy, xy[:1]))
+            is_closed = True
+        if not is_closed or len(xy) < 3:
+            return None
+        return xy
+
+    @staticmethod
+    def _tocan_caras(polilineas: List[np.ndarray], exteriores: np.ndarray) -> List[bool]:
+        """
+        True para cada polilínea (N, 2) con algún tramo (su punto medio) sobre el borde de
+        alguna cara poligonizada, a DXF_TOLERANCIA_AJUSTE.
+        """
+        if not polilineas:
+            return []
+        if not len(exteriores):
+            return [False] * len(polilineas)
+        medios = np.concatenate([(xy[:-1] + xy[1:]) / 2 for xy in polilineas])
+        de = np.repeat(np.arange(len(polilineas)), [len(xy) - 1 for xy in polilineas])
+        tocan, _ = shapely.STRtree(exteriores).query(
+            shapely.points(medios), predicate="dwithin", distance=DXF_TOLERANCIA_AJUSTE
+        )
+        return (np.bincount(de[tocan], minlength=len(polilineas)) > 0).tolist()
+
+    @staticmethod
+    def vertices_lwpolyline(poly) -> np.ndarray:
+        """
+        Vértices (N, 2) de una LWPOLYLINE como vista sobre el array empaquetado de ezdxf
+        (x, y, ancho inicial, ancho final, bulge): sin copia ni tuplas por vértice.
+        """
+        return np.asarray(poly.lwpoints.values, dtype=float).reshape(-1, 5)[:, :2]
+
+    @staticmethod
+    def vertices_polylines(polys) -> List[np.ndarray]:
+        """
+        Vértices (N, 2) de cada POLYLINE (2D): todas las localizaciones de VERTEX se vuelcan
+        en un único buffer en una pasada y se reparten por desplazamientos.
+        """
+        if not polys:
+            return []
+        longitudes = [len(p.vertices) for p in polys]
+        planos = np.fromiter(
+            itertools.chain.from_iterable(v.dxf.location for p in polys for v in p.vertices),
+            dtype=float, count=3 * sum(longitudes)
+        )
+        return np.split(planos.reshape(-1, 3)[:, :2], np.cumsum(longitudes)[:-1])
+
     @staticmethod
     def calcular_area(coordenadas: List[Tuple[float, float]]) -> float:
         """Calcula el área usando la fórmula de Gauss (Shoelace format)"""
@@ -0,0 +1,244 @@
+"""
+Lector de GML INSPIRE del Catastro (CadastralParcel y Building)
+Recorre los miembros en streaming (iterparse), decodifica gml:posList en bloque y
+proyecta/mide todos los anillos a la vez: las descargas municipales oficiales
+(cientos de MB) se leen sin cargar el árbol completo.
+"""
+
+import os
+import re
+import warnings
+from typing import List, Optional, Tuple
+import numpy as np
+from core.parcel_model import ParcelaInfo
+from core.anillos import proyectar_y_medir
+from core.ventana import BBox, corta_ventana, ventana_en_crs
+
+# Importaciones condicionales
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
+
+# Entidad INSPIRE -> tipo_entidad
+ENTIDADES = {'CadastralParcel': 'CP', 'Building': 'BU'}
+
+# EPSG al final de srsName: urn:ogc:def:crs:EPSG::25830, http://www.opengis.net/def/crs/EPSG/0/25830, EPSG:25830
+_RE_EPSG = re.compile(r'(\d{4,5})\s*$')
+
+
+def _nombre_local(tag) -> str:
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ""
+
+
+class GMLReader:
+    """Lector de GML de parcelas (cp:CadastralParcel) y edificios (bu-ext2d:Building)"""
+
+    @staticmethod
+    def leer_gml(ruta_gml: str, epsg: str = "25830", bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
+        """
+        Lee un GML INSPIRE y lo convierte a ParcelaInfo en el EPSG indicado.
+        La referencia es nationalCadastralReference (parcelas) o el localId del inspireId
+        (edificios). Cada superficie de un MultiSurface es una parcela, con sufijo .N en el
+        nombre como en los MultiPolygon de los shapefiles.
+        bbox: ventana (xmin, ymin, xmax, ymax) en ese EPSG; solo se devuelven las superficies
+        cuya envolvente la corta.
+        """
+        try:
+            with open(ruta_gml, 'rb') as fuente:
+                parcelas, anillos, crs = GMLReader._iterar_miembros(
+                    fuente, os.path.basename(ruta_gml), epsg, bbox
+                )
+        except ET.ParseError as e:
+            print(f"Error parseando XML del GML: {e}")
+            return []
+
+        # Una transformación por CRS de origen (lo normal es uno solo para todo el archivo)
+        grupos = {}
+        for i, epsg_origen in enumerate(crs):
+            grupos.setdefault(epsg_origen, []).append(i)
+        if len(grupos) > 1:
+            print(f"DEBUG: GML con varios CRS ({', '.join(str(c) for c in grupos)}): cada miembro se proyecta desde el suyo")
+        for epsg_origen, indices in grupos.items():
+            if len(grupos) == 1:
+                proyectar_y_medir(parcelas, anillos, epsg_origen, epsg)
+            else:
+                proyectar_y_medir([parcelas[i] for i in indices], [anillos[i] for i in indices], epsg_origen, epsg)
+        return parcelas
+
+    @staticmethod
+    def _iterar_miembros(fuente, capa: str, epsg: str = "25830", bbox: Optional[BBox] = None
+                         ) -> Tuple[List[ParcelaInfo], List[List[np.ndarray]], List[Optional[str]]]:
+        """
+        Parcelas, sus anillos en el CRS de origen y el EPSG de origen de cada una.
+        Cada miembro usa el EPSG de su srsName; los que no lo declaran, el del primer
+        miembro que sí lo hace (aunque venga después) o, si ninguno lo declara, el pedido.
+        """
+        if LXML_AVAILABLE:
+            eventos = ET.iterparse(fuente, events=("end",), tag=[f"{{*}}{t}" for t in ENTIDADES], huge_tree=True)
+        else:
+            eventos = (
+                (ev, el) for ev, el in ET.iterparse(fuente, events=("end",))
+                if _nombre_local(el.tag) in ENTIDADES
+            )
+
+        parcelas = []
+        anillos = []  # anillos de cada parcela (exterior primero), en el CRS de su miembro
+        crs = []
+        epsg_archivo = None
+        por_crs = {}  # EPSG -> (intercambiar ejes, ventana en ese CRS), calculado una vez por CRS
+        sin_crs = 0  # parcelas iniciales leídas antes de conocer el CRS del archivo
+
+        for idx, (_, miembro) in enumerate(eventos):
+            epsg_miembro = GMLReader._epsg_de(miembro) or epsg_archivo
+            if epsg_miembro is None:
+                # Todavía sin CRS: se lee tal cual y se resuelve al terminar
+                intercambiar, ventana = False, None
+            else:
+                epsg_archivo = epsg_archivo or epsg_miembro
+                if epsg_miembro not in por_crs:
+                    # La ventana se pasa al CRS del miembro; las superficies no se proyectan
+                    por_crs[epsg_miembro] = (GMLReader._ejes_lat_lon(epsg_miembro),
+                                             ventana_en_crs(bbox, epsg, epsg_miembro))
+                intercambiar, ventana = por_crs[epsg_miembro]
+            for parcela, anillos_parcela in GMLReader._parcelas_de_miembro(miembro, idx, capa, intercambiar, ventana):
+                parcelas.append(parcela)
+                anillos.append(anillos_parcela)
+                crs.append(epsg_miembro)
+                if epsg_miembro is None:
+                    sin_crs += 1
+
+            # Liberar el miembro y los ya procesados (también el <member> que lo envuelve)
+            miembro.clear()
+            if LXML_AVAILABLE:
+                for nodo in (miembro, miembro.getparent()):
+                    while nodo is not None and nodo.getprevious() is not None:
+                        del nodo.getparent()[0]
+
+        if sin_crs:
+            intercambiar = GMLReader._ejes_lat_lon(epsg_archivo)
+            ventana = ventana_en_crs(bbox, epsg, epsg_archivo)
+            conservar = []
+            for i in range(sin_crs):
+                if intercambiar:
+                    anillos[i] = [a[:, ::-1] for a in anillos[i]]
+                crs[i] = epsg_archivo
+                if corta_ventana(anillos[i][0], ventana):
+                    conservar.append(i)
+            if len(conservar) < sin_crs:
+                quedan = conservar + list(range(sin_crs, len(parcelas)))
+                parcelas, anillos, crs = ([lista[i] for i in quedan] for lista in (parcelas, anillos, crs))
+
+        return parcelas, anillos, crs
+
+    @staticmethod
+    def _epsg_de(miembro) -> Optional[str]:
+        """EPSG del primer srsName de la geometría del miembro"""
+        for nodo in miembro.iterfind(".//*[@srsName]"):
+            m = _RE_EPSG.search(nodo.get("srsName"))
+            if m:
+                return m.group(1)
+        return None
+
+    @staticmethod
+    def _parcelas_de_miembro(miembro, idx: int, capa: str, intercambiar: bool,
+                             ventana: Optional[BBox] = None) -> List[Tuple[ParcelaInfo, List[np.ndarray]]]:
+        tipo = ENTIDADES[_nombre_local(miembro.tag)]
+
+        # Referencia: nationalCadastralReference o, si no hay, localId del inspireId
+        referencia = ""
+        for ruta in ("{*}nationalCadastralReference", "{*}inspireId//{*}localId"):
+            nodo = miembro.find(ruta)
+            if nodo is not None and nodo.text and nodo.text.strip():
+                referencia = nodo.text.strip()
+                break
+
+        # Superficies: PolygonPatch (Surface) o Polygon (MultiSurface simple)
+        superficies = miembro.findall(".//{*}PolygonPatch") + miembro.findall(".//{*}Polygon")
+
+        parcelas = []
+        for s_idx, superficie in enumerate(superficies):
+            exterior = superficie.find("{*}exterior")
+            anillo_ext = GMLReader._anillo(exterior, intercambiar) if exterior is not None else None
+            if anillo_ext is None or not len(anillo_ext):
+                continue # Sin exterior, ignoramos
+            if not corta_ventana(anillo_ext, ventana):
+                continue # Fuera de la ventana
+            anillos = [anillo_ext]
+            for interior in superficie.iterfind("{*}interior"):
+                anillo_int = GMLReader._anillo(interior, intercambiar)
+                if anillo_int is not None and len(anillo_int):
+                    anillos.append(anillo_int)
+
+            parcela = ParcelaInfo()
+            parcela.tipo_entidad = tipo
+            if referencia:
+                # Si es multi-superficie, añadir sufijo
+                nombre = f"{referencia}.{s_idx + 1}" if len(superficies) > 1 else referencia
+                ref_limpia = nombre.replace(" ", "").upper()
+                if len(ref_limpia) in [14, 20] and ref_limpia.isalnum():
+                    parcela.referencia_catastral = ref_limpia
+                    parcela.nombre_archivo = ref_limpia
+                else:
+                    parcela.nombre_archivo = nombre
+            else:
+                parcela.nombre_archivo = f"GML_FEATURE_{idx + 1}" + (f".{s_idx + 1}" if len(superficies) > 1 else "")
+            parcela.capa_origen = capa
+            parcelas.append((parcela, anillos))
+
+        return parcelas
+
+    @staticmethod
+    def _ejes_lat_lon(epsg: Optional[str]) -> bool:
+        """En GML 3.2 los CRS geográficos (4258, 4326) van en orden lat lon"""
+        if not epsg:
+            return False
+        from pyproj import CRS
+        try:
+            return CRS.from_epsg(int(epsg)).is_geographic
+        except Exception:
+            return False
+
+    @staticmethod
+    def _anillo(contorno, intercambiar: bool) -> Optional[np.ndarray]:
+        """
+        Array (N, 2) de un gml:exterior/gml:interior: gml:posList (lo habitual), secuencia
+        de gml:pos o gml:coordinates de GML 2 ("x,y x,y").
+        """
+        pos_list = contorno.find(".//{*}posList")
+        if pos_list is not None:
+            dim = int(pos_list.get("srsDimension") or 2)
+            valores = GMLReader._numeros(pos_list.text or "")
+        else:
+            posiciones = contorno.findall(".//{*}pos")
+            if posiciones:
+                dim = int(posiciones[0].get("srsDimension") or 2)
+                valores = GMLReader._numeros(" ".join(p.text or "" for p in posiciones))
+            else:
+                coordenadas = contorno.find(".//{*}coordinates")
+                if coordenadas is None or not coordenadas.text:
+                    return None
+                tuplas = coordenadas.text.split()
+                dim = coordenadas.text.count(',') // max(len(tuplas), 1) + 1
+                valores = GMLReader._numeros(coordenadas.text.replace(',', ' '))
+
+        if valores is None or valores.size % dim:
+            return None
+        xy = valores.reshape(-1, dim)[:, :2]
+        return xy[:, ::-1] if intercambiar else xy
+
+    @staticmethod
+    def _numeros(texto: str) -> Optional[np.ndarray]:
+        """Todos los números del texto en una llamada (None si hay algún valor no numérico)"""
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", DeprecationWarning)
+                valores = np.fromstring(texto, sep=' ')
+        except ValueError:
+            return None
+        if valores.size != len(texto.split()):
+            return None
+        return valores
+
@@ -0,0 +1,370 @@
+"""
+Inspección rápida de archivos subidos (POST /inspect)
+Capas, número de geometrías y textos, envolventes, CRS probable y selección de capas
+sugerida, sin leer las geometrías: en DXF se recorren los pares código/valor en
+bloque (sin construir el documento de ezdxf); en SHP/FlatGeobuf solo se leen las
+cabeceras y en KML/GML se buscan las etiquetas sobre los bytes.
+"""
+
+import os
+import re
+import zipfile
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from core.dxf_reader import DXFReader
+from core.ttl_cache import TTLCache
+from core.vector_reader import epsg_de_crs, COLUMNAS_REFERENCIA
+
+# Resultados por (hash del contenido, extensión)
+inspeccion_cache = TTLCache(
+    max_entradas=int(os.getenv("INSPECT_CACHE_MAX", "256")),
+    ttl_segundos=float(os.getenv("INSPECT_CACHE_TTL_S", "3600")),
+)
+
+# Mismos tipos que cuenta DXFReader.obtener_capas_con_detalle
+TIPOS_GEOMETRIA = (b'LWPOLYLINE', b'POLYLINE', b'LINE', b'ARC')
+TIPOS_TEXTO = (b'TEXT', b'MTEXT')
+# Entidades cuyas coordenadas (10/20) entran en la envolvente; el POLYLINE no (su 10/20
+# es un punto ficticio), sus VERTEX sí; el ARC tampoco (10/20 es el centro). El 11/21
+# solo es un punto en LINE (extremo) y en TEXT justificado (72/73 != 0); en MTEXT es
+# el vector de dirección
+TIPOS_ENVOLVENTE = (b'LWPOLYLINE', b'LINE', b'VERTEX', b'TEXT', b'MTEXT')
+
+_RE_PLACEMARK = re.compile(rb'<(?:\w+:)?Placemark[\s>]')
+_RE_POLYGON_KML = re.compile(rb'<(?:\w+:)?Polygon[\s>]')
+_RE_COORDINATES = re.compile(rb'<(?:\w+:)?coordinates>([^<]*)<')
+_RE_MIEMBRO_GML = re.compile(rb'<(?:[\w-]+:)?(CadastralParcel|Building)[\s>]')
+_RE_SRSNAME = re.compile(rb'srsName="[^"]*?(\d{4,5})"')
+_RE_POSLIST = re.compile(rb'<(?:\w+:)?(?:posList|pos)(?:\s[^>]*)?>([^<]*)<')
+
+BBox = Tuple[float, float, float, float]
+
+
+def _texto(valor: bytes) -> str:
+    """Valor DXF a str (UTF-8 desde R2007; antes, normalmente ANSI_1252)"""
+    try:
+        return valor.strip().decode('utf-8')
+    except UnicodeDecodeError:
+        return valor.strip().decode('cp1252', errors='replace')
+
+
+def _numeros(texto: bytes, dtype) -> Optional[np.ndarray]:
+    """Números separados por espacios, convertidos en C (None si alguno no es numérico)"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return np.fromstring(texto, dtype=dtype, sep=' ')
+    except ValueError:
+        return None
+
+
+def _campos(buf: np.ndarray, inicio: np.ndarray, fin: np.ndarray) -> bytes:
+    """
+    Las líneas buf[inicio:fin] copiadas a filas de ancho fijo y separadas por espacios
+    (una sola copia vectorizada, sin un objeto bytes por línea)
+    """
+    if not len(inicio):
+        return b''
+    ancho = int((fin - inicio).max()) + 1
+    idx = inicio[:, None] + np.arange(ancho)
+    filas = buf[np.minimum(idx, len(buf) - 1)]
+    filas[idx >= fin[:, None]] = 32
+    return filas.tobytes()
+
+
+def _union(cajas: List[Optional[BBox]]) -> Optional[BBox]:
+    cajas = [c for c in cajas if c is not None]
+    if not cajas:
+        return None
+    a = np.array(cajas, dtype=float)
+    return float(a[:, 0].min()), float(a[:, 1].min()), float(a[:, 2].max()), float(a[:, 3].max())
+
+
+def sugerir_epsg(bbox: Optional[BBox]) -> Optional[str]:
+    """
+    CRS probable por el rango de coordenadas: grados -> 4326, UTM de Canarias -> 32628,
+    UTM peninsular -> 25830 (el huso no se distingue por las coordenadas; 25830 es el
+    más frecuente). None si parecen coordenadas locales.
+    """
+    if bbox is None:
+        return None
+    xmin, ymin, xmax, ymax = bbox
+    if -180 <= xmin and xmax <= 180 and -90 <= ymin and ymax <= 90:
+        return "4326"
+    if 100000 <= xmin and xmax <= 900000:
+        if 3000000 <= ymin and ymax <= 3400000:
+            return "32628"
+        if 3900000 <= ymin and ymax <= 4900000:
+            return "25830"
+    return None
+
+
+def sugerir_tipo_entidad(capas: List[Dict[str, Any]]) -> str:
+    """CP si hay capas LP con geometría; BU si solo hay capas de edificación (LI, EDIF, CONSTRU)"""
+    con_geometria = [c["nombre"].upper() for c in capas if c["geometrias"] > 0]
+    if any('LP' in n for n in con_geometria):
+        return "CP"
+    if any(clave in n for n in con_geometria for clave in ('LI', 'EDIF', 'CONSTRU')):
+        return "BU"
+    return "CP"
+
+
+class Inspector:
+    """Inspección de archivos sin análisis completo"""
+
+    @staticmethod
+    def inspeccionar(ruta: str, formato: str) -> Dict[str, Any]:
+        """
+        formato: etiqueta de FORMATOS_ANALYZE (dxf, shp, kml, kmz, gml, fgb, geojson, geojsonseq).
+        Devuelve capas [{nombre, geometrias, textos, bbox}], bbox total, epsg_sugerido,
+        tipo_entidad_sugerido, capas_parcelas y capa_textos (lo que leería /analyze).
+        """
+        if formato == 'dxf':
+            capas, epsg = Inspector.escanear_dxf(ruta), None
+        elif formato == 'shp':
+            capas, epsg = Inspector.inspeccionar_zip(ruta)
+        elif formato in ('kml', 'kmz'):
+            capas, epsg = Inspector.inspeccionar_kml(ruta), "4326"
+        elif formato == 'gml':
+            capas, epsg = Inspector.inspeccionar_gml(ruta)
+        else:
+            capas, epsg = Inspector.inspeccionar_vector(ruta)
+
+        bbox = _union([c["bbox"] for c in capas])
+        if formato == 'dxf':
+            tipo = sugerir_tipo_entidad(capas)
+            capas_parcelas, capa_textos = DXFReader.seleccionar_capas(
+                [(c["nombre"], c["geometrias"], c["textos"]) for c in capas], tipo
+            )
+        else:
+            tipo = "BU" if any(c.get("tipo_entidad") == "BU" for c in capas) else "CP"
+            capas_parcelas, capa_textos = [c["nombre"] for c in capas if c["geometrias"] > 0], ""
+
+        return {
+            "formato": formato,
+            "capas": [{k: c[k] for k in ("nombre", "geometrias", "textos", "bbox")} for c in capas],
+            "bbox": bbox,
+            "epsg_sugerido": epsg or sugerir_epsg(bbox),
+            "tipo_entidad_sugerido": tipo,
+            "capas_parcelas": capas_parcelas,
+            "capa_textos": capa_textos,
+        }
+
+    @staticmethod
+    def escanear_dxf(ruta_dxf: str) -> List[Dict[str, Any]]:
+        """
+        Recuento por capa de geometrías y textos del espacio modelo y envolvente, leyendo
+        los pares (código de grupo, valor) del DXF ASCII sobre el buffer de bytes: los
+        límites de línea, los códigos y las coordenadas se obtienen con NumPy y solo se
+        decodifican en Python los tipos de entidad, las capas y los nombres de sección.
+        Los DXF binarios se cuentan con ezdxf (sin envolvente).
+        """
+        with open(ruta_dxf, 'rb') as f:
+            datos = f.read()
+        if datos.startswith(b'AutoCAD Binary DXF'):
+            return [{"nombre": n, "geometrias": g, "textos": t, "bbox": None}
+                    for n, g, t in DXFReader.obtener_capas_con_detalle(ruta_dxf)]
+
+        buf = np.frombuffer(datos, dtype=np.uint8)
+        fin = np.flatnonzero(buf == 10)
+        if not len(fin) or fin[-1] != len(buf) - 1:
+            fin = np.append(fin, len(buf))
+        inicio = np.concatenate(([0], fin[:-1] + 1))
+        n = len(fin) // 2
+        ini_val, fin_val = inicio[1:2 * n:2], fin[1:2 * n:2]
+
+        codigos = _numeros(_campos(buf, inicio[0:2 * n:2], fin[0:2 * n:2]), np.int32)
+        if codigos is None or len(codigos) != n:
+            raise ValueError("DXF ASCII mal formado: códigos de grupo no numéricos")
+
+        def valor(i: int) -> bytes:
+            return datos[ini_val[i]:fin_val[i]].strip()
+
+        # Entidades (y objetos de tablas): cada código 0 abre una
+        inicios = np.flatnonzero(codigos == 0)
+        tipos = [valor(i) for i in inicios.tolist()]
+        entidad_de = np.cumsum(codigos == 0) - 1  # entidad de cada par (-1 antes de la primera)
+
+        # Sección de cada entidad (SECTION va seguida del código 2 con el nombre)
+        seccion = np.zeros(len(tipos), dtype=np.int8)  # 1 TABLES, 2 ENTITIES
+        actual = 0
+        for k, tipo in enumerate(tipos):
+            if tipo == b'SECTION':
+                nombre = valor(inicios[k] + 1)
+                actual = 1 if nombre == b'TABLES' else (2 if nombre == b'ENTITIES' else 0)
+            elif tipo == b'ENDSEC':
+                actual = 0
+            seccion[k] = actual
+
+        # Capa de cada entidad (código 8) y nombres de la tabla LAYER (código 2)
+        nombres: Dict[bytes, int] = {}
+        orden: List[bytes] = []
+
+        def id_capa(nombre: bytes) -> int:
+            if nombre not in nombres:
+                nombres[nombre] = len(orden)
+                orden.append(nombre)
+            return nombres[nombre]
+
+        for i in np.flatnonzero(codigos == 2).tolist():
+            e = entidad_de[i]
+            if e >= 0 and seccion[e] == 1 and tipos[e] == b'LAYER':
+                id_capa(valor(i))
+
+        capa_de = np.full(len(tipos), -1, dtype=np.int64)
+        pares_capa = np.flatnonzero(codigos == 8)
+        entidades_capa = entidad_de[pares_capa]
+        validos = (entidades_capa >= 0) & (seccion[np.maximum(entidades_capa, 0)] == 2)
+        for i, e in zip(pares_capa[validos].tolist(), entidades_capa[validos].tolist()):
+            if capa_de[e] < 0:
+                capa_de[e] = id_capa(valor(i))
+
+        # Solo espacio modelo: fuera las entidades con 67 = 1 (espacio papel)
+        papel = np.zeros(len(tipos), dtype=bool)
+        for i in np.flatnonzero(codigos == 67).tolist():
+            if valor(i) == b'1':
+                papel[entidad_de[i]] = True
+        en_modelo = (seccion == 2) & ~papel & (capa_de >= 0)
+
+        num_capas = len(orden)
+        tipos_arr = np.array(tipos, dtype=object)
+        es_geometria = en_modelo & np.isin(tipos_arr, TIPOS_GEOMETRIA)
+        es_texto = en_modelo & np.isin(tipos_arr, TIPOS_TEXTO)
+        geometrias = np.bincount(capa_de[es_geometria], minlength=num_capas)
+        textos = np.bincount(capa_de[es_texto], minlength=num_capas)
+
+        # Segundo punto (11/21): extremo de LINE y punto de alineación de TEXT justificado
+        con_segundo = tipos_arr == b'LINE'
+        for i in np.flatnonzero((codigos == 72) | (codigos == 73)).tolist():
+            e = entidad_de[i]
+            if e >= 0 and tipos[e] == b'TEXT' and valor(i) not in (b'', b'0'):
+                con_segundo[e] = True
+
+        # Envolvente por capa: X (10, 11) e Y (20, 21), convertidas en una sola llamada
+        con_envolvente = en_modelo & np.isin(tipos_arr, TIPOS_ENVOLVENTE)
+        pares = np.flatnonzero(np.isin(codigos, (10, 11, 20, 21)))
+        pares = pares[con_envolvente[entidad_de[pares]] &
+                      ((codigos[pares] % 10 == 0) | con_segundo[entidad_de[pares]])]
+        cajas = np.full((num_capas, 4), np.nan)
+        v = _numeros(_campos(buf, ini_val[pares], fin_val[pares]), float) if len(pares) else None
+        if v is not None and len(v) == len(pares):
+            capas_v = capa_de[entidad_de[pares]]
+            for eje in (0, 1):
+                en_eje = (codigos[pares] // 10) == eje + 1
+                minimo = np.full(num_capas, np.inf)
+                maximo = np.full(num_capas, -np.inf)
+                np.minimum.at(minimo, capas_v[en_eje], v[en_eje])
+                np.maximum.at(maximo, capas_v[en_eje], v[en_eje])
+                cajas[:, eje] = minimo
+                cajas[:, eje + 2] = maximo
+
+        capas = []
+        for k, nombre in enumerate(orden):
+            caja = cajas[k]
+            bbox = tuple(float(c) for c in caja) if np.all(np.isfinite(caja)) else None
+            capas.append({"nombre": _texto(nombre), "geometrias": int(geometrias[k]),
+                          "textos": int(textos[k]), "bbox": bbox})
+        return sorted(capas, key=lambda c: c["nombre"])
+
+    @staticmethod
+    def inspeccionar_zip(ruta_zip: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Una capa por .shp del ZIP, con número de registros y envolvente de la cabecera"""
+        import pyogrio
+        from core.shp_reader import SHPReader
+
+        ruta_abs = os.path.abspath(ruta_zip)
+        capas, epsgs = [], []
+        for miembro in SHPReader.listar_shp(ruta_zip):
+            info = pyogrio.read_info(f"/vsizip/{ruta_abs}/{miembro}")
+            capas.append(Inspector._capa_ogr(miembro, info))
+            epsgs.append(epsg_de_crs(info["crs"]))
+        return capas, next((e for e in epsgs if e), None)
+
+    @staticmethod
+    def inspeccionar_vector(ruta: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """FlatGeobuf/GeoJSON: metadatos de GDAL (en FlatGeobuf, solo la cabecera)"""
+        import pyogrio
+
+        info = pyogrio.read_info(ruta, force_total_bounds=True)
+        return [Inspector._capa_ogr(os.path.basename(ruta), info)], epsg_de_crs(info["crs"])
+
+    @staticmethod
+    def _capa_ogr(nombre: str, info: dict) -> Dict[str, Any]:
+        bounds = info.get("total_bounds")
+        bbox = tuple(float(b) for b in bounds) if bounds is not None and np.all(np.isfinite(bounds)) else None
+        campos = {str(c).upper() for c in info.get("fields", [])}
+        return {
+            "nombre": nombre,
+            "geometrias": int(info.get("features") or 0),
+            "textos": 0,
+            "bbox": bbox,
+            "columna_referencia": next((c for c in COLUMNAS_REFERENCIA if c.upper() in campos), None),
+        }
+
+    @staticmethod
+    def inspeccionar_kml(ruta: str) -> List[Dict[str, Any]]:
+        """
+        Placemark y polígonos contados sobre los bytes del KML (o del KML del KMZ) y
+        envolvente lon/lat de todos los <coordinates>, sin árbol XML.
+        """
+        from core.kml_reader import KMLReader
+
+        if zipfile.is_zipfile(ruta):
+            with zipfile.ZipFile(ruta) as z:
+                miembro = next((n for n in z.namelist() if n.lower().endswith('.kml')), None)
+                if miembro is None:
+                    raise Exception("No se encontró ningún archivo .kml dentro del KMZ")
+                datos = z.read(miembro)
+        else:
+            miembro = ruta
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+
+        cajas = []
+        for m in _RE_COORDINATES.finditer(datos):
+            lonlat = KMLReader._coordenadas_array(m.group(1).decode('ascii', errors='ignore'))
+            if len(lonlat):
+                cajas.append((*lonlat.min(axis=0), *lonlat.max(axis=0)))
+
+        return [{
+            "nombre": os.path.basename(miembro),
+            "geometrias": len(_RE_POLYGON_KML.findall(datos)),
+            "textos": 0,
+            "bbox": _union(cajas),
+            "placemarks": len(_RE_PLACEMARK.findall(datos)),
+        }]
+
+    @staticmethod
+    def inspeccionar_gml(ruta: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Miembros CadastralParcel/Building contados sobre los bytes, EPSG del primer
+        srsName y envolvente de todos los posList/pos (en orden x, y).
+        """
+        from core.gml_reader import GMLReader
+
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+
+        miembros = [m.group(1) for m in _RE_MIEMBRO_GML.finditer(datos)]
+        srs = _RE_SRSNAME.search(datos)
+        epsg = srs.group(1).decode() if srs else None
+        dim = 3 if b'srsDimension="3"' in datos else 2
+
+        bbox = None
+        texto = b' '.join(m.group(1) for m in _RE_POSLIST.finditer(datos))
+        if texto.strip():
+            valores = _numeros(texto, float)
+            if valores is not None and valores.size and valores.size % dim == 0:
+                xy = valores.reshape(-1, dim)[:, :2]
+                if GMLReader._ejes_lat_lon(epsg):
+                    xy = xy[:, ::-1]
+                bbox = (*(float(v) for v in xy.min(axis=0)), *(float(v) for v in xy.max(axis=0)))
+
+        return [{
+            "nombre": os.path.basename(ruta),
+            "geometrias": len(miembros),
+            "textos": 0,
+            "bbox": bbox,
+            "tipo_entidad": "BU" if miembros and miembros.count(b'Building') > len(miembros) // 2 else "CP",
+        }], epsg
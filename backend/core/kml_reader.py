@@ -1,37 +1,59 @@
 import os
 import zipfile
-import tempfile
-import xml.etree.ElementTree as ET
-import re
-from typing import List, Tuple
-from shapely.geometry import Polygon
+import warnings
+from typing import List, Optional, Tuple
+import numpy as np
 from core.parcel_model import ParcelaInfo
-from core.coordinate_transformer import CoordinateTransformer
+from core.anillos import proyectar_y_medir
+from core.ventana import BBox, corta_ventana, ventana_en_crs
+
+# Importaciones condicionales
+try:
+    from lxml import etree as ET
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    LXML_AVAILABLE = False
 
 class KMLReader:
     """Lector de archivos KML y KMZ para catastro"""
 
     @staticmethod
-    def _limpiar_namespaces(xml_string: str) -> str:
+    def _parse_coordinates(coord_text: str) -> List[Tuple[float, float]]:
         """
-        Limpia los namespaces para que sea más fácil de parsear
+        Parsea un string de coordenadas "lon,lat,alt lon,lat,alt" en KML
+        Devuelve una lista de tuplas (lon, lat)
         """
-        # Elimina xmlns="..."
-        return re.sub(r'\s+xmlns="[^"]+"', '', xml_string)
+        valores = KMLReader._coordenadas_array(coord_text)
+        return list(zip(valores[:, 0].tolist(), valores[:, 1].tolist()))
 
     @staticmethod
-    def _parse_coordinates(coord_text: str) -> List[Tuple[float, float]]:
+    def _coordenadas_array(coord_text: str) -> np.ndarray:
         """
-        Parsea un string de coordenadas "lon,lat,alt lon,lat,alt" en KML
-        Devuelve una lista de tuplas (lon, lat)
+        Igual que _parse_coordinates pero devuelve un array (N, 2) de lon/lat.
         """
-        coords = []
         if not coord_text:
-            return coords
-        
-        # Eliminar saltos de línea y obtener pares/tríos por espacio
-        parts = coord_text.strip().split()
-        for p in parts:
+            return np.empty((0, 2))
+
+        # Caso habitual: todas las tuplas con 2 o con 3 componentes -> conversión en bloque (C)
+        tuplas = coord_text.split()
+        comas = coord_text.count(',')
+        for dim in (3, 2):
+            if tuplas and comas == len(tuplas) * (dim - 1):
+                # fromstring se detiene (o falla) en el primer valor no numérico
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore", DeprecationWarning)
+                        valores = np.fromstring(coord_text.replace(',', ' '), sep=' ')
+                except ValueError:
+                    break
+                if valores.size == len(tuplas) * dim:
+                    return valores.reshape(-1, dim)[:, :2]
+                break
+
+        # Mezcla de dimensiones o valores no numéricos: tupla a tupla, descartando las inválidas
+        coords = []
+        for p in tuplas:
             components = p.split(',')
             if len(components) >= 2:
                 try:
@@ -40,120 +62,137 @@ class KMLReader:
                     coords.append((lon, lat))
                 except ValueError:
                     continue
-        return coords
+        return np.array(coords, dtype=float).reshape(-1, 2)
 
     @staticmethod
-    def leer_desde_kmz(ruta_kmz: str, epsg: str = "25830") -> List[ParcelaInfo]:
+    def leer_desde_kmz(ruta_kmz: str, epsg: str = "25830", bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
         """
-        Descomprime un KMZ y lee el archivo KML que contenga.
+        Lee el KML de un KMZ directamente desde el ZIP (sin extraerlo).
         Si la ruta ya es de un KML, lo lee directamente.
         """
-        temp_dir = ""
         is_kmz = ruta_kmz.lower().endswith('.kmz') or zipfile.is_zipfile(ruta_kmz)
-        ruta_kml_procesar = ruta_kmz
-        
-        try:
-            if is_kmz:
-                temp_dir = tempfile.mkdtemp()
-                with zipfile.ZipFile(ruta_kmz, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # Buscar un .kml (generalmente doc.kml)
-                for root, _, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.lower().endswith('.kml'):
-                            ruta_kml_procesar = os.path.join(root, file)
-                            break
-                    if ruta_kml_procesar != ruta_kmz:
-                        break
-                
-                if ruta_kml_procesar == ruta_kmz:
-                    raise Exception("No se encontró ningún archivo .kml dentro del KMZ")
-
-            return KMLReader.leer_kml(ruta_kml_procesar, epsg)
-
-        finally:
-            if temp_dir and os.path.exists(temp_dir):
-                import shutil
-                shutil.rmtree(temp_dir, ignore_errors=True)
+        if not is_kmz:
+            return KMLReader.leer_kml(ruta_kmz, epsg, bbox)
+
+        with zipfile.ZipFile(ruta_kmz, 'r') as zip_ref:
+            # El KML principal es el primero del archivo (generalmente doc.kml)
+            miembro = next((n for n in zip_ref.namelist() if n.lower().endswith('.kml')), None)
+            if miembro is None:
+                raise Exception("No se encontró ningún archivo .kml dentro del KMZ")
+
+            return KMLReader._leer_placemarks(
+                lambda: zip_ref.open(miembro), os.path.basename(miembro), epsg, bbox
+            )
 
     @staticmethod
-    def leer_kml(ruta_kml: str, epsg: str = "25830") -> List[ParcelaInfo]:
+    def leer_kml(ruta_kml: str, epsg: str = "25830", bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
         """
         Lee un archivo .kml y lo convierte a modelos ParcelaInfo proyectados al epsg indicado.
+        bbox: ventana (xmin, ymin, xmax, ymax) en ese epsg; solo se devuelven los polígonos
+        cuya envolvente la corta.
+        """
+        return KMLReader._leer_placemarks(lambda: open(ruta_kml, 'rb'), os.path.basename(ruta_kml), epsg, bbox)
+
+    @staticmethod
+    def _leer_placemarks(abrir, capa: str, epsg: str, bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
+        """
+        Recorre los Placemark en streaming (iterparse) liberando cada uno tras procesarlo,
+        con lo que la memoria no crece con el tamaño del archivo. Los namespaces se
+        ignoran ({*}). Si el XML no es UTF-8 válido se reintenta como latin-1.
         """
-        try:
-            with open(ruta_kml, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            with open(ruta_kml, 'r', encoding='latin-1') as f:
-                content = f.read()
-
-        # Limpiar namespace por simplicidad
-        clean_xml = KMLReader._limpiar_namespaces(content)
-        
-        try:
-            root = ET.fromstring(clean_xml)
-        except ET.ParseError as e:
-            print(f"Error parseando XML del KML: {e}")
-            return []
+        # La ventana se pasa a lon/lat una vez; cada polígono se compara sin proyectarlo
+        ventana = ventana_en_crs(bbox, epsg, "4326")
+        for encoding in (None, 'ISO-8859-1'):
+            try:
+                with abrir() as fuente:
+                    return KMLReader._iterar_placemarks(fuente, capa, epsg, encoding, ventana)
+            except ET.ParseError as e:
+                error = e
+        print(f"Error parseando XML del KML: {error}")
+        return []
+
+    @staticmethod
+    def _iterar_placemarks(fuente, capa: str, epsg: str, encoding=None,
+                           ventana: Optional[BBox] = None) -> List[ParcelaInfo]:
+        if LXML_AVAILABLE:
+            eventos = ET.iterparse(fuente, events=("end",), tag="{*}Placemark", encoding=encoding, huge_tree=True)
+        else:
+            parser = ET.XMLParser(encoding=encoding)
+            eventos = (
+                (ev, el) for ev, el in ET.iterparse(fuente, events=("end",), parser=parser)
+                if el.tag == "Placemark" or el.tag.endswith("}Placemark")
+            )
 
         parcelas = []
-        
-        # Buscar Placemarks
-        for idx, placemark in enumerate(root.findall(".//Placemark")):
-            # Extraer nombre
-            name_node = placemark.find("name")
-            placemark_name = name_node.text.strip() if name_node is not None and name_node.text else f"KML_FEATURE_{idx + 1}"
-            
-            # Buscar Polígonos (pueden venir directos o dentro de MultiGeometry)
-            polygons = placemark.findall(".//Polygon")
-            
-            for p_idx, poly_node in enumerate(polygons):
-                parcela = ParcelaInfo()
-                
-                # Nombre base usando el nombre de Placemark
-                if len(polygons) > 1:
-                    parcela.nombre_archivo = f"{placemark_name}_{p_idx + 1}"
-                else:
-                    parcela.nombre_archivo = placemark_name
-                    
-                # Buscar potencial Referencia Catastral (14 o 20 chars limpios) en el nombre
-                ref_limpia = parcela.nombre_archivo.replace(" ", "").upper()
-                if len(ref_limpia) in [14, 20] and ref_limpia.isalnum():
-                    parcela.referencia_catastral = ref_limpia
-                
-                # Exterior
-                outer_coords_node = poly_node.find(".//outerBoundaryIs//coordinates")
-                if outer_coords_node is not None and outer_coords_node.text:
-                    latlon_exterior = KMLReader._parse_coordinates(outer_coords_node.text)
-                    if not latlon_exterior:
-                        continue
-                    
-                    # Convertir a UTM
-                    parcela.coordenadas = CoordinateTransformer.latlon_to_utm(latlon_exterior, epsg)
-                else:
-                    continue # Sin exterior, ignoramos
-                
-                # Huecos interiores
-                inner_boundaries = poly_node.findall(".//innerBoundaryIs//coordinates")
-                for inner_node in inner_boundaries:
-                    if inner_node.text:
-                        latlon_interior = KMLReader._parse_coordinates(inner_node.text)
-                        if latlon_interior:
-                            utm_interior = CoordinateTransformer.latlon_to_utm(latlon_interior, epsg)
-                            parcela.interiores.append(utm_interior)
-                
-                # Calcular área usando Shapely (sobre las UTM proyectadas)
-                try:
-                    shapely_poly = Polygon(parcela.coordenadas, parcela.interiores)
-                    parcela.area = shapely_poly.area
-                    parcela.punto_referencia = (shapely_poly.centroid.x, shapely_poly.centroid.y)
-                except BaseException as e:
-                    print(f"Error calculando geometría Shapely: {e}")
-                    parcela.area = 0.0
-                
-                parcela.capa_origen = os.path.basename(ruta_kml)
+        anillos = []  # anillos lon/lat de cada parcela (exterior primero), sin proyectar
+
+        for idx, (_, placemark) in enumerate(eventos):
+            for parcela, anillos_parcela in KMLReader._parcelas_de_placemark(placemark, idx, capa, ventana):
                 parcelas.append(parcela)
-                
+                anillos.append(anillos_parcela)
+
+            # Liberar el Placemark y los hermanos ya procesados
+            placemark.clear()
+            if LXML_AVAILABLE:
+                while placemark.getprevious() is not None:
+                    del placemark.getparent()[0]
+
+        proyectar_y_medir(parcelas, anillos, "4326", epsg)
+        return parcelas
+
+    @staticmethod
+    def _parcelas_de_placemark(placemark, idx: int, capa: str,
+                               ventana: Optional[BBox] = None) -> List[Tuple[ParcelaInfo, List[np.ndarray]]]:
+        """
+        Parcelas de un Placemark con sus anillos lon/lat (exterior primero);
+        la proyección y el área se calculan después para todo el archivo.
+        Los polígonos cuyo exterior no corta la ventana (lon/lat) se descartan antes
+        de leer sus huecos.
+        """
+        parcelas = []
+
+        # Extraer nombre
+        name_node = placemark.find("{*}name")
+        placemark_name = name_node.text.strip() if name_node is not None and name_node.text else f"KML_FEATURE_{idx + 1}"
+
+        # Buscar Polígonos (pueden venir directos o dentro de MultiGeometry)
+        polygons = placemark.findall(".//{*}Polygon")
+
+        for p_idx, poly_node in enumerate(polygons):
+            # Exterior
+            outer_coords_node = poly_node.find(".//{*}outerBoundaryIs//{*}coordinates")
+            if outer_coords_node is not None and outer_coords_node.text:
+                latlon_exterior = KMLReader._coordenadas_array(outer_coords_node.text)
+                if not len(latlon_exterior):
+                    continue
+            else:
+                continue # Sin exterior, ignoramos
+            if not corta_ventana(latlon_exterior, ventana):
+                continue # Fuera de la ventana
+            anillos = [latlon_exterior]
+
+            parcela = ParcelaInfo()
+
+            # Nombre base usando el nombre de Placemark
+            if len(polygons) > 1:
+                parcela.nombre_archivo = f"{placemark_name}_{p_idx + 1}"
+            else:
+                parcela.nombre_archivo = placemark_name
+
+            # Buscar potencial Referencia Catastral (14 o 20 chars limpios) en el nombre
+            ref_limpia = parcela.nombre_archivo.replace(" ", "").upper()
+            if len(ref_limpia) in [14, 20] and ref_limpia.isalnum():
+                parcela.referencia_catastral = ref_limpia
+
+            # Huecos interiores
+            inner_boundaries = poly_node.findall(".//{*}innerBoundaryIs//{*}coordinates")
+            for inner_node in inner_boundaries:
+                if inner_node.text:
+                    latlon_interior = KMLReader._coordenadas_array(inner_node.text)
+                    if len(latlon_interior):
+                        anillos.append(latlon_interior)
+
+            parcela.capa_origen = capa
+            parcelas.append((parcela, anillos))
+
         return parcelas
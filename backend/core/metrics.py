@@ -0,0 +1,161 @@
+"""
+Métricas Prometheus del backend (/metrics)
+- Tiempos por etapa de /analyze y formato de entrada
+- Parcelas y vértices por petición
+- Latencia y errores de las llamadas al Catastro por método OVC
+- Aciertos de caché (leídos de las propias cachés al hacer scrape)
+- Duración de las exportaciones por formato
+Si prometheus_client no está instalado todo es no-op y /metrics responde 503.
+"""
+
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from . import profiling
+
+# Importaciones condicionales
+try:
+    from prometheus_client import (
+        Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+    )
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricaNula:
+    """Sustituto sin efecto cuando prometheus_client no está disponible"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, valor):
+        pass
+
+    def inc(self, valor=1):
+        pass
+
+
+_BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_BUCKETS_PARCELAS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_BUCKETS_VERTICES = (10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+
+if PROMETHEUS_AVAILABLE:
+    ANALYZE_ETAPA_SEGUNDOS = Histogram(
+        "catastro_analyze_etapa_segundos", "Duración de cada etapa de /analyze",
+        ["etapa", "formato"], buckets=_BUCKETS_SEGUNDOS,
+    )
+    ANALYZE_PARCELAS = Histogram(
+        "catastro_analyze_parcelas", "Parcelas devueltas por petición de /analyze",
+        ["formato"], buckets=_BUCKETS_PARCELAS,
+    )
+    ANALYZE_VERTICES = Histogram(
+        "catastro_analyze_vertices", "Vértices (exteriores + huecos) por petición de /analyze",
+        ["formato"], buckets=_BUCKETS_VERTICES,
+    )
+    UPSTREAM_SEGUNDOS = Histogram(
+        "catastro_upstream_segundos", "Latencia de cada intento HTTP al Catastro",
+        ["metodo"], buckets=_BUCKETS_SEGUNDOS,
+    )
+    UPSTREAM_ERRORES = Counter(
+        "catastro_upstream_errores", "Errores en llamadas al Catastro",
+        ["metodo", "tipo"],
+    )
+    EXPORTACION_SEGUNDOS = Histogram(
+        "catastro_exportacion_segundos", "Duración de las exportaciones por formato",
+        ["formato"], buckets=_BUCKETS_SEGUNDOS,
+    )
+else:
+    ANALYZE_ETAPA_SEGUNDOS = ANALYZE_PARCELAS = ANALYZE_VERTICES = _MetricaNula()
+    UPSTREAM_SEGUNDOS = UPSTREAM_ERRORES = EXPORTACION_SEGUNDOS = _MetricaNula()
+
+
+@contextmanager
+def etapa(nombre: str, formato: str):
+    """Mide una etapa de /analyze: with etapa("lectura", "dxf"): ..."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        ANALYZE_ETAPA_SEGUNDOS.labels(nombre, formato).observe(segundos)
+        profiling.registrar_etapa(nombre, segundos)
+
+
+def medir_exportacion(formato: str):
+    """Decorador para endpoints de exportación (async); mide también las que fallan"""
+    def decorador(fn):
+        @functools.wraps(fn)
+        async def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                segundos = time.perf_counter() - inicio
+                EXPORTACION_SEGUNDOS.labels(formato).observe(segundos)
+                profiling.registrar_etapa(f"exportacion_{formato}", segundos)
+                profiling.anotar(parcelas=len(getattr(kwargs.get("request"), "parcelas", None) or []))
+        return envoltura
+    return decorador
+
+
+class ColectorCaches:
+    """
+    Expone en cada scrape las estadísticas que ya llevan las cachés
+    ({"aciertos", "fallos", ...}) sin acoplarlas a prometheus_client.
+    """
+
+    def __init__(self, fuentes: Dict[str, Callable[[], Dict[str, int]]]):
+        self.fuentes = fuentes
+
+    def collect(self):
+        consultas = CounterMetricFamily(
+            "catastro_cache_consultas", "Consultas a cachés internas por resultado", labels=["cache", "resultado"]
+        )
+        ratio = GaugeMetricFamily(
+            "catastro_cache_ratio_aciertos", "Ratio de aciertos de cada caché", labels=["cache"]
+        )
+        for nombre, stats_fn in self.fuentes.items():
+            stats = stats_fn()
+            aciertos = stats.get("aciertos", 0) + stats.get("aciertos_vecinos", 0) + stats.get("compartidas", 0)
+            fallos = stats.get("fallos", 0) + stats.get("ejecutadas", 0)
+            consultas.add_metric([nombre, "acierto"], aciertos)
+            consultas.add_metric([nombre, "fallo"], fallos)
+            ratio.add_metric([nombre], aciertos / (aciertos + fallos) if aciertos + fallos else 0.0)
+        yield consultas
+        yield ratio
+
+
+_colector_caches = None
+
+
+def registrar_caches(fuentes: Dict[str, Callable[[], Dict[str, int]]]) -> None:
+    """Registra (o sustituye, si se recarga la app) el colector de cachés"""
+    global _colector_caches
+    if not PROMETHEUS_AVAILABLE:
+        return
+    if _colector_caches is not None:
+        REGISTRY.unregister(_colector_caches)
+    _colector_caches = ColectorCaches(fuentes)
+    REGISTRY.register(_colector_caches)
+
+
+def exportar() -> bytes:
+    """
+    Texto de exposición de Prometheus. Con varios workers (gunicorn) definir
+    PROMETHEUS_MULTIPROC_DIR para agregar los histogramas de todos los procesos
+    (las métricas de caché siguen siendo las del worker que atiende el scrape).
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        if _colector_caches is not None:
+            registro.register(_colector_caches)
+        return generate_latest(registro)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,91 @@
+"""
+Poligonización de linderos dibujados con segmentos sueltos (LINE, ARC, polilíneas abiertas)
+Ajuste de extremos con un hash espacial, nodado y polygonize de shapely, todo en bloque:
+escala a planos de topógrafo con cientos de miles de segmentos.
+"""
+
+import math
+import numpy as np
+import shapely
+
+# Vecindad 3x3 de una celda del hash (sin la propia)
+_VECINOS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def segmentos_de_arco(cx: float, cy: float, radio: float, inicio_grados: float, fin_grados: float,
+                      flecha: float = 0.01) -> np.ndarray:
+    """
+    ARC de DXF (antihorario de inicio a fin) como segmentos (N, 2, 2), con los tramos
+    necesarios para que la flecha de cada cuerda no supere 'flecha'.
+    """
+    barrido = (fin_grados - inicio_grados) % 360.0 or 360.0
+    if radio <= 0:
+        return np.empty((0, 2, 2))
+    paso = 2.0 * math.degrees(math.acos(max(-1.0, 1.0 - flecha / radio)))
+    n = max(1, math.ceil(barrido / max(paso, 1e-6)))
+    angulos = np.radians(inicio_grados + np.linspace(0.0, barrido, n + 1))
+    puntos = np.column_stack((cx + radio * np.cos(angulos), cy + radio * np.sin(angulos)))
+    return np.stack((puntos[:-1], puntos[1:]), axis=1)
+
+
+def agrupar_extremos(xy: np.ndarray, tolerancia: float):
+    """
+    Grupos de puntos coincidentes con un hash espacial de celdas de lado 'tolerancia':
+    se unen los puntos de una misma celda y de celdas contiguas (3x3), propagando la
+    etiqueta mínima hasta que no cambia. Todo par a <= tolerancia acaba en el mismo
+    grupo (y ninguno a más de ~2,8 veces la tolerancia, salvo por encadenamiento).
+    Devuelve (representante de cada grupo, grupo de cada punto).
+    """
+    if not len(xy) or tolerancia <= 0:
+        unicos, grupo = np.unique(xy, axis=0, return_inverse=True)
+        return unicos, grupo.reshape(-1)
+    celdas = np.floor((xy - xy.min(axis=0)) / tolerancia).astype(np.int64) + 1
+    ancho = int(celdas[:, 1].max()) + 2
+    claves = celdas[:, 0] * ancho + celdas[:, 1]
+
+    unicas, primero, inversa = np.unique(claves, return_index=True, return_inverse=True)
+    etiqueta = np.arange(len(unicas))
+
+    # Pares de celdas ocupadas contiguas
+    origen, destino = [], []
+    for dx, dy in _VECINOS:
+        vecina = unicas + dx * ancho + dy
+        pos = np.minimum(np.searchsorted(unicas, vecina), len(unicas) - 1)
+        ocupada = unicas[pos] == vecina
+        origen.append(np.flatnonzero(ocupada))
+        destino.append(pos[ocupada])
+    origen, destino = np.concatenate(origen), np.concatenate(destino)
+
+    while len(origen):
+        nueva = etiqueta.copy()
+        np.minimum.at(nueva, origen, etiqueta[destino])
+        nueva = nueva[nueva]  # salto de puntero: converge en pocas vueltas
+        if np.array_equal(nueva, etiqueta):
+            break
+        etiqueta = nueva
+
+    return xy[primero], etiqueta[inversa.reshape(-1)]
+
+
+def poligonizar(segmentos: np.ndarray, tolerancia: float = 0.01) -> np.ndarray:
+    """
+    Polígonos (array de shapely.Polygon) de las caras que cierran los segmentos (N, 2, 2):
+    extremos ajustados a la tolerancia, sin segmentos nulos ni repetidos (en cualquier
+    sentido), nodados en los cruces y poligonizados de una vez.
+    """
+    if not len(segmentos):
+        return np.empty(0, dtype=object)
+
+    representante, grupo = agrupar_extremos(np.asarray(segmentos, dtype=float).reshape(-1, 2), tolerancia)
+    # Segmento = par de grupos (menor, mayor): fuera los nulos y los repetidos
+    a, b = np.minimum(grupo[0::2], grupo[1::2]), np.maximum(grupo[0::2], grupo[1::2])
+    a, b = a[a != b], b[a != b]
+    _, unicos = np.unique(a * len(representante) + b, return_index=True)
+    a, b = a[unicos], b[unicos]
+    if not len(a):
+        return np.empty(0, dtype=object)
+
+    lineas = shapely.linestrings(np.stack((representante[a], representante[b]), axis=1))
+    nodado = shapely.node(shapely.multilinestrings(lineas))
+    caras = shapely.get_parts(shapely.polygonize([nodado]))
+    return caras[shapely.area(caras) > 0]
@@ -0,0 +1,229 @@
+"""
+Almacén de ponencias de valores por municipio
+Un archivo JSON por municipio en data/ponencias/ (MBC, MBR, RM, GB, tipos IBI,
+polígonos y zonas de valor) más un índice compacto (index.json).
+Los municipios se cargan bajo demanda y se mantienen en una LRU.
+"""
+
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+DIRECTORIO_PONENCIAS = os.getenv(
+    "PONENCIAS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ponencias")
+)
+ARCHIVO_INDICE = "index.json"
+
+
+def normalizar_nombre(texto: str) -> str:
+    """Minúsculas y sin acentos (para comparar nombres de municipio)"""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn').lower()
+
+
+def _congelar(valor):
+    """Convierte dicts anidados en MappingProxyType de solo lectura"""
+    if isinstance(valor, dict):
+        return MappingProxyType({k: _congelar(v) for k, v in valor.items()})
+    return valor
+
+
+@dataclass(frozen=True, eq=False)
+class MunicipioPonencia:
+    """Datos de ponencia de un municipio, inmutables"""
+    municipio: str
+    provincia: str
+    anio_ponencia: int
+    mbc: float
+    mbr: float
+    rm: float
+    gb: float
+    mbr_rustico: float
+    coef_ibi_rustica: float
+    tipo_ibi: Mapping[str, float]
+    poligonos: Mapping[str, Mapping[str, Any]]
+    zonas_valor: Mapping[str, Mapping[str, float]]
+
+    @staticmethod
+    def compilar(data: Dict[str, Any]) -> "MunicipioPonencia":
+        return MunicipioPonencia(
+            municipio=data["municipio"],
+            provincia=data["provincia"],
+            anio_ponencia=int(data.get("anio_ponencia", 2010)),
+            mbc=float(data["mbc"]),
+            mbr=float(data["mbr"]),
+            rm=float(data["rm"]),
+            gb=float(data.get("gb", 1.0)),
+            mbr_rustico=float(data.get("mbr_rustico", 37.80)),
+            coef_ibi_rustica=float(data["coef_ibi_rustica"]),
+            tipo_ibi=_congelar(data["tipo_ibi"]),
+            poligonos=_congelar(data.get("poligonos", {})),
+            zonas_valor=_congelar(data.get("zonas_valor", {})),
+        )
+
+    def con_overrides(self, params: Dict[str, Any]) -> "MunicipioPonencia":
+        """
+        Aplica los parámetros custom_* de la petición como una capa encima del modelo.
+        Solo se crea un objeto nuevo (copia superficial) si hay algo que sobrescribir;
+        las tablas de zonas y polígonos se comparten.
+        """
+        cambios = {}
+        if params.get("custom_mbc"): cambios["mbc"] = float(params["custom_mbc"])
+        if params.get("custom_mbr"): cambios["mbr"] = float(params["custom_mbr"])
+        if params.get("custom_rm"): cambios["rm"] = float(params["custom_rm"])
+        if params.get("custom_anio_ponencia"): cambios["anio_ponencia"] = int(params["custom_anio_ponencia"])
+
+        tipos = {}
+        if params.get("custom_tipo_urbano"): tipos["urbano"] = float(params["custom_tipo_urbano"])
+        if params.get("custom_tipo_rustico"): tipos["rustico"] = float(params["custom_tipo_rustico"])
+        if tipos:
+            cambios["tipo_ibi"] = MappingProxyType({**self.tipo_ibi, **tipos})
+
+        return replace(self, **cambios) if cambios else self
+
+
+class PonenciaStore:
+    """
+    Acceso perezoso a las ponencias en disco.
+    Listar municipios solo lee el índice; los datos de cada municipio se
+    leen la primera vez que se piden y quedan en una LRU acotada.
+    """
+
+    def __init__(self, directorio: str = DIRECTORIO_PONENCIAS, max_cargados: int = 128):
+        self.directorio = directorio
+        self.max_cargados = max_cargados
+        self._indice: Optional[Dict[str, Dict[str, Any]]] = None
+        self._indice_normalizado: Dict[str, str] = {}
+        self._cargados: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Índice ---
+
+    def _leer_indice(self) -> Dict[str, Dict[str, Any]]:
+        if self._indice is None:
+            ruta = os.path.join(self.directorio, ARCHIVO_INDICE)
+            if os.path.exists(ruta):
+                with open(ruta, encoding="utf-8") as f:
+                    indice = json.load(f)["municipios"]
+            else:
+                indice = PonenciaStore.construir_indice(self.directorio)
+            normalizado = {}
+            for nombre in reversed(list(indice)):
+                normalizado[normalizar_nombre(nombre)] = nombre
+            self._indice_normalizado = normalizado
+            self._indice = indice
+        return self._indice
+
+    @staticmethod
+    def construir_indice(directorio: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Recorre los JSON de ponencia y devuelve el índice {nombre: {archivo, provincia, anio_ponencia}}.
+        Los alias ("alias": [...] en el JSON) apuntan al mismo archivo.
+        El orden es el del campo "orden" de cada JSON (el que se muestra en
+        /catastro/municipios-disponibles); los que no lo tienen van al final por archivo.
+        """
+        ponencias = []
+        for archivo in os.listdir(directorio):
+            if not archivo.endswith(".json") or archivo == ARCHIVO_INDICE:
+                continue
+            with open(os.path.join(directorio, archivo), encoding="utf-8") as f:
+                ponencias.append((archivo, json.load(f)))
+        ponencias.sort(key=lambda p: (p[1].get("orden", float("inf")), p[0]))
+
+        indice = {}
+        for archivo, data in ponencias:
+            entrada = {
+                "archivo": archivo,
+                "provincia": data.get("provincia", ""),
+                "anio_ponencia": data.get("anio_ponencia"),
+            }
+            for nombre in [data["municipio"]] + list(data.get("alias", [])):
+                indice[nombre] = entrada
+        return indice
+
+    @staticmethod
+    def escribir_indice(directorio: str = DIRECTORIO_PONENCIAS) -> str:
+        """Regenera index.json (ejecutar al añadir o modificar ponencias)"""
+        indice = PonenciaStore.construir_indice(directorio)
+        ruta = os.path.join(directorio, ARCHIVO_INDICE)
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "municipios": indice}, f, ensure_ascii=False, separators=(",", ":"))
+        return ruta
+
+    def nombres(self) -> List[str]:
+        """Municipios disponibles en el orden del índice (sin cargar ninguno)"""
+        return list(self._leer_indice())
+
+    def resolver(self, nombre: str) -> Optional[str]:
+        """Nombre exacto del índice que corresponde a 'nombre' (ignorando mayúsculas y acentos)"""
+        if not nombre:
+            return None
+        indice = self._leer_indice()
+        if nombre in indice:
+            return nombre
+        return self._indice_normalizado.get(normalizar_nombre(nombre))
+
+    def __contains__(self, nombre: str) -> bool:
+        return nombre in self._leer_indice()
+
+    # --- Carga perezosa ---
+
+    def _cargar(self, nombre: str) -> tuple:
+        archivo = self._leer_indice()[nombre]["archivo"]
+        with self._lock:
+            if archivo in self._cargados:
+                self._cargados.move_to_end(archivo)
+                return self._cargados[archivo]
+
+        with open(os.path.join(self.directorio, archivo), encoding="utf-8") as f:
+            data = json.load(f)
+        data.pop("alias", None)
+        data.pop("notas", None)
+        data.pop("orden", None)
+        entrada = (_congelar(data), MunicipioPonencia.compilar(data))
+
+        with self._lock:
+            self._cargados[archivo] = entrada
+            while len(self._cargados) > self.max_cargados:
+                self._cargados.popitem(last=False)
+        return entrada
+
+    def datos(self, nombre: str) -> Mapping[str, Any]:
+        """Datos brutos (solo lectura) de la ponencia; KeyError si no existe"""
+        return self._cargar(nombre)[0]
+
+    def obtener(self, nombre: str) -> MunicipioPonencia:
+        """Modelo compilado de la ponencia; KeyError si no existe"""
+        return self._cargar(nombre)[1]
+
+
+class VistaPonencias(Mapping):
+    """Mapping de solo lectura sobre el almacén (las claves salen del índice)"""
+
+    def __init__(self, store: PonenciaStore, compilado: bool):
+        self._store = store
+        self._compilado = compilado
+
+    def __getitem__(self, nombre):
+        if nombre not in self._store:
+            raise KeyError(nombre)
+        return self._store.obtener(nombre) if self._compilado else self._store.datos(nombre)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.nombres())
+
+    def __len__(self) -> int:
+        return len(self._store.nombres())
+
+
+# Instancia compartida por el proceso
+ponencias = PonenciaStore(max_cargados=int(os.getenv("PONENCIAS_CACHE_MAX", "128")))
+
+
+if __name__ == "__main__":
+    print(f"Índice escrito en {PonenciaStore.escribir_indice()}")
@@ -0,0 +1,208 @@
+"""
+Perfilado bajo demanda de peticiones concretas
+Con PROFILING_TOKEN definido, una petición a /analyze, /generate-* o
+/catastro/calcular-ibi que lleve la cabecera X-Profile-Token se ejecuta bajo
+cProfile y tracemalloc. El informe (árbol de llamadas, tiempos por etapa,
+recuento de entidades, llamadas al Catastro y pico de memoria) se guarda en
+PROFILING_DIR y su id se devuelve en la cabecera X-Profile-Id.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "catastro-perfiles"))
+PROFILING_MAX_INFORMES = int(os.getenv("PROFILING_MAX_INFORMES", "50"))
+
+CABECERA_TOKEN = "x-profile-token"
+CABECERA_ID = "x-profile-id"
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class SesionPerfil:
+    """Datos que el código de la petición va dejando mientras se perfila"""
+    id: str
+    etapas: Dict[str, float] = field(default_factory=dict)
+    datos: Dict[str, Any] = field(default_factory=dict)
+    upstream: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+_sesion: ContextVar[Optional[SesionPerfil]] = ContextVar("sesion_perfil", default=None)
+
+# cProfile y tracemalloc son globales: una sola petición perfilada a la vez
+_lock = threading.Lock()
+
+
+def registrar_etapa(nombre: str, segundos: float) -> None:
+    sesion = _sesion.get()
+    if sesion is not None:
+        sesion.etapas[nombre] = sesion.etapas.get(nombre, 0.0) + segundos
+
+
+def anotar(**datos: Any) -> None:
+    """Recuentos de la petición (parcelas, vértices...); sin efecto si no se está perfilando"""
+    sesion = _sesion.get()
+    if sesion is not None:
+        sesion.datos.update(datos)
+
+
+def registrar_llamada(endpoint: str, segundos: float) -> None:
+    sesion = _sesion.get()
+    if sesion is not None:
+        acumulado = sesion.upstream.setdefault(endpoint, {"llamadas": 0, "segundos": 0.0})
+        acumulado["llamadas"] += 1
+        acumulado["segundos"] += segundos
+
+
+def token_valido(token: Optional[str]) -> bool:
+    return bool(PROFILING_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def ruta_perfilable(ruta: str) -> bool:
+    return ruta == "/analyze" or ruta.startswith("/generate-") or ruta == "/catastro/calcular-ibi"
+
+
+def ruta_informe(id_informe: str, extension: str = "json") -> Optional[str]:
+    """Ruta del informe guardado (None si el id no es válido o no existe)"""
+    if not _ID_VALIDO.match(id_informe):
+        return None
+    ruta = os.path.join(PROFILING_DIR, f"{id_informe}.{extension}")
+    return ruta if os.path.exists(ruta) else None
+
+
+def leer_informe(id_informe: str) -> Optional[Dict[str, Any]]:
+    ruta = ruta_informe(id_informe)
+    if ruta is None:
+        return None
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI. cProfile mide el hilo del bucle de eventos, así que los
+    endpoints perfilables deben ser 'async def'; si llegan otras peticiones a
+    la vez, su tiempo también aparece en el informe.
+    """
+
+    def __init__(self, app, lineas_perfil: int = 60):
+        self.app = app
+        self.lineas_perfil = lineas_perfil
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_TOKEN or not ruta_perfilable(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        cabeceras = dict(scope.get("headers") or [])
+        token = cabeceras.get(CABECERA_TOKEN.encode(), b"").decode("latin-1")
+        if not token_valido(token):
+            await self.app(scope, receive, send)
+            return
+        if not _lock.acquire(blocking=False):
+            print(f"DEBUG: Perfilado ocupado, {scope['path']} se atiende sin perfilar")
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self._perfilar(scope, receive, send)
+        finally:
+            _lock.release()
+
+    async def _perfilar(self, scope, receive, send):
+        sesion = SesionPerfil(id=uuid.uuid4().hex)
+        estado_http = [500]
+
+        async def send_con_id(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado_http[0] = mensaje["status"]
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (CABECERA_ID.encode(), sesion.id.encode())
+                ]
+            await send(mensaje)
+
+        tracemalloc_propio = not tracemalloc.is_tracing()
+        if tracemalloc_propio:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        perfil = cProfile.Profile()
+        testigo = _sesion.set(sesion)
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            perfil.disable()
+            duracion = time.perf_counter() - inicio
+            _sesion.reset(testigo)
+            pico = tracemalloc.get_traced_memory()[1]
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            if tracemalloc_propio:
+                tracemalloc.stop()
+            self._guardar(sesion, perfil, scope, estado_http[0], duracion, pico - memoria_inicial, top)
+
+    def _guardar(self, sesion: SesionPerfil, perfil: cProfile.Profile, scope, estado_http: int,
+                 duracion: float, pico_bytes: int, top: List[tracemalloc.Statistic]) -> None:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        base = os.path.join(PROFILING_DIR, sesion.id)
+        perfil.dump_stats(base + ".prof")
+
+        texto = io.StringIO()
+        stats = pstats.Stats(perfil, stream=texto)
+        stats.sort_stats("cumulative").print_stats(self.lineas_perfil)
+        stats.print_callees(self.lineas_perfil // 3)
+
+        informe = {
+            "id": sesion.id,
+            "ruta": scope["path"],
+            "metodo": scope.get("method"),
+            "estado_http": estado_http,
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "duracion_s": round(duracion, 4),
+            "etapas_s": {k: round(v, 4) for k, v in sesion.etapas.items()},
+            "entidades": sesion.datos,
+            "upstream": {k: {"llamadas": v["llamadas"], "segundos": round(v["segundos"], 4)}
+                         for k, v in sesion.upstream.items()},
+            "memoria_pico_mb": round(pico_bytes / 1048576, 2),
+            "asignaciones_top": [
+                {"linea": str(s.traceback), "kb": round(s.size / 1024, 1), "bloques": s.count} for s in top
+            ],
+            "perfil": texto.getvalue(),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=1)
+        print(f"DEBUG: Perfil {sesion.id} de {scope['path']}: {duracion:.2f} s, pico {informe['memoria_pico_mb']} MB")
+        _limpiar_informes()
+
+
+def _limpiar_informes() -> None:
+    """Conserva solo los PROFILING_MAX_INFORMES informes más recientes"""
+    try:
+        informes = sorted(
+            (os.path.join(PROFILING_DIR, n) for n in os.listdir(PROFILING_DIR) if n.endswith(".json")),
+            key=os.path.getmtime,
+        )
+    except OSError:
+        return
+    for ruta in informes[:-PROFILING_MAX_INFORMES or None]:
+        for extension in (".json", ".prof"):
+            try:
+                os.remove(ruta[:-5] + extension)
+            except OSError:
+                pass
@@ -1,108 +1,123 @@
-
 import os
+import atexit
+import threading
 import zipfile
-import tempfile
-import geopandas as gpd
-from typing import List
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
 from core.parcel_model import ParcelaInfo
+from core.vector_reader import VectorReader
+from core.ventana import BBox
+
+# Procesos para ZIPs con varios .shp (uno por tarea). El pool es uno por proceso de la API:
+# con varios workers de gunicorn conviene bajarlo para no sobresuscribir la CPU
+SHP_MAX_WORKERS = int(os.getenv("SHP_MAX_WORKERS", str(os.cpu_count() or 1)))
+# Tamaño total de los .shp (descomprimidos) a partir del cual compensa repartirlos en procesos;
+# por debajo se leen en serie (arrancar y enviar tareas al pool cuesta más que leerlos)
+SHP_MIN_BYTES_PARALELO = int(os.getenv("SHP_MIN_BYTES_PARALELO", str(32 * 1024 * 1024)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _contexto_procesos():
+    """
+    forkserver donde exista (no hereda hilos ni locks del worker de la API) con el
+    lector precargado; spawn en el resto (Windows).
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["core.shp_reader"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _obtener_pool() -> ProcessPoolExecutor:
+    """Pool de lectura compartido por todas las peticiones del proceso (se crea al primer uso)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=SHP_MAX_WORKERS, mp_context=_contexto_procesos())
+        return _pool
+
+
+def _descartar_pool() -> None:
+    """Cierra el pool (caído o al salir); el siguiente uso crea otro"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_descartar_pool)
 
 class SHPReader:
     """Lector de archivos Shapefile para catastro"""
 
     @staticmethod
-    def leer_desde_zip(ruta_zip: str) -> List[ParcelaInfo]:
+    def listar_shp(ruta_zip: str) -> List[str]:
         """
-        Descomprime un ZIP y lee los shapefiles que contenga.
+        Rutas de los .shp dentro del ZIP, ordenadas, sin extraerlo.
         """
-        temp_dir = tempfile.mkdtemp()
-        try:
-            with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Buscar archivos .shp
-            shp_files = []
-            for root, _, files in os.walk(temp_dir):
-                for file in files:
-                    if file.lower().endswith('.shp'):
-                        shp_files.append(os.path.join(root, file))
-            
-            if not shp_files:
-                raise Exception("No se encontró ningún archivo .shp dentro del ZIP")
-            
-            all_parcelas = []
-            for shp_path in shp_files:
-                all_parcelas.extend(SHPReader.leer_shp(shp_path))
-            
-            return all_parcelas
-        finally:
-            # La limpieza del temp_dir se suele hacer después de procesar
-            # En este caso, como leer_shp carga en memoria, podemos borrar ya
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
+            return sorted(
+                n for n in zip_ref.namelist()
+                if n.lower().endswith('.shp') and not n.startswith('__MACOSX/')
+            )
+
+    @staticmethod
+    def leer_desde_zip(ruta_zip: str, bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
+        """
+        Lee los shapefiles de un ZIP directamente desde el archivo (GDAL /vsizip/).
+        Con varios .shp que suman al menos SHP_MIN_BYTES_PARALELO, cada uno se lee en un
+        proceso del pool compartido (hasta SHP_MAX_WORKERS); las capas se unen en el orden
+        de listar_shp y capa_origen es la ruta dentro del ZIP.
+        bbox: ventana (xmin, ymin, xmax, ymax) en las coordenadas de los shapefiles.
+        """
+        miembros = SHPReader.listar_shp(ruta_zip)
+        if not miembros:
+            raise Exception("No se encontró ningún archivo .shp dentro del ZIP")
+        with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
+            total_bytes = sum(zip_ref.getinfo(m).file_size for m in miembros)
+
+        ruta_abs = os.path.abspath(ruta_zip)
+        rutas = [f"/vsizip/{ruta_abs}/{m}" for m in miembros]
+
+        capas = None
+        if len(rutas) > 1 and SHP_MAX_WORKERS > 1 and total_bytes >= SHP_MIN_BYTES_PARALELO:
+            try:
+                capas = list(_obtener_pool().map(SHPReader.leer_shp, rutas, miembros, [bbox] * len(rutas)))
+                print(f"DEBUG: {len(rutas)} shapefiles leídos en paralelo ({total_bytes} bytes)")
+            except (BrokenProcessPool, OSError) as e:
+                print(f"WARNING: pool de lectura SHP caído ({e}), leyendo en serie")
+                _descartar_pool()
+        if capas is None:
+            capas = [SHPReader.leer_shp(ruta, miembro, bbox) for ruta, miembro in zip(rutas, miembros)]
+
+        all_parcelas = []
+        for parcelas in capas:
+            all_parcelas.extend(parcelas)
+
+        return all_parcelas
 
     @staticmethod
-    def leer_shp(ruta_shp: str) -> List[ParcelaInfo]:
+    def leer_shp(ruta_shp: str, capa: Optional[str] = None, bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
         """
-        Lee un archivo .shp y lo convierte a ParcelaInfo.
+        Lee un .shp (ruta normal o /vsizip/) y lo convierte a ParcelaInfo.
+        'capa' es el origen que se anota en cada parcela (por defecto, el nombre del archivo).
+        Lectura Arrow con pyogrio y decodificación vectorizada con shapely:
+        sin GeoDataFrame ni iteración por filas.
+        Con bbox, GDAL descarta cada registro por la envolvente de su cabecera (o por el
+        índice .qix si lo hay) sin decodificar la geometría.
         """
         try:
-            gdf = gpd.read_file(ruta_shp)
-            
-            # Asegurar que sea geometría de polígono
-            gdf = gdf[gdf.geometry.type.isin(['Polygon', 'MultiPolygon'])]
-            
-            parcelas = []
-            for idx, row in gdf.iterrows():
-                # Extraer geometría
-                geom = row.geometry
-                
-                # Manejar Polygons y MultiPolygons
-                if geom.geom_type == 'Polygon':
-                    polys = [geom]
-                else: # MultiPolygon
-                    polys = list(geom.geoms)
-                
-                for p_idx, poly in enumerate(polys):
-                    parcela = ParcelaInfo()
-                    
-                    # Coordenadas exterior
-                    parcela.coordenadas = list(poly.exterior.coords)
-                    
-                    # Interiores (huecos)
-                    parcela.interiores = [list(interior.coords) for interior in poly.interiors]
-                    
-                    # Atributos (intentar buscar referencia o id)
-                    # Prioridad: 'REF_CAT', 'REFCAT', 'ID', 'LABEL'
-                    referencia = ""
-                    for col in ['REF_CAT', 'REFCAT', 'ID', 'LABEL', 'identifica', 'referencia']:
-                        matched_col = next((c for c in gdf.columns if c.upper() == col.upper()), None)
-                        if matched_col and row[matched_col]:
-                            referencia = str(row[matched_col])
-                            break
-                    
-                    if referencia:
-                        # Si es multi-polígono, añadir sufijo
-                        if len(polys) > 1:
-                            referencia = f"{referencia}.{p_idx + 1}"
-                        
-                        # Si parece una RC válida (14 o 20)
-                        ref_limpia = referencia.replace(" ", "").upper()
-                        if len(ref_limpia) in [14, 20] and ref_limpia.isalnum():
-                            parcela.referencia_catastral = ref_limpia
-                            parcela.nombre_archivo = ref_limpia
-                        else:
-                            parcela.nombre_archivo = referencia
-                    else:
-                        parcela.nombre_archivo = f"SHP_FEATURE_{idx + 1}"
-                    
-                    # Área y centroide
-                    parcela.area = poly.area
-                    parcela.punto_referencia = (poly.centroid.x, poly.centroid.y)
-                    parcela.capa_origen = os.path.basename(ruta_shp)
-                    
-                    parcelas.append(parcela)
-            
-            return parcelas
+            import pyogrio
+
+            # FIDs: las entidades sin referencia se numeran igual con y sin ventana
+            meta, tabla = pyogrio.read_arrow(ruta_shp, bbox=bbox, return_fids=True)
+            return VectorReader.parcelas_desde_arrow(meta, tabla, capa or os.path.basename(ruta_shp), "SHP_FEATURE")
         except Exception as e:
             print(f"Error leyendo SHP {ruta_shp}: {e}")
             return []
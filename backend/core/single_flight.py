@@ -0,0 +1,158 @@
+"""
+Coalescencia de peticiones idénticas simultáneas ("single flight")
+Si llegan varias consultas iguales a la vez, solo la primera llama al
+Catastro y el resto espera y recibe el mismo resultado (o la misma excepción).
+- SingleFlight: dentro del proceso (hilos)
+- FileSingleFlight: entre workers del mismo servidor, con un lock de archivo
+  (fcntl) y el resultado compartido a través de disco
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+# Importaciones condicionales (fcntl no existe en Windows)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+
+class _Vuelo:
+    __slots__ = ("evento", "resultado", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Una sola ejecución en vuelo por clave dentro del proceso"""
+
+    def __init__(self):
+        self._vuelos: Dict[Hashable, _Vuelo] = {}
+        self._lock = threading.Lock()
+        self.ejecutadas = 0
+        self.compartidas = 0
+
+    def do(self, clave: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = _Vuelo()
+                self._vuelos[clave] = vuelo
+                self.ejecutadas += 1
+            else:
+                self.compartidas += 1
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = fn()
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.evento.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"ejecutadas": self.ejecutadas, "compartidas": self.compartidas, "en_vuelo": len(self._vuelos)}
+
+
+class ErrorCompartido(Exception):
+    """Error del worker que hizo la llamada, recibido por los que esperaban el mismo resultado"""
+
+
+class FileSingleFlight:
+    """
+    Coalescencia entre procesos para resultados de texto.
+    El primer worker toma un lock exclusivo sobre <dir>/<hash>.lock, ejecuta y deja el
+    resultado en <hash>.res; los que esperaban en el lock lo usan si se escribió después
+    de su llegada (menos 'ventana_s', 0 por defecto: solo peticiones simultáneas).
+    Si falla con uno de los errores de 'compartir_errores', su mensaje queda en <hash>.err
+    y los que esperaban fallan al instante con ErrorCompartido en vez de repetir la llamada
+    (durante una caída, cada uno repetiría sus reintentos y timeouts en serie).
+    Borrar un .lock en uso (limpieza) solo hace perder la coalescencia, no el resultado.
+    """
+
+    def __init__(self, directorio: str, ventana_s: float = 0.0,
+                 compartir_errores: Tuple[Type[BaseException], ...] = (Exception,)):
+        if not FCNTL_AVAILABLE:
+            raise RuntimeError("fcntl no disponible: la coalescencia entre workers requiere Linux/macOS")
+        self.directorio = directorio
+        self.ventana_s = ventana_s
+        self.compartir_errores = compartir_errores
+        self._escrituras = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _rutas(self, clave: str):
+        h = hashlib.sha1(clave.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directorio, h)
+        return base + ".lock", base + ".res", base + ".err"
+
+    def _escribir(self, ruta: str, texto: str) -> None:
+        """Escritura atómica: temporal + rename"""
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(tmp, ruta)
+
+    def _leer_reciente(self, ruta_res: str, desde: float) -> Optional[str]:
+        try:
+            if os.path.getmtime(ruta_res) < desde - self.ventana_s:
+                return None
+            with open(ruta_res, encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def do(self, clave: str, fn: Callable[[], str]) -> str:
+        ruta_lock, ruta_res, ruta_err = self._rutas(clave)
+        llegada = time.time()
+        with open(ruta_lock, "a+") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                reciente = self._leer_reciente(ruta_res, llegada)
+                if reciente is not None:
+                    return reciente
+                error = self._leer_reciente(ruta_err, llegada)
+                if error is not None:
+                    raise ErrorCompartido(error)
+                try:
+                    resultado = fn()
+                except self.compartir_errores as e:
+                    self._escribir(ruta_err, str(e))
+                    raise
+                self._escribir(ruta_res, resultado)
+                self._limpiar()
+                return resultado
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _limpiar(self, cada: int = 500, edad_s: float = 300.0) -> None:
+        """Borra de vez en cuando los resultados y locks antiguos"""
+        self._escrituras += 1
+        if self._escrituras % cada:
+            return
+        limite = time.time() - edad_s
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
@@ -1,213 +1,33 @@
 import math
-import urllib.request
-import ssl
+import re
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, Optional
+import numpy as np
+from typing import Dict, Any, Mapping, Optional
+
+from .zone_cache import zone_cache
+from .upstream import catastro, url_ovc, RUTA_WMS
+from .single_flight import SingleFlight
+from .ponencia_store import ponencias, MunicipioPonencia, VistaPonencias
 
 # =====================================================
-# DATA FOR ANDUJAR (PONENCIA 2010)
+# PONENCIAS DE VALORES POR MUNICIPIO
+# Los datos (MBC, MBR, RM, GB, tipos IBI, polígonos, zonas) viven en
+# data/ponencias/<municipio>.json y se cargan bajo demanda (ver ponencia_store).
+# MUNICIPALITIES y MUNICIPIOS_COMPILADOS son vistas de solo lectura sobre el
+# almacén: iterarlas solo lee el índice, acceder a una clave carga ese municipio.
 # =====================================================
 
-ANDUJAR_DATA = {
-    "municipio": "Andújar",
-    "provincia": "Jaén",
-    "anio_ponencia": 2010,
-    "mbc": 550.00,
-    "mbr": 450.00,
-    "rm": 0.50,
-    "gb": 1.30,   # CT=1.30 verificado en 2 Hojas Informativas reales de Andújar
-    "tipo_ibi": {
-        "urbano": 0.00593,
-        "rustico": 0.01068,
-        "bice": 0.01286
-    },
-    "coef_ibi_rustica": 1.086,
-    "poligonos": {
-        "P01": {"denom": "CENTRO URBANO", "vrb": "R37C", "vrb_val": 423.00},
-        "P02": {"denom": "CENTRO HISTÓRICO", "vrb": "R40", "vrb_val": 342.00},
-        "P03": {"denom": "CASCO URBANO", "vrb": "R47", "vrb_val": 172.00},
-        "P04": {"denom": "INDUSTRIAL", "vub_code": "U43", "vub": 85.00, "vrb": "R55", "vrb_val": 60.00},
-        "P05": {"denom": "SUELO URBANIZABLE RESIDENCIAL", "vrb": "R43", "vrb_val": 262.00},
-        "P06": {"denom": "SUELO URBANIZABLE IND Y TERCIA", "vub_code": "U43", "vub": 85.00, "vrb": "R55", "vrb_val": 60.00},
-        "P07": {"denom": "POBLADOS", "vrb": "R58", "vrb_val": 37.80},
-        "P08": {"denom": "SANTUARIO", "vrb": "R40", "vrb_val": 342.00},
-    },
-    "zonas_valor": {
-        "R37": {"vivienda": 423.0, "comercial": 423.0, "oficinas": 423.0, "industri": 296.0, "garajes": 63.45},
-        "R37C": {"vivienda": 423.0, "comercial": 575.0, "oficinas": 423.0, "industri": 296.0, "garajes": 63.45},
-        "R40": {"vivienda": 342.0, "comercial": 342.0, "oficinas": 342.0, "industri": 239.0, "garajes": 51.30},
-        "R43": {"vivienda": 262.0, "comercial": 262.0, "oficinas": 262.0, "industri": 183.0, "garajes": 39.30},
-        "R47": {"vivienda": 172.0, "comercial": 172.0, "oficinas": 172.0, "industri": 120.0, "garajes": 36.00},
-        "R50": {"vivienda": 118.0, "comercial": 118.0, "oficinas": 118.0, "industri": 83.0, "garajes": 36.00},
-        "R55": {"vivienda": 60.0, "comercial": 60.0, "oficinas": 60.0, "industri": 42.0, "garajes": 36.00},
-        "R58": {"vivienda": 37.8, "comercial": 37.8, "oficinas": 37.8, "industri": 37.8, "garajes": 36.00},
-    }
-}
-
-# Add Fuencaliente as fallback / secondary
-FUENCALIENTE_DATA = {
-    "municipio": "Fuencaliente",
-    "provincia": "Ciudad Real",
-    "anio_ponencia": 1990,
-    "mbc": 500.0,
-    "mbr": 400.0,
-    "rm": 0.50,
-    "tipo_ibi": {
-        "urbano": 0.00510,
-        "rustico": 0.00600,
-        "bice": 0.00600
-    },
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-# Major Municipalities (Estimations / Placeholders based on recent Ponencias)
-MADRID_DATA = {
-    "municipio": "Madrid",
-    "provincia": "Madrid",
-    "anio_ponencia": 2011,
-    "mbc": 950.0,
-    "mbr": 1800.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00428, "rustico": 0.00567, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-BARCELONA_DATA = {
-    "municipio": "Barcelona",
-    "provincia": "Barcelona",
-    "anio_ponencia": 2017,
-    "mbc": 1100.0,
-    "mbr": 2100.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.0066, "rustico": 0.0066, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-VALENCIA_DATA = {
-    "municipio": "Valencia",
-    "provincia": "Valencia",
-    "anio_ponencia": 2021,
-    "mbc": 750.0,
-    "mbr": 1200.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00723, "rustico": 0.00723, "bice": 0.00723},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-SEVILLA_DATA = {
-    "municipio": "Sevilla",
-    "provincia": "Sevilla",
-    "anio_ponencia": 2001,
-    "mbc": 600.0,
-    "mbr": 900.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00675, "rustico": 0.00675, "bice": 0.00675},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-ZARAGOZA_DATA = {
-    "municipio": "Zaragoza",
-    "provincia": "Zaragoza",
-    "anio_ponencia": 2013,
-    "mbc": 700.0,
-    "mbr": 1000.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00404, "rustico": 0.00404, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-MALAGA_DATA = {
-    "municipio": "Málaga",
-    "provincia": "Málaga",
-    "anio_ponencia": 2016,
-    "mbc": 850.0,
-    "mbr": 1500.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00451, "rustico": 0.00451, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
+MUNICIPALITIES: Mapping[str, Mapping[str, Any]] = VistaPonencias(ponencias, compilado=False)
+MUNICIPIOS_COMPILADOS: Mapping[str, MunicipioPonencia] = VistaPonencias(ponencias, compilado=True)
 
-MURCIA_DATA = {
-    "municipio": "Murcia",
-    "provincia": "Murcia",
-    "anio_ponencia": 2015,
-    "mbc": 650.0,
-    "mbr": 950.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00511, "rustico": 0.00511, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
+# Municipio por defecto (Andújar, Ponencia 2010): siempre se necesita, se carga al importar
+MUNICIPIO_POR_DEFECTO = ponencias.obtener("Andújar")
 
-PALMA_DATA = {
-    "municipio": "Palma de Mallorca",
-    "provincia": "Illes Balears",
-    "anio_ponencia": 2012,
-    "mbc": 1000.0,
-    "mbr": 1900.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00490, "rustico": 0.00490, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
 
-BILBAO_DATA = {
-    "municipio": "Bilbao",
-    "provincia": "Bizkaia",
-    "anio_ponencia": 2016,
-    "mbc": 1050.0,
-    "mbr": 2000.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00194, "rustico": 0.00194, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
+def resolver_municipio(nombre: str) -> Optional[str]:
+    """Devuelve la clave de MUNICIPALITIES que corresponde al nombre (ignorando mayúsculas y acentos)"""
+    return ponencias.resolver(nombre)
 
-VALLADOLID_DATA = {
-    "municipio": "Valladolid",
-    "provincia": "Valladolid",
-    "anio_ponencia": 2017,
-    "mbc": 600.0,
-    "mbr": 850.0,
-    "rm": 0.50,
-    "tipo_ibi": {"urbano": 0.00613, "rustico": 0.00613, "bice": 0.0080},
-    "coef_ibi_rustica": 1.00,
-    "poligonos": {},
-    "zonas_valor": {}
-}
-
-MUNICIPALITIES = {
-    "Andújar": ANDUJAR_DATA,
-    "Fuencaliente": FUENCALIENTE_DATA,
-    "Madrid": MADRID_DATA,
-    "Barcelona": BARCELONA_DATA,
-    "Valencia": VALENCIA_DATA,
-    "Sevilla": SEVILLA_DATA,
-    "Zaragoza": ZARAGOZA_DATA,
-    "Málaga": MALAGA_DATA,
-    "Murcia": MURCIA_DATA,
-    "Palma de Mallorca": PALMA_DATA,
-    "Palma": PALMA_DATA, # Alías común
-    "Bilbao": BILBAO_DATA,
-    "Valladolid": VALLADOLID_DATA
-}
 
 # =====================================================
 # COEFICIENTE H — TABLA OFICIAL RD 1020/1993, NORMA 13
@@ -269,18 +89,10 @@ _H_TABLE = {
     },
 }
 
-def get_coef_antiguedad(anio_ponencia: int, anio_const: int, uso_const: str = "vivienda", categoria: int = 4) -> float:
-    """
-    Coeficiente de antigüedad H según Norma 13 del RD 1020/1993.
-
-    T = años completos desde la construcción hasta el 1 de enero
-        del año siguiente al de aprobación de la Ponencia de valores.
-    """
-    T = (anio_ponencia + 1) - anio_const
+def _buscar_tramo_h(grupo_uso: str, grupo_cat: str, T: int) -> float:
+    """Recorre los tramos de _H_TABLE (solo se usa para construir la tabla densa)"""
     if T < 0:
         return 1.00
-    grupo_uso = USO_TO_GRUPO.get(uso_const, "uso1")
-    grupo_cat = _get_cat_grupo(int(categoria))
     for t_max, coef in _H_TABLE[grupo_uso][grupo_cat]:
         if T <= t_max:
             return round(coef, 2)
@@ -323,6 +135,100 @@ COEF_TIPOLOGIA = {
     "agricola": {1:0.80, 2:0.75, 3:0.70, 4:0.65, 5:0.60, 6:0.55, 7:0.50, 8:0.45, 9:0.40}
 }
 
+# =====================================================
+# TABLAS DENSAS (NumPy) PARA BÚSQUEDAS O(1) Y VECTORIZADAS
+# Se precalculan al importar a partir de _H_TABLE, COEF_TIPOLOGIA y
+# COEF_CONSERVACION; los diccionarios siguen siendo la fuente de verdad.
+# =====================================================
+
+GRUPOS_USO = ("uso1", "uso2", "uso3")
+GRUPOS_CAT = ("cat12", "cat3456", "cat789")
+
+# Códigos de uso: índice en USOS; el código len(USOS) es "uso desconocido"
+USOS = tuple(dict.fromkeys(list(COEF_TIPOLOGIA) + list(USO_TO_GRUPO)))
+INDICE_USO = {uso: i for i, uso in enumerate(USOS)}
+USO_DESCONOCIDO = len(USOS)
+
+# Códigos de estado de conservación; len(ESTADOS) es "estado desconocido"
+ESTADOS = tuple(COEF_CONSERVACION)
+INDICE_ESTADO = {estado: i for i, estado in enumerate(ESTADOS)}
+ESTADO_DESCONOCIDO = len(ESTADOS)
+
+# Eje T de la tabla H: posición 0 = T<0, posición T+1 para 0 <= T <= T_MAX_H,
+# y T_MAX_H+1 recoge cualquier T mayor (el "más allá" del último tramo)
+T_MAX_H = 999
+
+# Grupo de uso (fila de H) por código de uso; desconocido -> uso1
+GRUPO_USO_POR_CODIGO = np.array(
+    [GRUPOS_USO.index(USO_TO_GRUPO.get(uso, "uso1")) for uso in USOS] + [0], dtype=np.intp)
+
+H_DENSA = np.array([
+    [[_buscar_tramo_h(g_uso, g_cat, T) for T in range(-1, T_MAX_H + 2)] for g_cat in GRUPOS_CAT]
+    for g_uso in GRUPOS_USO
+])
+
+# Tipología por (código de uso, categoría 0..9); categorías fuera de 1..9 -> 1.0,
+# uso desconocido -> tabla de vivienda
+TIPOLOGIA_DENSA = np.array([
+    [COEF_TIPOLOGIA.get(uso, COEF_TIPOLOGIA["vivienda"]).get(cat, 1.0) for cat in range(10)]
+    for uso in USOS + ("",)
+])
+
+CONSERVACION_DENSA = np.array([COEF_CONSERVACION[e] for e in ESTADOS] + [1.00])
+
+
+def codigos_uso(usos) -> np.ndarray:
+    """Convierte usos (str) a códigos enteros para indexar las tablas densas"""
+    usos = np.asarray(usos, dtype=object)
+    unicos, inversa = np.unique(usos.astype(str), return_inverse=True)
+    return np.array([INDICE_USO.get(u, USO_DESCONOCIDO) for u in unicos], dtype=np.intp)[inversa.reshape(-1)]
+
+
+def codigos_estado(estados) -> np.ndarray:
+    """Convierte estados de conservación (str) a códigos enteros"""
+    estados = np.asarray(estados, dtype=object)
+    unicos, inversa = np.unique(estados.astype(str), return_inverse=True)
+    return np.array([INDICE_ESTADO.get(e, ESTADO_DESCONOCIDO) for e in unicos], dtype=np.intp)[inversa.reshape(-1)]
+
+
+def _indice_cat_grupo(categoria):
+    # cat <= 2 -> 0 (cat12), 3..6 -> 1 (cat3456), >= 7 -> 2 (cat789)
+    return np.searchsorted(np.array([2, 6]), categoria, side="left")
+
+
+def coef_antiguedad_vec(anio_ponencia, anio_const, cod_uso, categoria) -> np.ndarray:
+    """Coeficiente H vectorizado (mismos valores que get_coef_antiguedad)"""
+    T = np.asarray(anio_ponencia, dtype=np.int64) + 1 - np.asarray(anio_const, dtype=np.int64)
+    indice_t = np.clip(T, -1, T_MAX_H + 1) + 1
+    return H_DENSA[GRUPO_USO_POR_CODIGO[cod_uso], _indice_cat_grupo(np.asarray(categoria, dtype=np.int64)), indice_t]
+
+
+def coef_tipologia_vec(cod_uso, categoria) -> np.ndarray:
+    """Coeficiente de tipología vectorizado (mismos valores que COEF_TIPOLOGIA.get(...).get(...))"""
+    categoria = np.asarray(categoria, dtype=np.int64)
+    columna = np.where((categoria >= 1) & (categoria <= 9), categoria, 0)
+    return TIPOLOGIA_DENSA[cod_uso, columna]
+
+
+def coef_conservacion_vec(cod_estado) -> np.ndarray:
+    return CONSERVACION_DENSA[cod_estado]
+
+
+def get_coef_antiguedad(anio_ponencia: int, anio_const: int, uso_const: str = "vivienda", categoria: int = 4) -> float:
+    """
+    Coeficiente de antigüedad H según Norma 13 del RD 1020/1993.
+
+    T = años completos desde la construcción hasta el 1 de enero
+        del año siguiente al de aprobación de la Ponencia de valores.
+    Búsqueda O(1) en la tabla densa H_DENSA.
+    """
+    T = (anio_ponencia + 1) - anio_const
+    indice_t = min(max(T, -1), T_MAX_H + 1) + 1
+    grupo_uso = GRUPO_USO_POR_CODIGO[INDICE_USO.get(uso_const, USO_DESCONOCIDO)]
+    grupo_cat = GRUPOS_CAT.index(_get_cat_grupo(int(categoria)))
+    return float(H_DENSA[grupo_uso, grupo_cat, indice_t])
+
+
 COEF_SUELO_OCUPADO_RUSTICO = {
     "residencial": {"mbr_type": "urbano", "coef": 0.070},
     "industrial": {"mbr_type": "urbano", "coef": 0.047},
@@ -343,56 +249,71 @@ def get_coef_edificabilidad(edif_max, edif_real):
 # CALCULATION CORE
 # =====================================================
 
+# Coalescencia de consultas de zona por celda de la caché espacial
+_vuelos_zona = SingleFlight()
+
+
 class TaxCalculator:
     @staticmethod
     def get_valuation_zone(lat: float, lon: float) -> Optional[str]:
+        """
+        Obtiene la zona de valoración de un punto.
+        Primero consulta la caché espacial (celdas de ~25 m) y solo si no hay
+        acierto consulta el WMS de Valoración del Catastro.
+        """
+        zona = zone_cache.get(lat, lon)
+        if zona is not None:
+            return zona
+
+        # Puntos de la misma celda consultados a la vez comparten una sola consulta WMS
+        return _vuelos_zona.do(zone_cache.celda(lat, lon), lambda: TaxCalculator._resolver_zona(lat, lon))
+
+    @staticmethod
+    def _resolver_zona(lat: float, lon: float) -> Optional[str]:
+        zona = TaxCalculator._consultar_wms_zona(lat, lon)
+        if zona:
+            zone_cache.put(lat, lon, zona)
+        return zona
+
+    @staticmethod
+    def _consultar_wms_zona(lat: float, lon: float) -> Optional[str]:
         """
         Consulta el WMS de Valoración del Catastro para obtener la zona.
         """
         try:
-            ctx = ssl.create_default_context()
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-            
             # Formar URL de GetFeatureInfo
             # Usamos un BBOX pequeño alrededor del punto
             delta = 0.0001
             bbox = f"{lon-delta},{lat-delta},{lon+delta},{lat+delta}"
-            url = (
-                f"https://ovc.catastro.meh.es/cartografia/WMS/ServidorWMS.aspx?"
-                f"SERVICE=WMS&VERSION=1.1.1&REQUEST=GetFeatureInfo&"
-                f"LAYERS=VALORACION&QUERY_LAYERS=VALORACION&"
-                f"INFO_FORMAT=text/xml&SRS=EPSG:4326&"
-                f"BBOX={bbox}&WIDTH=101&HEIGHT=101&X=50&Y=50"
+            url = url_ovc(
+                RUTA_WMS,
+                SERVICE="WMS", VERSION="1.1.1", REQUEST="GetFeatureInfo",
+                LAYERS="VALORACION", QUERY_LAYERS="VALORACION",
+                INFO_FORMAT="text/xml", SRS="EPSG:4326",
+                BBOX=bbox, WIDTH=101, HEIGHT=101, X=50, Y=50,
             )
+
+            xml_data = catastro.get(url, "WMS_Valoracion", timeout=10)
+
+            # Intentar buscar referencias de valores (Zonas R, U...)
+            # Zonas genéricas (R47, U43, etc.)
+            zona_match = re.search(r'Zona:?\s*([A-Z][0-9]{2}[A-Z]?)', xml_data, re.IGNORECASE)
+            zona_encontrada = zona_match.group(1).upper() if zona_match else None
             
-            req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-            with urllib.request.urlopen(req, context=ctx, timeout=10) as response:
-                # El Catastro suele usar latin-1 en sus WMS
-                raw_data = response.read()
-                try: xml_data = raw_data.decode("utf-8")
-                except: xml_data = raw_data.decode("latin-1")
-                
-                # Intentar buscar referencias de valores (Zonas R, U...)
-                import re
-                
-                # Zonas genéricas (R47, U43, etc.)
-                zona_match = re.search(r'Zona:?\s*([A-Z][0-9]{2}[A-Z]?)', xml_data, re.IGNORECASE)
-                zona_encontrada = zona_match.group(1).upper() if zona_match else None
-                
-                # Polígonos de valoración específicos (P04, etc.)
-                poli_match = re.search(r'Pol[ií]gono:?\s*(P[0-9]{2})', xml_data, re.IGNORECASE)
-                
-                if poli_match:
-                    poli = poli_match.group(1).upper()
-                    print(f"DEBUG WMS: Polígono detectado={poli}")
-                    if poli in ANDUJAR_DATA["poligonos"]:
-                        return ANDUJAR_DATA["poligonos"][poli]["vrb"].replace("C", "")
-                
-                # Fallback: devolver la Zona VBR encontrada
-                if zona_encontrada:
-                    return zona_encontrada
-                
+            # Polígonos de valoración específicos (P04, etc.)
+            poli_match = re.search(r'Pol[ií]gono:?\s*(P[0-9]{2})', xml_data, re.IGNORECASE)
+            
+            if poli_match:
+                poli = poli_match.group(1).upper()
+                print(f"DEBUG WMS: Polígono detectado={poli}")
+                poligonos_andujar = MUNICIPIO_POR_DEFECTO.poligonos
+                if poli in poligonos_andujar:
+                    return poligonos_andujar[poli]["vrb"].replace("C", "")
+            
+            # Fallback: devolver la Zona VBR encontrada
+            if zona_encontrada:
+                return zona_encontrada
+
             print(f"DEBUG WMS: No se encontró zona ni polígono en el XML. Texto completo: {xml_data}")
             return None
         except Exception as e:
@@ -402,55 +323,29 @@ class TaxCalculator:
     @staticmethod
     def get_zone_value(municipio: str, zona: str, uso: str = "vivienda") -> float:
         # Encontrar el municipio ignorando mayúsculas y acentos
-        def normalize(text):
-            import unicodedata
-            return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn').lower()
-            
-        muni_key = "Andújar" # Default
-        target_norm = normalize(municipio)
-        for k in MUNICIPALITIES.keys():
-            if normalize(k) == target_norm:
-                muni_key = k
-                break
-
-        data = MUNICIPALITIES.get(muni_key, ANDUJAR_DATA)
-        
-        if zona in data["zonas_valor"]:
-            return data["zonas_valor"][zona].get(uso, 0.0)
+        muni_key = resolver_municipio(municipio) or "Andújar"
+        data = MUNICIPIOS_COMPILADOS[muni_key]
+
+        if zona in data.zonas_valor:
+            return data.zonas_valor[zona].get(uso, 0.0)
             
         # Fallback for generic capital zones - simple heuristic based on MBR
         # If it's a known city but we don't have the exact Euro/m2 table, we use the average MBR as a baseline.
         if muni_key != "Andújar" and muni_key != "Fuencaliente":
-            return data["mbr"]
+            return data.mbr
             
         return 0.0
 
     @staticmethod
     def calculate(params: Dict[str, Any]) -> Dict[str, Any]:
-        import copy
         municipio_name = params.get("municipio", "Andújar")
-        # Load base data from known municipalities or use a default template
-        # Use deepcopy to avoid polluting the global MUNICIPALITIES dict
-        base_data = copy.deepcopy(MUNICIPALITIES.get(municipio_name, ANDUJAR_DATA))
-        
-        # Override with custom parameters if provided (for generic municipality support)
-        if params.get("custom_mbc"): base_data["mbc"] = float(params["custom_mbc"])
-        if params.get("custom_mbr"): base_data["mbr"] = float(params["custom_mbr"])
-        if params.get("custom_rm"): base_data["rm"] = float(params["custom_rm"])
-        
-        # Override IBI types
-        if params.get("custom_tipo_urbano"):
-            base_data["tipo_ibi"]["urbano"] = float(params["custom_tipo_urbano"])
-        if params.get("custom_tipo_rustico"):
-            base_data["tipo_ibi"]["rustico"] = float(params["custom_tipo_rustico"])
-        
-        if params.get("custom_anio_ponencia"):
-            base_data["anio_ponencia"] = int(params["custom_anio_ponencia"])
+        # Modelo compilado del municipio + overrides de la petición (custom_mbc, custom_rm, ...)
+        # como capa superficial: el modelo compartido nunca se modifica
+        data = MUNICIPIOS_COMPILADOS.get(municipio_name, MUNICIPIO_POR_DEFECTO).con_overrides(params)
 
-        data = base_data
-        RM = data["rm"]
+        RM = data.rm
         # GB: usa el valor del municipio (ej. Andújar CT=1.30) o el del usuario, o 1.0 por defecto
-        GB = float(params.get("custom_gb") or data.get("gb", 1.0))
+        GB = float(params.get("custom_gb") or data.gb)
         clase = params.get("clase", "urbano")
         
         # 1. VALOR SUELO URBANO
@@ -462,8 +357,8 @@ class TaxCalculator:
             if valor_rep == 0 and "zona_valor" in params:
                 zona = params["zona_valor"]
                 uso = params.get("uso_const", "vivienda")
-                if zona in data["zonas_valor"]:
-                    valor_rep = data["zonas_valor"][zona].get(uso, 0)
+                if zona in data.zonas_valor:
+                    valor_rep = data.zonas_valor[zona].get(uso, 0)
             
             edif_max = float(params.get("edif_max", 0))
             edif_real = float(params.get("edif_real", 0))
@@ -486,7 +381,7 @@ class TaxCalculator:
             coef_suelo = suelo_rustico_config["coef"]
             
             # TODO: Idealmente tener mbr_rustico en MUNICIPALITIES. Aquí usamos el valor de polígono poblados como aproximación o el parametrizado
-            mbr_aplicar = data["mbr"] if suelo_rustico_config["mbr_type"] == "urbano" else data.get("mbr_rustico", 37.80)
+            mbr_aplicar = data.mbr if suelo_rustico_config["mbr_type"] == "urbano" else data.mbr_rustico
             if params.get("custom_mbr_rustico"):
                 mbr_aplicar = float(params["custom_mbr_rustico"])
                 
@@ -502,10 +397,10 @@ class TaxCalculator:
             estado = params.get("estado", "normal")
             
             coef_tipo = COEF_TIPOLOGIA.get(uso_const, COEF_TIPOLOGIA["vivienda"]).get(categoria, 1.0)
-            coef_h = get_coef_antiguedad(int(data.get("anio_ponencia", 2010)), anio_const, uso_const, categoria)
+            coef_h = get_coef_antiguedad(data.anio_ponencia, anio_const, uso_const, categoria)
             coef_i = COEF_CONSERVACION.get(estado, 1.00)
             
-            construccion_base = round(sup_const * data["mbc"] * coef_tipo * coef_h * coef_i * RM * GB, 2)
+            construccion_base = round(sup_const * data.mbc * coef_tipo * coef_h * coef_i * RM * GB, 2)
             
             # Support array of constructions
             construccion = construccion_base
@@ -519,10 +414,10 @@ class TaxCalculator:
                     c_sup = float(c.get("sup_const", 0))
                     
                     c_coef_tipo = COEF_TIPOLOGIA.get(c_uso, COEF_TIPOLOGIA["vivienda"]).get(c_cat, 1.0)
-                    c_coef_h = get_coef_antiguedad(int(data.get("anio_ponencia", 2010)), c_anio, c_uso, c_cat)
+                    c_coef_h = get_coef_antiguedad(data.anio_ponencia, c_anio, c_uso, c_cat)
                     c_coef_i = COEF_CONSERVACION.get(c_estado, 1.00)
                     
-                    c_valor = round(c_sup * data["mbc"] * c_coef_tipo * c_coef_h * c_coef_i * RM * GB, 2)
+                    c_valor = round(c_sup * data.mbc * c_coef_tipo * c_coef_h * c_coef_i * RM * GB, 2)
                     construccion += c_valor
 
         # TOTAL CATASTRAL
@@ -530,16 +425,16 @@ class TaxCalculator:
 
         # IBI
         if clase == "rustico":
-            base_ibi = round(total * data["coef_ibi_rustica"], 2)
+            base_ibi = round(total * data.coef_ibi_rustica, 2)
         else:
             base_ibi = total
             
-        tipo_ibi = data["tipo_ibi"].get(clase, 0.005)
+        tipo_ibi = data.tipo_ibi.get(clase, 0.005)
         cuota = round(base_ibi * tipo_ibi, 2)
 
         return {
             "municipio": municipio_name,
-            "provincia": data["provincia"],
+            "provincia": data.provincia,
             "suelo_urbano": suelo_urb,
             "suelo_rustico_no_ocupado": suelo_rust_no,
             "suelo_rustico_ocupado": suelo_rust_oc,
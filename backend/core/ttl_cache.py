@@ -0,0 +1,51 @@
+"""
+Caché LRU genérica con TTL para respuestas del Catastro
+(consultas por clave exacta; para zonas por coordenadas ver zone_cache.py)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Caché LRU acotada con caducidad por entrada, segura entre hilos"""
+
+    def __init__(self, max_entradas: int = 10000, ttl_segundos: float = 86400.0):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                valor, expira = entrada
+                if expira > ahora:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            self.fallos += 1
+            return None
+
+    def put(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl_segundos)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entradas": len(self._datos), "aciertos": self.aciertos, "fallos": self.fallos}
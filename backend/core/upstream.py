@@ -0,0 +1,403 @@
+"""
+Capa común de llamadas a servicios externos del Catastro (OVC y WMS)
+- Reintentos con backoff exponencial y jitter (solo GET idempotentes)
+- Circuit breaker por endpoint: falla rápido si se dispara la tasa de errores
+- Peticiones "hedged" opcionales: segunda petición si la primera supera el p95
+- Token bucket global para respetar el uso razonable del servicio del Catastro
+"""
+
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from .single_flight import SingleFlight, FileSingleFlight, ErrorCompartido
+from .metrics import UPSTREAM_SEGUNDOS, UPSTREAM_ERRORES
+from . import profiling
+
+# URLs base de los servicios del Catastro
+# CATASTRO_OVC_BASE_URL permite apuntar a un stub local (ver ovc_stub_server.py)
+OVC_BASE_URL = os.getenv("CATASTRO_OVC_BASE_URL", "https://ovc.catastro.meh.es").rstrip("/")
+RUTA_CALLEJERO = "/ovcservweb/OVCSWLocalizacionRC/OVCCallejero.asmx"
+RUTA_COORDENADAS = "/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx"
+RUTA_WMS = "/cartografia/WMS/ServidorWMS.aspx"
+
+# Por debajo de este tiempo restante no se lanza una llamada (no daría tiempo a responder)
+TIEMPO_MIN_LLAMADA_S = 0.05
+
+
+def url_ovc(ruta: str, metodo: str = "", **params) -> str:
+    """Construye la URL de un método OVC (o del WMS si metodo está vacío)"""
+    base = f"{OVC_BASE_URL}{ruta}/{metodo}" if metodo else f"{OVC_BASE_URL}{ruta}"
+    return f"{base}?{urllib.parse.urlencode(params, safe=':,/')}"
+
+
+class UpstreamError(Exception):
+    """Fallo al consultar un servicio externo (tras agotar los reintentos)"""
+
+    def __init__(self, mensaje: str, endpoint: str = "", codigo_http: Optional[int] = None):
+        super().__init__(mensaje)
+        self.endpoint = endpoint
+        self.codigo_http = codigo_http
+
+
+class CircuitOpenError(UpstreamError):
+    """Circuito abierto: el endpoint está degradado y no se llega a llamar"""
+
+
+class RateLimitError(UpstreamError):
+    """No hay cupo en el limitador de peticiones dentro del tiempo de espera"""
+
+
+class TokenBucket:
+    """Limitador de tasa: 'tasa' peticiones/segundo con ráfagas de hasta 'capacidad'"""
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reponer(self, ahora: float) -> None:
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def adquirir(self, espera_max: float = 0.0) -> bool:
+        """Consume un token, esperando como mucho 'espera_max' segundos"""
+        limite = time.monotonic() + espera_max
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._reponer(ahora)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                falta = (1 - self._tokens) / self.tasa
+            if ahora + falta > limite:
+                return False
+            time.sleep(falta)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error en ventana deslizante.
+    cerrado -> abierto si errores/total >= umbral (con un mínimo de peticiones);
+    abierto -> semiabierto tras el enfriamiento (se deja pasar una petición de prueba);
+    semiabierto -> cerrado si la prueba va bien, abierto si falla.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, umbral_error: float = 0.5, min_peticiones: int = 10,
+                 ventana_s: float = 30.0, enfriamiento_s: float = 20.0):
+        self.umbral_error = umbral_error
+        self.min_peticiones = min_peticiones
+        self.ventana_s = ventana_s
+        self.enfriamiento_s = enfriamiento_s
+        self.estado = CircuitBreaker.CERRADO
+        self._resultados = deque()  # (instante, ok)
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == CircuitBreaker.CERRADO:
+                return True
+            ahora = time.monotonic()
+            if self.estado == CircuitBreaker.ABIERTO and ahora - self._abierto_desde >= self.enfriamiento_s:
+                self.estado = CircuitBreaker.SEMIABIERTO
+                self._prueba_en_curso = False
+            if self.estado == CircuitBreaker.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def liberar(self) -> None:
+        """Devuelve el turno de prueba concedido por permitir() sin llegar a llamar"""
+        with self._lock:
+            if self.estado == CircuitBreaker.SEMIABIERTO:
+                self._prueba_en_curso = False
+
+    def registrar(self, ok: bool) -> None:
+        with self._lock:
+            ahora = time.monotonic()
+            if self.estado == CircuitBreaker.SEMIABIERTO:
+                self._prueba_en_curso = False
+                if ok:
+                    self.estado = CircuitBreaker.CERRADO
+                    self._resultados.clear()
+                else:
+                    self.estado = CircuitBreaker.ABIERTO
+                    self._abierto_desde = ahora
+                return
+
+            self._resultados.append((ahora, ok))
+            while self._resultados and ahora - self._resultados[0][0] > self.ventana_s:
+                self._resultados.popleft()
+
+            total = len(self._resultados)
+            errores = sum(1 for _, r in self._resultados if not r)
+            if total >= self.min_peticiones and errores / total >= self.umbral_error:
+                self.estado = CircuitBreaker.ABIERTO
+                self._abierto_desde = ahora
+
+
+class LatencyTracker:
+    """Últimas N latencias de un endpoint (para el retardo del hedging)"""
+
+    def __init__(self, tam: int = 200):
+        self._muestras = deque(maxlen=tam)
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos: float) -> None:
+        with self._lock:
+            self._muestras.append(segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._muestras:
+                return None
+            ordenadas = sorted(self._muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+    def __len__(self) -> int:
+        return len(self._muestras)
+
+
+class UpstreamClient:
+    """Cliente HTTP compartido para el Catastro con resiliencia por endpoint"""
+
+    def __init__(self, reintentos: int = 2, backoff_base_s: float = 0.3, backoff_max_s: float = 3.0,
+                 tasa_rps: float = 10.0, rafaga: float = 20.0, espera_cupo_s: float = 2.0,
+                 hedging: bool = False, hedging_min_muestras: int = 20, timeout_s: float = 15.0,
+                 presupuesto_s: float = 20.0, directorio_coalescencia: str = ""):
+        self.reintentos = reintentos
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.espera_cupo_s = espera_cupo_s
+        self.hedging = hedging
+        self.hedging_min_muestras = hedging_min_muestras
+        self.timeout_s = timeout_s
+        self.presupuesto_s = presupuesto_s  # tiempo máximo de una llamada, reintentos incluidos
+        self.limitador = TokenBucket(tasa_rps, rafaga)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencias: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="catastro-hedge")
+
+        # Coalescencia de GET idénticos simultáneos (en el proceso y, opcionalmente, entre workers)
+        self.vuelos = SingleFlight()
+        self.vuelos_workers: Optional[FileSingleFlight] = None
+        if directorio_coalescencia:
+            try:
+                self.vuelos_workers = FileSingleFlight(directorio_coalescencia, compartir_errores=(UpstreamError,))
+            except RuntimeError as e:
+                print(f"WARNING: coalescencia entre workers desactivada: {e}")
+
+        # Contexto SSL permisivo (el certificado del Catastro a veces da problemas)
+        self._ctx = ssl.create_default_context()
+        self._ctx.check_hostname = False
+        self._ctx.verify_mode = ssl.CERT_NONE
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker()
+                self._latencias[endpoint] = LatencyTracker()
+            return self._breakers[endpoint]
+
+    def _latencia(self, endpoint: str) -> LatencyTracker:
+        self.breaker(endpoint)
+        return self._latencias[endpoint]
+
+    def _descargar(self, url: str, endpoint: str, timeout: float) -> str:
+        """Una petición GET real; devuelve el cuerpo decodificado"""
+        inicio = time.monotonic()
+        req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+        try:
+            with urllib.request.urlopen(req, context=self._ctx, timeout=timeout) as resp:
+                raw = resp.read()
+        finally:
+            UPSTREAM_SEGUNDOS.labels(endpoint).observe(time.monotonic() - inicio)
+            profiling.registrar_llamada(endpoint, time.monotonic() - inicio)
+        self._latencia(endpoint).registrar(time.monotonic() - inicio)
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError:
+            # El Catastro suele usar latin-1 en sus WMS
+            return raw.decode("latin-1")
+
+    def _descargar_hedged(self, url: str, endpoint: str, timeout: float) -> str:
+        """
+        Lanza la petición y, si tarda más que el p95 del endpoint, una segunda idéntica.
+        Se devuelve la primera que responda bien.
+        """
+        latencias = self._latencia(endpoint)
+        retardo = latencias.percentil(0.95) if len(latencias) >= self.hedging_min_muestras else None
+        if retardo is None:
+            return self._descargar(url, endpoint, timeout)
+
+        pendientes = {self._executor.submit(self._descargar, url, endpoint, timeout)}
+        hechas, _ = wait(pendientes, timeout=retardo)
+        if not hechas and self.limitador.adquirir(0):
+            pendientes.add(self._executor.submit(self._descargar, url, endpoint, timeout))
+
+        ultimo_error = None
+        while pendientes:
+            hechas, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechas:
+                if futuro.exception() is None:
+                    return futuro.result()
+                ultimo_error = futuro.exception()
+        raise ultimo_error
+
+    @staticmethod
+    def _tipo_error(error: Exception) -> str:
+        if isinstance(error, urllib.error.HTTPError):
+            return f"http_{error.code // 100}xx"
+        if isinstance(error, (TimeoutError, socket.timeout)) or \
+                isinstance(getattr(error, "reason", None), (TimeoutError, socket.timeout)):
+            return "timeout"
+        return "red"
+
+    @staticmethod
+    def _es_reintentable(error: Exception) -> bool:
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code == 429 or error.code >= 500
+        return isinstance(error, (urllib.error.URLError, TimeoutError, OSError))
+
+    @staticmethod
+    def _es_rapido(error: Exception) -> bool:
+        """Error inmediato (5xx, conexión rechazada...); un timeout ya ha gastado el tiempo de la llamada"""
+        return UpstreamClient._tipo_error(error) != "timeout"
+
+    def get(self, url: str, endpoint: str, timeout: Optional[float] = None) -> str:
+        """
+        GET idempotente contra el Catastro con reintentos, circuit breaker y límite de tasa.
+        Las peticiones idénticas simultáneas comparten una sola llamada (y su resultado o error).
+        Los errores HTTP 4xx (petición incorrecta) se propagan tal cual, sin reintentar.
+        Solo se reintentan los errores rápidos (no los timeouts), y nunca más allá de
+        presupuesto_s desde el inicio de la llamada.
+        """
+        timeout = timeout or self.timeout_s
+        if self.vuelos_workers is not None:
+            return self.vuelos.do(url, lambda: self._get_entre_workers(url, endpoint, timeout))
+        return self.vuelos.do(url, lambda: self._get(url, endpoint, timeout))
+
+    def _get_entre_workers(self, url: str, endpoint: str, timeout: float) -> str:
+        """_get coalescido entre workers: si el worker que llamó falló, se falla igual sin repetir"""
+        try:
+            return self.vuelos_workers.do(url, lambda: self._get(url, endpoint, timeout))
+        except ErrorCompartido as e:
+            raise UpstreamError(str(e), endpoint)
+
+    def _get(self, url: str, endpoint: str, timeout: float) -> str:
+        breaker = self.breaker(endpoint)
+        ultimo_error: Optional[Exception] = None
+        limite = time.monotonic() + self.presupuesto_s
+
+        for intento in range(self.reintentos + 1):
+            if not breaker.permitir():
+                UPSTREAM_ERRORES.labels(endpoint, "circuito_abierto").inc()
+                raise CircuitOpenError(f"Servicio del Catastro degradado ({endpoint}): circuito abierto", endpoint)
+            # La espera de cupo también sale del presupuesto de la llamada
+            espera_cupo = min(self.espera_cupo_s, limite - time.monotonic() - TIEMPO_MIN_LLAMADA_S)
+            if not self.limitador.adquirir(max(0.0, espera_cupo)):
+                # Sin llamar: si era la petición de prueba, el circuito no debe quedarse esperándola
+                breaker.liberar()
+                UPSTREAM_ERRORES.labels(endpoint, "limite_tasa").inc()
+                raise RateLimitError(f"Límite de peticiones al Catastro alcanzado ({endpoint})", endpoint)
+
+            restante = min(timeout, limite - time.monotonic())
+            if restante < TIEMPO_MIN_LLAMADA_S:
+                # Sin tiempo para una llamada útil (urlopen ni acepta un timeout <= 0)
+                breaker.liberar()
+                UPSTREAM_ERRORES.labels(endpoint, "timeout").inc()
+                raise UpstreamError(f"Error consultando el Catastro ({endpoint}): presupuesto de tiempo agotado"
+                                    + (f" ({ultimo_error})" if ultimo_error else ""), endpoint)
+            try:
+                if self.hedging:
+                    texto = self._descargar_hedged(url, endpoint, restante)
+                else:
+                    texto = self._descargar(url, endpoint, restante)
+                breaker.registrar(True)
+                return texto
+            except Exception as e:
+                UPSTREAM_ERRORES.labels(endpoint, self._tipo_error(e)).inc()
+                if not self._es_reintentable(e):
+                    # El servicio responde (p. ej. 404): no cuenta como fallo del endpoint
+                    breaker.registrar(True)
+                    raise
+                breaker.registrar(False)
+                ultimo_error = e
+                if not self._es_rapido(e):
+                    break
+
+            if intento < self.reintentos:
+                # Backoff exponencial con "equal jitter", sin pasar del presupuesto de la llamada
+                espera = min(self.backoff_max_s, self.backoff_base_s * (2 ** intento))
+                espera = espera / 2 + random.uniform(0, espera / 2)
+                if time.monotonic() + espera >= limite:
+                    break
+                time.sleep(espera)
+
+        codigo = ultimo_error.code if isinstance(ultimo_error, urllib.error.HTTPError) else None
+        raise UpstreamError(f"Error consultando el Catastro ({endpoint}): {ultimo_error}", endpoint, codigo)
+
+    def estado(self) -> Dict[str, Dict[str, object]]:
+        """Estado por endpoint (circuito y latencias) para diagnóstico"""
+        with self._lock:
+            endpoints = list(self._breakers)
+        return {
+            ep: {
+                "circuito": self._breakers[ep].estado,
+                "p50_s": self._latencias[ep].percentil(0.50),
+                "p95_s": self._latencias[ep].percentil(0.95),
+            }
+            for ep in endpoints
+        }
+
+
+def en_paralelo(fn: Callable[[Any], Any], elementos: Iterable[Any],
+                max_concurrencia: int = 8) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Aplica 'fn' a cada elemento en hilos, con como mucho 'max_concurrencia' en vuelo,
+    y devuelve (elemento, resultado, error) según van terminando.
+    El ritmo real hacia el Catastro lo marca el token bucket del cliente.
+    """
+    it = iter(elementos)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrencia)) as pool:
+        pendientes = {pool.submit(fn, e): e for e in islice(it, max_concurrencia)}
+        while pendientes:
+            hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                elemento = pendientes.pop(futuro)
+                error = futuro.exception()
+                yield elemento, (None if error else futuro.result()), error
+                for siguiente in islice(it, 1):
+                    pendientes[pool.submit(fn, siguiente)] = siguiente
+
+
+# Cliente compartido por el proceso (configurable por entorno)
+catastro = UpstreamClient(
+    reintentos=int(os.getenv("CATASTRO_REINTENTOS", "2")),
+    tasa_rps=float(os.getenv("CATASTRO_RPS", "10")),
+    rafaga=float(os.getenv("CATASTRO_RAFAGA", "20")),
+    hedging=os.getenv("CATASTRO_HEDGING", "0") == "1",
+    presupuesto_s=float(os.getenv("CATASTRO_PRESUPUESTO_S", "20")),
+    directorio_coalescencia=os.getenv("CATASTRO_COALESCENCIA_DIR", ""),
+)
@@ -0,0 +1,158 @@
+"""
+Lector de formatos vectoriales GDAL (FlatGeobuf, GeoJSON, GeoJSONSeq) para catastro
+Lectura Arrow con pyogrio y decodificación vectorizada con shapely, sin GeoDataFrame
+ni iteración por filas. SHPReader usa la misma decodificación.
+"""
+
+import os
+import numpy as np
+import shapely
+from typing import List, Optional
+from core.parcel_model import ParcelaInfo
+from core.coordinate_transformer import CoordinateTransformer, limpiar_epsg
+from core.ventana import BBox, ventana_en_crs
+
+# Columnas candidatas a referencia, por prioridad
+COLUMNAS_REFERENCIA = ['REF_CAT', 'REFCAT', 'ID', 'LABEL', 'identifica', 'referencia',
+                       'nationalCadastralReference']
+
+# Extensión -> prefijo de las entidades sin referencia
+EXTENSIONES = {'.fgb': 'FGB_FEATURE', '.geojson': 'GEOJSON_FEATURE', '.geojsonseq': 'GEOJSON_FEATURE'}
+
+
+def epsg_de_crs(crs) -> Optional[str]:
+    """Código EPSG de la definición de CRS de GDAL (None si no tiene o no es EPSG)"""
+    if not crs:
+        return None
+    from pyproj import CRS
+    codigo = CRS.from_user_input(crs).to_epsg()
+    return str(codigo) if codigo else None
+
+
+class VectorReader:
+    """Lector de FlatGeobuf y GeoJSON/GeoJSONSeq"""
+
+    @staticmethod
+    def leer(ruta: str, epsg: str = "25830", bbox: Optional[BBox] = None) -> List[ParcelaInfo]:
+        """
+        Lee un .fgb, .geojson o .geojsonseq y lo convierte a ParcelaInfo en el EPSG indicado
+        (reproyectando si el archivo está en otro CRS, p. ej. GeoJSON en WGS84).
+
+        bbox: (xmin, ymin, xmax, ymax) en el EPSG indicado. Solo se leen las entidades que
+        lo cortan; en FlatGeobuf el filtro usa el índice R-tree (Hilbert) del archivo, con
+        lo que no se lee el resto.
+        """
+        import pyogrio
+
+        prefijo = EXTENSIONES.get(os.path.splitext(ruta)[1].lower(), 'FEATURE')
+        destino = limpiar_epsg(epsg)
+
+        bbox_origen = None
+        if bbox is not None:
+            bbox_origen = ventana_en_crs(bbox, destino, epsg_de_crs(pyogrio.read_info(ruta)["crs"]))
+
+        meta, tabla = pyogrio.read_arrow(ruta, bbox=bbox_origen, return_fids=True)
+        return VectorReader.parcelas_desde_arrow(
+            meta, tabla, os.path.basename(ruta), prefijo, epsg_origen=epsg_de_crs(meta["crs"]), epsg_destino=destino
+        )
+
+    @staticmethod
+    def parcelas_desde_arrow(meta: dict, tabla, capa: str, prefijo: str,
+                             epsg_origen: Optional[str] = None,
+                             epsg_destino: Optional[str] = None) -> List[ParcelaInfo]:
+        """
+        Convierte el resultado de pyogrio.read_arrow a ParcelaInfo: WKB decodificado de una
+        vez, MultiPolygon partidos en polígonos (sufijo .N en la referencia) y anillos y
+        vértices extraídos con desplazamientos. Si se pasan ambos EPSG y difieren, todas
+        las coordenadas se reproyectan en una sola llamada.
+        """
+        wkb = tabla.column(meta["geometry_name"] or "wkb_geometry").to_numpy(zero_copy_only=False)
+        geoms = shapely.from_wkb(wkb)
+        if epsg_origen and epsg_destino and epsg_origen != epsg_destino:
+            geoms = shapely.transform(
+                geoms, lambda xy: CoordinateTransformer.transformar_array(xy, epsg_origen, epsg_destino)
+            )
+
+        # Número de entidad en el archivo (FID si el lector lo devuelve)
+        if "OGC_FID" in tabla.column_names:
+            numeros = (np.asarray(tabla.column("OGC_FID").to_numpy(zero_copy_only=False), dtype=np.int64) + 1).tolist()
+        else:
+            numeros = list(range(1, len(geoms) + 1))
+
+        # Solo Polygon (3) y MultiPolygon (6)
+        tipos = shapely.get_type_id(geoms)
+        indices = np.flatnonzero((tipos == 3) | (tipos == 6))
+
+        # Partes de cada MultiPolygon -> polígonos sueltos, con su entidad de origen
+        polys, parte_de = shapely.get_parts(geoms[indices], return_index=True)
+        no_vacios = ~shapely.is_empty(polys)
+        polys, parte_de = polys[no_vacios], parte_de[no_vacios]
+        if len(polys) == 0:
+            return []
+        entidad = indices[parte_de]
+        partes_por_entidad = np.bincount(parte_de, minlength=len(indices))[parte_de]
+        inicio_entidad = np.concatenate(([0], np.cumsum(np.bincount(parte_de))[:-1]))
+        num_parte = np.arange(len(polys)) - inicio_entidad[parte_de]
+
+        # Anillos (exterior primero) y sus vértices, con desplazamientos
+        anillos, anillo_de = shapely.get_rings(polys, return_index=True)
+        xy, vertice_de = shapely.get_coordinates(anillos, return_index=True)
+        fin_anillo = np.cumsum(np.bincount(vertice_de, minlength=len(anillos))).tolist()
+        fin_poly = np.cumsum(np.bincount(anillo_de, minlength=len(polys))).tolist()
+        puntos = list(zip(xy[:, 0].tolist(), xy[:, 1].tolist()))
+
+        areas = shapely.area(polys).tolist()
+        centroides = shapely.get_coordinates(shapely.centroid(polys)).tolist()
+
+        referencias = VectorReader._referencias(tabla, len(geoms))
+
+        parcelas = []
+        a = 0
+        for i in range(len(polys)):
+            vertices = [puntos[(fin_anillo[k - 1] if k else 0):fin_anillo[k]] for k in range(a, fin_poly[i])]
+            a = fin_poly[i]
+
+            parcela = ParcelaInfo()
+            parcela.coordenadas = vertices[0]
+            parcela.interiores = vertices[1:]
+
+            idx = int(entidad[i])
+            referencia = referencias[idx]
+            if referencia:
+                # Si es multi-polígono, añadir sufijo
+                if partes_por_entidad[i] > 1:
+                    referencia = f"{referencia}.{num_parte[i] + 1}"
+
+                # Si parece una RC válida (14 o 20)
+                ref_limpia = referencia.replace(" ", "").upper()
+                if len(ref_limpia) in [14, 20] and ref_limpia.isalnum():
+                    parcela.referencia_catastral = ref_limpia
+                    parcela.nombre_archivo = ref_limpia
+                else:
+                    parcela.nombre_archivo = referencia
+            else:
+                parcela.nombre_archivo = f"{prefijo}_{numeros[idx]}"
+
+            parcela.area = areas[i]
+            parcela.punto_referencia = tuple(centroides[i])
+            parcela.capa_origen = capa
+
+            parcelas.append(parcela)
+
+        return parcelas
+
+    @staticmethod
+    def _referencias(tabla, n: int) -> List[Optional[str]]:
+        """
+        Referencia de cada entidad: primer valor no vacío de las columnas candidatas
+        (resueltas una sola vez por archivo, sin distinguir mayúsculas).
+        """
+        por_nombre = {c.upper(): c for c in tabla.column_names}
+        columnas = [por_nombre[c.upper()] for c in COLUMNAS_REFERENCIA if c.upper() in por_nombre]
+
+        referencias: List[Optional[str]] = [None] * n
+        for col in columnas:
+            for i, valor in enumerate(tabla.column(col).to_pylist()):
+                if referencias[i] is None and valor:
+                    referencias[i] = str(valor)
+        return referencias
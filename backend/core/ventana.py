@@ -0,0 +1,41 @@
+"""
+Ventana espacial (bbox) de lectura
+Los lectores descartan las entidades cuya envolvente no corta la ventana antes de
+construir ninguna geometría, así que el trabajo depende del área de interés y no
+del tamaño del archivo.
+"""
+
+from typing import Optional, Tuple
+import numpy as np
+from core.coordinate_transformer import CoordinateTransformer, limpiar_epsg
+
+# (xmin, ymin, xmax, ymax)
+BBox = Tuple[float, float, float, float]
+
+
+def ventana_desde_punto(x: float, y: float, radio: float) -> BBox:
+    """Ventana cuadrada que contiene el círculo de centro (x, y) y el radio dado"""
+    return x - radio, y - radio, x + radio, y + radio
+
+
+def ventana_en_crs(bbox: Optional[BBox], epsg_bbox: str, epsg_archivo: Optional[str]) -> Optional[BBox]:
+    """
+    La ventana expresada en el CRS del archivo (rectángulo envolvente si hay que
+    reproyectar). Sin EPSG de archivo se asume el de la ventana.
+    """
+    if bbox is None:
+        return None
+    if not epsg_archivo or limpiar_epsg(epsg_archivo) == limpiar_epsg(epsg_bbox):
+        return tuple(bbox)
+    return CoordinateTransformer.transformar_bbox(tuple(bbox), epsg_bbox, epsg_archivo)
+
+
+def corta_ventana(xy: np.ndarray, bbox: Optional[BBox]) -> bool:
+    """True si la envolvente de los vértices (N, 2+) corta la ventana (o no hay ventana)"""
+    if bbox is None:
+        return True
+    if not len(xy):
+        return False
+    xmin, ymin = xy[:, :2].min(axis=0)
+    xmax, ymax = xy[:, :2].max(axis=0)
+    return xmin <= bbox[2] and xmax >= bbox[0] and ymin <= bbox[3] and ymax >= bbox[1]
@@ -0,0 +1,136 @@
+"""
+Caché espacial de zonas de valoración (WMS del Catastro)
+Cuantiza lat/lon en celdas de rejilla (~25 m) para no repetir consultas
+WMS sobre puntos casi coincidentes (misma calle, misma urbanización).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Metros por grado de latitud (aproximación esférica, suficiente a escala de celda)
+METROS_POR_GRADO = 111320.0
+
+
+def celda_rejilla(lat: float, lon: float, tam_celda_m: float) -> Tuple[int, int]:
+    """
+    Celda (fila, columna) de una rejilla de lado 'tam_celda_m' metros que contiene el punto.
+    La escala en X se toma del centro de la fila para que la rejilla sea estable.
+    """
+    paso_lat = tam_celda_m / METROS_POR_GRADO
+    fila = math.floor(lat / paso_lat)
+    lat_centro = (fila + 0.5) * paso_lat
+    paso_lon = tam_celda_m / (METROS_POR_GRADO * max(math.cos(math.radians(lat_centro)), 1e-6))
+    columna = math.floor(lon / paso_lon)
+    return fila, columna
+
+
+class ZoneCache:
+    """Caché LRU con TTL de zonas de valoración indexada por celda de rejilla"""
+
+    def __init__(self, tam_celda_m: float = 25.0, ttl_segundos: float = 86400.0,
+                 max_entradas: int = 50000, min_vecinos: int = 2):
+        """
+        Args:
+            tam_celda_m: Lado de la celda de cuantización en metros
+            ttl_segundos: Tiempo de vida de cada entrada
+            max_entradas: Número máximo de celdas guardadas (se expulsan las menos usadas)
+            min_vecinos: Celdas vecinas mínimas que deben coincidir para aceptar un acierto por vecindad
+                (una sola vecina no tiene con quién coincidir: el mínimo efectivo es 2)
+        """
+        self.tam_celda_m = tam_celda_m
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.min_vecinos = max(2, min_vecinos)
+        self._celdas: "OrderedDict[Tuple[int, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.aciertos_vecinos = 0
+        self.fallos = 0
+
+    def celda(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Devuelve la celda (fila, columna) que contiene el punto"""
+        return celda_rejilla(lat, lon, self.tam_celda_m)
+
+    def _leer(self, clave: Tuple[int, int], ahora: float) -> Optional[str]:
+        entrada = self._celdas.get(clave)
+        if entrada is None:
+            return None
+        zona, expira = entrada
+        if expira <= ahora:
+            del self._celdas[clave]
+            return None
+        self._celdas.move_to_end(clave)
+        return zona
+
+    def get(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Busca la zona para el punto.
+        1. Acierto directo en la celda del punto.
+        2. Si no, acierto por vecindad: las celdas vecinas cacheadas deben
+           coincidir TODAS en la misma zona (si discrepan, hay un límite de zona cerca),
+           ser al menos min_vecinos e incluir una que comparta lado con la celda
+           (las diagonales están hasta ~2 celdas del punto).
+        """
+        fila, columna = self.celda(lat, lon)
+        ahora = time.monotonic()
+        with self._lock:
+            zona = self._leer((fila, columna), ahora)
+            if zona is not None:
+                self.aciertos += 1
+                return zona
+
+            zonas_vecinas = []
+            con_lado = False
+            for df in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    if df == 0 and dc == 0:
+                        continue
+                    zona_vecina = self._leer((fila + df, columna + dc), ahora)
+                    if zona_vecina is not None:
+                        zonas_vecinas.append(zona_vecina)
+                        con_lado = con_lado or df == 0 or dc == 0
+
+            if con_lado and len(zonas_vecinas) >= self.min_vecinos and len(set(zonas_vecinas)) == 1:
+                self.aciertos_vecinos += 1
+                return zonas_vecinas[0]
+
+            self.fallos += 1
+            return None
+
+    def put(self, lat: float, lon: float, zona: str) -> None:
+        """Guarda la zona resuelta para la celda del punto"""
+        if not zona:
+            return
+        clave = self.celda(lat, lon)
+        with self._lock:
+            self._celdas[clave] = (zona, time.monotonic() + self.ttl_segundos)
+            self._celdas.move_to_end(clave)
+            while len(self._celdas) > self.max_entradas:
+                self._celdas.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._celdas.clear()
+            self.aciertos = self.aciertos_vecinos = self.fallos = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entradas": len(self._celdas),
+                "aciertos": self.aciertos,
+                "aciertos_vecinos": self.aciertos_vecinos,
+                "fallos": self.fallos,
+            }
+
+
+# Instancia compartida por el proceso (configurable por entorno)
+zone_cache = ZoneCache(
+    tam_celda_m=float(os.getenv("ZONA_CACHE_CELDA_M", "25")),
+    ttl_segundos=float(os.getenv("ZONA_CACHE_TTL_S", "86400")),
+    max_entradas=int(os.getenv("ZONA_CACHE_MAX", "50000")),
+    min_vecinos=int(os.getenv("ZONA_CACHE_MIN_VECINOS", "2")),
+)
@@ -3,18 +3,20 @@ Backend FastAPI para Visor/Conversor Catastral DXF ↔ GML
 MEJORAS: Topología + Detección de Conflictos + Conversión coordenadas
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, FileResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import tempfile
 import os
+import hashlib
 import re
 import urllib.request
 import ssl
 import json
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Importar módulos core
@@ -24,7 +26,24 @@ from core.parcel_model import ParcelaInfo
 from core.conflict_detector import ConflictDetector
 from core.coordinate_transformer import CoordinateTransformer
 from core.kml_generator import generate_kml_from_gml_features
-from core.tax_calculator import TaxCalculator, MUNICIPALITIES
+from core.tax_calculator import TaxCalculator, resolver_municipio, _vuelos_zona
+from core.zone_cache import zone_cache
+from core.ponencia_store import ponencias
+from core.batch_tax_calculator import BatchTaxCalculator
+from core.catastro_parser import CatastroParser, UnidadCatastral
+from core.batch_reverse_geocoder import BatchReverseGeocoder, PuntoEntrada
+from core.batch_rustic_lookup import BatchRusticLookup, consultar_con_cache, expandir_rango, rustica_cache
+from core.inspector import Inspector, inspeccion_cache
+from core.upstream import (
+    catastro, url_ovc, RUTA_CALLEJERO, RUTA_COORDENADAS,
+    UpstreamError, CircuitOpenError, RateLimitError
+)
+from core import profiling
+from core.profiling import ProfilingMiddleware
+from core.metrics import (
+    etapa, medir_exportacion, registrar_caches, exportar,
+    ANALYZE_PARCELAS, ANALYZE_VERTICES, PROMETHEUS_AVAILABLE, CONTENT_TYPE_LATEST
+)
 from core.building_generator import BuildingGenerator
 from core.dxf_generator import DXFGenerator
 from core.shape_generator import ShapeGenerator
@@ -51,6 +70,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado bajo demanda (inactivo si no se define PROFILING_TOKEN)
+app.add_middleware(ProfilingMiddleware)
+
 
 # ===== MODELOS PYDANTIC =====
 
@@ -67,6 +89,7 @@ class ParcelaResponse(BaseModel):
     is_hole: bool = False
     capa_origen: str = ""
     nombre_archivo: str = ""
+    tipo_entidad: str = "CP"
 
 
 class AnalyzeResponse(BaseModel):
@@ -79,6 +102,27 @@ class AnalyzeResponse(BaseModel):
     mensaje: str
 
 
+class CapaInspeccion(BaseModel):
+    """Capa de un archivo inspeccionado"""
+    nombre: str
+    geometrias: int
+    textos: int
+    bbox: Optional[List[float]] = None  # [xmin, ymin, xmax, ymax] en el CRS del archivo
+
+
+class InspectResponse(BaseModel):
+    """Respuesta del endpoint /inspect"""
+    formato: str
+    capas: List[CapaInspeccion]
+    bbox: Optional[List[float]] = None
+    epsg_sugerido: Optional[str] = None
+    tipo_entidad_sugerido: str
+    capas_parcelas: List[str]  # Lo que leería /analyze con el tipo sugerido
+    capa_textos: str
+    hash: str  # SHA-256 del contenido (clave de la caché)
+    en_cache: bool = False
+
+
 class GenerateGMLRequest(BaseModel):
     """Request para generar GML con referencias editadas"""
     parcelas: List[Dict[str, Any]]
@@ -95,6 +139,7 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "analyze": "POST /analyze - Analizar archivo DXF",
+            "inspect": "POST /inspect - Capas, recuentos y extensión sin análisis completo",
             "generate-gml": "POST /generate-gml - Generar GML con datos editados",
             "health": "GET /health - Health check"
         }
@@ -104,7 +149,47 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "catastro-api"}
+    return {"status": "healthy", "service": "catastro-api", "upstream": catastro.estado()}
+
+
+# Aciertos de las cachés internas, leídos en cada scrape de /metrics
+registrar_caches({
+    "zonas": zone_cache.stats,
+    "zonas_vuelo": _vuelos_zona.stats,
+    "rustica": rustica_cache.stats,
+    "catastro_vuelo": catastro.vuelos.stats,
+    "inspeccion": inspeccion_cache.stats,
+})
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus (requiere prometheus-client)"""
+    if not PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="prometheus-client no está instalado")
+    return Response(content=exportar(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/profiling/{id_informe}")
+async def obtener_perfil(id_informe: str, x_profile_token: Optional[str] = Header(None)):
+    """Informe de una petición perfilada (misma cabecera X-Profile-Token que al perfilar)"""
+    if not profiling.token_valido(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    informe = profiling.leer_informe(id_informe)
+    if informe is None:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    return informe
+
+
+@app.get("/profiling/{id_informe}/prof")
+async def descargar_perfil(id_informe: str, x_profile_token: Optional[str] = Header(None)):
+    """Volcado pstats del perfil (para snakeviz, gprof2dot...)"""
+    if not profiling.token_valido(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+    ruta = profiling.ruta_informe(id_informe, "prof")
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    return FileResponse(ruta, media_type="application/octet-stream", filename=f"{id_informe}.prof")
+
 
 @app.get("/debug-cors")
 async def debug_cors():
@@ -116,78 +201,153 @@ async def debug_cors():
 
 from core.shp_reader import SHPReader
 from core.kml_reader import KMLReader
+from core.vector_reader import VectorReader
+from core.gml_reader import GMLReader
+from core.ventana import ventana_desde_punto
+
+# Extensión admitida en /analyze -> formato (etiqueta de las métricas)
+FORMATOS_ANALYZE = {
+    '.dxf': 'dxf', '.zip': 'shp', '.kml': 'kml', '.kmz': 'kmz',
+    '.fgb': 'fgb', '.geojson': 'geojson', '.geojsonseq': 'geojsonseq', '.gml': 'gml',
+}
+
+
+def _parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """'xmin,ymin,xmax,ymax' -> tupla de floats (400 si no es válido)"""
+    if not bbox:
+        return None
+    try:
+        xmin, ymin, xmax, ymax = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser 'xmin,ymin,xmax,ymax'")
+    if xmin >= xmax or ymin >= ymax:
+        raise HTTPException(status_code=400, detail="bbox vacío: xmin < xmax e ymin < ymax")
+    return xmin, ymin, xmax, ymax
+
+
+def _parse_ventana(bbox: Optional[str], punto: Optional[str],
+                   radio: Optional[float]) -> Optional[Tuple[float, float, float, float]]:
+    """Ventana de lectura: bbox, o punto 'x,y' + radio (400 si no es válida o vienen ambas)"""
+    if punto is None and radio is None:
+        return _parse_bbox(bbox)
+    if bbox:
+        raise HTTPException(status_code=400, detail="Indicar bbox o punto+radio, no ambos")
+    if punto is None or radio is None or radio <= 0:
+        raise HTTPException(status_code=400, detail="punto 'x,y' requiere un radio > 0 (y viceversa)")
+    try:
+        x, y = (float(v) for v in punto.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="punto debe ser 'x,y'")
+    return ventana_desde_punto(x, y, radio)
+
+
+@app.post("/inspect", response_model=InspectResponse)
+def inspect_file(file: UploadFile = File(...)):
+    """
+    Vista previa de un archivo antes de /analyze: capas con número de geometrías y textos,
+    envolventes, CRS probable y tipo de entidad/capas sugeridos. No lee las geometrías
+    (DXF por pares de códigos, SHP/FlatGeobuf por cabeceras). Cacheado por hash del contenido.
+    """
+    # Síncrono a propósito: el hash y el escaneo del archivo corren en el threadpool
+    extension = os.path.splitext(file.filename.lower())[1]
+    if extension not in FORMATOS_ANALYZE:
+        raise HTTPException(status_code=400, detail="El archivo debe ser DXF, ZIP (Shapefile), KMZ/KML, GML, FlatGeobuf o GeoJSON")
+    formato = FORMATOS_ANALYZE[extension]
+
+    content = file.file.read()
+    clave = hashlib.sha256(content).hexdigest()
+    resultado = inspeccion_cache.get((clave, formato))
+    if resultado is not None:
+        return InspectResponse(**resultado, hash=clave, en_cache=True)
+
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as tmp_file:
+            tmp_file.write(content)
+            tmp_path = tmp_file.name
+        resultado = Inspector.inspeccionar(tmp_path, formato)
+    except Exception as e:
+        print(f"ERROR inspeccionando {file.filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error inspeccionando archivo: {str(e)}")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    inspeccion_cache.put((clave, formato), resultado)
+    return InspectResponse(**resultado, hash=clave)
+
 
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_file(
     file: UploadFile = File(...),
     epsg: str = Query("25830", description="Código EPSG del sistema UTM (25829, 25830, 25831, 32628)"),
-    tipo_entidad: str = Query("CP", description="Tipo de entidad: CP (Parcela) o BU (Edificio)")
+    tipo_entidad: str = Query("CP", description="Tipo de entidad: CP (Parcela) o BU (Edificio)"),
+    bbox: Optional[str] = Query(None, description="Ventana 'xmin,ymin,xmax,ymax' en el EPSG UTM"),
+    punto: Optional[str] = Query(None, description="Centro 'x,y' de la ventana en el EPSG UTM (con radio)"),
+    radio: Optional[float] = Query(None, description="Radio en metros alrededor de punto")
 ):
     """
-    Analiza un archivo DXF, ZIP (Shapefile) o KMZ y devuelve parcelas/edificios.
+    Analiza un archivo DXF, ZIP (Shapefile), KMZ, GML INSPIRE, FlatGeobuf o GeoJSON y devuelve parcelas/edificios.
     """
     
     filename = file.filename.lower()
-    if not (filename.endswith('.dxf') or filename.endswith('.zip') or filename.endswith('.kmz') or filename.endswith('.kml')):
-        raise HTTPException(status_code=400, detail="El archivo debe ser DXF, ZIP (Shapefile) o KMZ/KML")
+    extension = os.path.splitext(filename)[1]
+    if extension not in FORMATOS_ANALYZE:
+        raise HTTPException(status_code=400, detail="El archivo debe ser DXF, ZIP (Shapefile), KMZ/KML, GML, FlatGeobuf o GeoJSON")
+    ventana = _parse_ventana(bbox, punto, radio)
     
+    # Formato de entrada (etiqueta de las métricas)
+    formato = FORMATOS_ANALYZE[extension]
+
     try:
-        # Guardar archivo temporalmente
-        if filename.endswith('.zip'):
-            suffix = '.zip'
-        elif filename.endswith('.kmz') or filename.endswith('.kml'):
-            suffix = '.kmz' if filename.endswith('.kmz') else '.kml'
-        else:
-            suffix = '.dxf'
-            
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
+        # Guardar archivo temporalmente (con su extensión: GDAL elige el driver por ella).
+        # "guardado" no incluye la subida: FastAPI ya ha recibido el multipart al llamar al handler
+        with etapa("guardado", formato):
+            with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as tmp_file:
+                content = await file.read()
+                tmp_file.write(content)
+                tmp_path = tmp_file.name
         
         print(f"DEBUG: Archivo guardado en: {tmp_path}")
         
-        parcelas = []
-        if filename.endswith('.zip'):
-            # 1. Leer de Shapefile (ZIP)
-            parcelas = SHPReader.leer_desde_zip(tmp_path)
-            print(f"DEBUG: {len(parcelas)} geometrías extraídas de SHP")
-        elif filename.endswith('.kmz') or filename.endswith('.kml'):
-            # 1.5. Leer de KML/KMZ
-            parcelas = KMLReader.leer_desde_kmz(tmp_path, epsg)
-            print(f"DEBUG: {len(parcelas)} geometrías extraídas de KMZ/KML")
-        else:
-            # 2. Leer de DXF
-            # Obtener capas del DXF
-            capas_info = DXFReader.obtener_capas_con_detalle(tmp_path)
-            print(f"DEBUG: Capas encontradas: {capas_info}")
-            
-            # Selección de capas según tipo
-            if tipo_entidad == "BU":
-                # Para edificios, ser más permisivo (usar todas las capas con geometrías si no hay LP/LI específicas)
-                capas_parcelas = [c[0] for c in capas_info if c[1] > 0]
-                capa_textos = [c[0] for c in capas_info if c[2] > 0]
-                capa_textos = capa_textos[0] if capa_textos else ""
+        with etapa("lectura", formato):
+            parcelas = []
+            if filename.endswith('.zip'):
+                # 1. Leer de Shapefile (ZIP)
+                parcelas = SHPReader.leer_desde_zip(tmp_path, ventana)
+                print(f"DEBUG: {len(parcelas)} geometrías extraídas de SHP")
+            elif filename.endswith('.kmz') or filename.endswith('.kml'):
+                # 1.5. Leer de KML/KMZ
+                parcelas = KMLReader.leer_desde_kmz(tmp_path, epsg, ventana)
+                print(f"DEBUG: {len(parcelas)} geometrías extraídas de KMZ/KML")
+            elif formato == 'gml':
+                # 1.55. Leer de GML INSPIRE (CadastralParcel / Building)
+                parcelas = GMLReader.leer_gml(tmp_path, epsg, ventana)
+                print(f"DEBUG: {len(parcelas)} geometrías extraídas de GML")
+            elif formato in ('fgb', 'geojson', 'geojsonseq'):
+                # 1.6. Leer de FlatGeobuf / GeoJSON (con ventana si se indica)
+                parcelas = VectorReader.leer(tmp_path, epsg, ventana)
+                print(f"DEBUG: {len(parcelas)} geometrías extraídas de {formato.upper()}")
             else:
-                # Lógica original para parcelas
-                capas_parcelas = [c[0] for c in capas_info if 'LP' in c[0].upper() and c[1] > 0]
-                capas_textos = [c[0] for c in capas_info if 'LT' in c[0].upper() and c[2] > 0]
-                
-                if not capas_parcelas:
-                    capas_parcelas = [c[0] for c in capas_info if c[1] > 0]
-                
-                capa_textos = capas_textos[0] if capas_textos else ""
-            
-            print(f"DEBUG: Capas seleccionadas - Geometría: {capas_parcelas}, Textos: {capa_textos}")
-            
-            # Leer parcelas/edificios del DXF
-            parcelas = DXFReader.leer_borde_parcelas(tmp_path, capas_parcelas, capa_textos)
-            print(f"DEBUG: {len(parcelas)} geometrías extraídas de DXF")
+                # 2. Leer de DXF
+                # Obtener capas del DXF
+                capas_info = DXFReader.obtener_capas_con_detalle(tmp_path)
+                print(f"DEBUG: Capas encontradas: {capas_info}")
+
+                # Selección de capas según tipo
+                capas_parcelas, capa_textos = DXFReader.seleccionar_capas(capas_info, tipo_entidad)
+
+                print(f"DEBUG: Capas seleccionadas - Geometría: {capas_parcelas}, Textos: {capa_textos}")
+
+                # Leer parcelas/edificios del DXF
+                parcelas = DXFReader.leer_borde_parcelas(tmp_path, capas_parcelas, capa_textos, ventana)
+                print(f"DEBUG: {len(parcelas)} geometrías extraídas de DXF")
         
-        # Asignar tipo de entidad y asegurar nombre de archivo original
+        # Asignar tipo de entidad (el GML ya lo trae de la entidad INSPIRE) y asegurar nombre de archivo original
         base_filename = os.path.splitext(file.filename)[0]
         for p in parcelas:
-            p.tipo_entidad = tipo_entidad
+            if formato != 'gml':
+                p.tipo_entidad = tipo_entidad
             # Si el nombre detectado es genérico o nulo, usar el del archivo original
             if not p.nombre_archivo or "TMP" in p.nombre_archivo.upper() or "PARCELA_" in p.nombre_archivo.upper():
                 p.nombre_archivo = base_filename
@@ -196,74 +356,85 @@ async def analyze_file(
             p.nombre_original = base_filename
         
         # 3. MEJORA 1: Limpieza topológica
-        parcelas = DXFReader.limpiar_topologia(parcelas)
+        with etapa("topologia", formato):
+            parcelas = DXFReader.limpiar_topologia(parcelas)
         print(f"DEBUG: Limpieza topológica completada")
         
         # 4. Detectar nesting (huecos interiores)
-        anidamientos = DXFReader.detect_nesting(parcelas)
-        print(f"DEBUG: Anidamientos detectados: {anidamientos}")
-        
-        # Marcar huecos con is_hole=True
-        parcelas = ConflictDetector.marcar_huecos(parcelas, anidamientos)
-        
-        # Agrupar parcelas por padre (agregar huecos a su padre)
-        parcelas_procesadas = []
-        indices_procesados = set()
-        
-        for idx, parcela in enumerate(parcelas):
-            if idx in indices_procesados:
-                continue
-            
-            # Si es un padre con huecos, agregar interiores
-            if idx in anidamientos:
-                for hijo_idx in anidamientos[idx]:
-                    if hijo_idx < len(parcelas):
-                        parcela.interiores.append(parcelas[hijo_idx].coordenadas)
-                        indices_procesados.add(hijo_idx)
-            
-            # Si no es un hueco independiente, añadir
-            if not parcela.is_hole or idx not in indices_procesados:
-                parcelas_procesadas.append(parcela)
-                indices_procesados.add(idx)
-        
-        parcelas = parcelas_procesadas
-        print(f"DEBUG: {len(parcelas)} parcelas después de agrupar huecos")
+        with etapa("anidamiento", formato):
+            anidamientos = DXFReader.detect_nesting(parcelas)
+            print(f"DEBUG: Anidamientos detectados: {anidamientos}")
+
+            # Marcar huecos con is_hole=True
+            parcelas = ConflictDetector.marcar_huecos(parcelas, anidamientos)
+
+            # Agrupar parcelas por padre (agregar huecos a su padre)
+            parcelas_procesadas = []
+            indices_procesados = set()
+
+            for idx, parcela in enumerate(parcelas):
+                if idx in indices_procesados:
+                    continue
+
+                # Si es un padre con huecos, agregar interiores
+                if idx in anidamientos:
+                    for hijo_idx in anidamientos[idx]:
+                        if hijo_idx < len(parcelas):
+                            parcela.interiores.append(parcelas[hijo_idx].coordenadas)
+                            indices_procesados.add(hijo_idx)
+
+                # Si no es un hueco independiente, añadir
+                if not parcela.is_hole or idx not in indices_procesados:
+                    parcelas_procesadas.append(parcela)
+                    indices_procesados.add(idx)
+
+            parcelas = parcelas_procesadas
+            print(f"DEBUG: {len(parcelas)} parcelas después de agrupar huecos")
         
         # 5. MEJORA 2: Detección de conflictos
-        parcelas = ConflictDetector.detectar_conflictos(parcelas)
+        with etapa("conflictos", formato):
+            parcelas = ConflictDetector.detectar_conflictos(parcelas)
         
-        # 6. Convertir coordenadas UTM → Lat/Lon
-        for parcela in parcelas:
-            parcela.coords_latlon = CoordinateTransformer.utm_to_latlon(parcela.coordenadas, epsg)
+        # 6. Convertir coordenadas UTM → Lat/Lon (exterior e interiores)
+        with etapa("proyeccion", formato):
+            interiores_latlon_por_parcela = []
+            for parcela in parcelas:
+                parcela.coords_latlon = CoordinateTransformer.utm_to_latlon(parcela.coordenadas, epsg)
+                interiores_latlon_por_parcela.append([
+                    CoordinateTransformer.utm_to_latlon(hueco, epsg)
+                    for hueco in parcela.interiores
+                ])
         
         # 7. Preparar respuesta
-        parcelas_response = []
-        num_conflictos = 0
-        num_huecos = sum(len(p.interiores) for p in parcelas)
-        
-        for parcela in parcelas:
-            # Convertir interiores a Lat/Lon
-            interiores_latlon = [
-                CoordinateTransformer.utm_to_latlon(hueco, epsg)
-                for hueco in parcela.interiores
-            ]
-            
-            parcelas_response.append(ParcelaResponse(
-                id=parcela.identificador,
-                referencia_catastral=parcela.referencia_catastral,
-                area=parcela.area,
-                coordenadas_utm=[[x, y] for x, y in parcela.coordenadas],
-                coordenadas_latlon=[[lon, lat] for lon, lat in parcela.coords_latlon],
-                interiores_utm=[[[x, y] for x, y in hueco] for hueco in parcela.interiores],
-                interiores_latlon=[[[lon, lat] for lon, lat in hueco_ll] for hueco_ll in interiores_latlon],
-                has_conflict=parcela.has_conflict,
-                is_hole=parcela.is_hole,
-                capa_origen=parcela.capa_origen,
-                nombre_archivo=parcela.nombre_original or parcela.nombre_archivo
-            ))
-            
-            if parcela.has_conflict:
-                num_conflictos += 1
+        with etapa("serializacion", formato):
+            parcelas_response = []
+            num_conflictos = 0
+            num_huecos = sum(len(p.interiores) for p in parcelas)
+
+            for parcela, interiores_latlon in zip(parcelas, interiores_latlon_por_parcela):
+                parcelas_response.append(ParcelaResponse(
+                    id=parcela.identificador,
+                    referencia_catastral=parcela.referencia_catastral,
+                    area=parcela.area,
+                    coordenadas_utm=[[x, y] for x, y in parcela.coordenadas],
+                    coordenadas_latlon=[[lon, lat] for lon, lat in parcela.coords_latlon],
+                    interiores_utm=[[[x, y] for x, y in hueco] for hueco in parcela.interiores],
+                    interiores_latlon=[[[lon, lat] for lon, lat in hueco_ll] for hueco_ll in interiores_latlon],
+                    has_conflict=parcela.has_conflict,
+                    is_hole=parcela.is_hole,
+                    capa_origen=parcela.capa_origen,
+                    nombre_archivo=parcela.nombre_original or parcela.nombre_archivo,
+                    tipo_entidad=parcela.tipo_entidad
+                ))
+
+                if parcela.has_conflict:
+                    num_conflictos += 1
+
+        num_vertices = sum(len(p.coordenadas) + sum(len(h) for h in p.interiores) for p in parcelas)
+        ANALYZE_PARCELAS.labels(formato).observe(len(parcelas))
+        ANALYZE_VERTICES.labels(formato).observe(num_vertices)
+        profiling.anotar(formato=formato, bytes_entrada=len(content), parcelas=len(parcelas),
+                         vertices=num_vertices, huecos=num_huecos, conflictos=num_conflictos)
         
         # Limpiar archivo temporal
         os.unlink(tmp_path)
@@ -287,6 +458,7 @@ async def analyze_file(
 
 
 @app.post("/generate-gml")
+@medir_exportacion("gml")
 async def generate_gml(request: GenerateGMLRequest):
     """
     Genera un archivo GML a partir de datos de parcelas (posiblemente editados por el usuario)
@@ -353,6 +525,7 @@ async def generate_gml(request: GenerateGMLRequest):
 
 
 @app.post("/generate-kml")
+@medir_exportacion("kml")
 async def generate_kml(request: GenerateGMLRequest):
     """
     Genera un archivo KML para visualización en Google Earth.
@@ -412,6 +585,7 @@ async def generate_kml(request: GenerateGMLRequest):
 
 
 @app.post("/generate-kmz")
+@medir_exportacion("kmz")
 async def generate_kmz(request: GenerateGMLRequest):
     """
     Exporta las parcelas actuales a formato KMZ (KML Comprimido).
@@ -451,6 +625,7 @@ async def generate_kmz(request: GenerateGMLRequest):
 
 
 @app.post("/generate-dxf")
+@medir_exportacion("dxf")
 async def generate_dxf(request: GenerateGMLRequest):
     """
     Exporta las parcelas actuales a formato DXF.
@@ -494,6 +669,7 @@ async def generate_dxf(request: GenerateGMLRequest):
 
 
 @app.post("/generate-shape")
+@medir_exportacion("shape")
 async def generate_shape(request: GenerateGMLRequest):
     """
     Exporta las parcelas actuales a formato Shapefile (ZIP).
@@ -547,6 +723,7 @@ async def generate_shape(request: GenerateGMLRequest):
 
 
 @app.post("/generate-building-gml")
+@medir_exportacion("building_gml")
 async def generate_building_gml(request: GenerateGMLRequest):
     """
     Genera GML de Edificio (INSPIRE Building) para las parcelas enviadas.
@@ -604,6 +781,8 @@ class BuscarRCRequest(BaseModel):
     referencia_catastral: str
     provincia: Optional[str] = ""
     municipio: Optional[str] = ""
+    # Pedir el detalle de todas las unidades (una consulta DNPRC por unidad); si no, solo de la principal
+    detalle_unidades: bool = False
 
 class BuscarRusticaRequest(BaseModel):
     provincia: str
@@ -611,33 +790,64 @@ class BuscarRusticaRequest(BaseModel):
     poligono: str
     parcela: str
 
-def _check_catastro_error(xml_text: str) -> Optional[str]:
+# Máximo de unidades de una referencia de las que se pide el detalle con detalle_unidades=true
+# (una consulta DNPRC por unidad, con cargo al mismo límite de tasa que el resto)
+MAX_UNIDADES_DETALLE = int(os.getenv("CATASTRO_MAX_UNIDADES_DETALLE", "10"))
+
+# Límites de las búsquedas por lotes (geocodificación inversa y parcelas rústicas)
+LOTE_MAX_PUNTOS = int(os.getenv("LOTE_MAX_PUNTOS", "5000"))
+LOTE_MAX_PARCELAS = int(os.getenv("LOTE_MAX_PARCELAS", "2000"))
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "8"))
+
+
+def _detallar_unidades(unidades: List[UnidadCatastral], pedidas: List[str]
+                       ) -> Tuple[List[UnidadCatastral], List[str]]:
     """
-    Parsea el XML del Catastro y devuelve el mensaje de error si lo hay.
-    Los errores vienen en la estructura <lerr><err><cod>N</cod><des>MENSAJE</des></err></lerr>
-    Retorna None si no hay error.
+    Consulta el detalle (Consulta_DNPRC con los 20 caracteres) de las unidades pedidas de una
+    lista lrcdnp, hasta MAX_UNIDADES_DETALLE. Devuelve la lista (con el detalle sustituido donde
+    lo hay) y las referencias que se quedan sin detalle: no pedidas, por encima del límite o
+    cuya consulta ha fallado.
     """
-    import re
-    # Buscar errores con regex (más robusto que ElementTree con namespaces)
-    cod_match = re.search(r'<cod>(\d+)</cod>', xml_text, re.IGNORECASE)
-    des_match = re.search(r'<des>([^<]+)</des>', xml_text, re.IGNORECASE)
-    
-    if cod_match and des_match:
-        cod = int(cod_match.group(1))
-        des = des_match.group(1).strip()
-        if cod > 0:  # Código 0 = sin error
-            return des
-    
-    # También comprobar el campo <cuerr> que indica si hay error (1 = hay error)
-    cuerr_match = re.search(r'<cuerr>(\d+)</cuerr>', xml_text, re.IGNORECASE)
-    if cuerr_match and int(cuerr_match.group(1)) > 0 and des_match:
-        return des_match.group(1).strip()
-    
-    return None
+    def detalle(unidad: UnidadCatastral) -> Optional[UnidadCatastral]:
+        try:
+            url = url_ovc(RUTA_CALLEJERO, "Consulta_DNPRC", Provincia="", Municipio="", RC=unidad.rc)
+            respuesta = CatastroParser.parse(catastro.get(url, "Consulta_DNPRC"))
+        except (UpstreamError, ValueError) as e:
+            print(f"DEBUG buscar-rc: sin detalle para {unidad.rc}: {e}")
+            return None
+        if respuesta.error or not respuesta.unidades:
+            return None
+        return respuesta.unidades[0]
+
+    pedidas = set(pedidas)
+    indices = [i for i, u in enumerate(unidades) if u.rc in pedidas and len(u.rc) == 20][:MAX_UNIDADES_DETALLE]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        detalladas = list(pool.map(detalle, [unidades[i] for i in indices]))
+
+    resultado = list(unidades)
+    con_detalle = set()
+    for i, unidad in zip(indices, detalladas):
+        if unidad is not None:
+            resultado[i] = unidad
+            con_detalle.add(i)
+    sin_detalle = [u.rc for i, u in enumerate(unidades) if i not in con_detalle]
+    return resultado, sin_detalle
+
+
+def _error_upstream(e: UpstreamError) -> Dict[str, Any]:
+    """Respuesta rápida cuando el Catastro está caído, degradado o limitado"""
+    print(f"Error upstream catastro ({e.endpoint}): {e}")
+    if isinstance(e, CircuitOpenError):
+        return {"encontrado": False, "error": "El servicio del Catastro no responde en este momento. Inténtelo de nuevo en unos segundos."}
+    if isinstance(e, RateLimitError):
+        return {"encontrado": False, "error": "Demasiadas consultas al Catastro. Inténtelo de nuevo en unos segundos."}
+    if e.codigo_http:
+        return {"encontrado": False, "error": f"Error HTTP {e.codigo_http} del servicio del Catastro"}
+    return {"encontrado": False, "error": f"Error consultando el Catastro: {str(e)}"}
 
 
 @app.post("/catastro/buscar-rc")
-async def buscar_por_referencia_catastral(request: BuscarRCRequest):
+def buscar_por_referencia_catastral(request: BuscarRCRequest):
     """
     Proxy para consultar la API XML del Catastro.
     Busca coordenadas de una parcela por su referencia catastral.
@@ -656,105 +866,64 @@ async def buscar_por_referencia_catastral(request: BuscarRCRequest):
     print(f"DEBUG buscar-rc: original='{rc_original}' -> truncado='{rc}'")
 
     try:
-        # Crear contexto SSL permisivo (el certificado del Catastro a veces da problemas)
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
         # 1. Buscar datos del inmueble (para obtener dirección/info)
-        url_datos = f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCallejero.asmx/Consulta_DNPRC?Provincia=&Municipio=&RC={rc}"
-        req1 = urllib.request.Request(url_datos, headers={"User-Agent": "Mozilla/5.0"})
-        resp1 = urllib.request.urlopen(req1, context=ctx, timeout=15)
-        xml_datos = resp1.read().decode("utf-8")
-        
-        # SI LA RESPUESTA ES UNA LISTA (muchos rc), pillar el primero y re-consultar
-        if "<lrcdnp>" in xml_datos and "<rcdnp>" in xml_datos:
-            # Extraer pc1, pc2, car, cc1, cc2 del primer rcdnp
-            def get_sub(tag, text):
-                m = re.search(rf'<{tag}[^>]*>(.*?)</', text, re.I)
-                return m.group(1).strip() if m else ""
-            
-            first_block = re.search(r'<rcdnp>(.*?)</rcdnp>', xml_datos, re.I | re.S).group(1)
-            rc_full = get_sub('pc1', first_block) + get_sub('pc2', first_block) + get_sub('car', first_block) + get_sub('cc1', first_block) + get_sub('cc2', first_block)
-            
-            if len(rc_full) >= 14:
-                url_datos_full = f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCallejero.asmx/Consulta_DNPRC?Provincia=&Municipio=&RC={rc_full}"
-                req1_full = urllib.request.Request(url_datos_full, headers={"User-Agent": "Mozilla/5.0"})
-                resp1_full = urllib.request.urlopen(req1_full, context=ctx, timeout=15)
-                xml_datos_detailed = resp1_full.read().decode("utf-8")
-                # Fusionar lógicamente: usamos el detailed para casi todo, pero guardamos el original para spt si falta
-                xml_datos = xml_datos_detailed + xml_datos
+        url_datos = url_ovc(RUTA_CALLEJERO, "Consulta_DNPRC", Provincia="", Municipio="", RC=rc)
+        datos = CatastroParser.parse(catastro.get(url_datos, "Consulta_DNPRC"))
 
         # Comprobar errores en respuesta de datos
-        error_datos = _check_catastro_error(xml_datos)
-        if error_datos:
-            print(f"DEBUG buscar-rc: Error del Catastro (datos): {error_datos}")
-            return {"encontrado": False, "error": f"Catastro: {error_datos}"}
+        if datos.error:
+            print(f"DEBUG buscar-rc: Error del Catastro (datos): {datos.error}")
+            return {"encontrado": False, "error": f"Catastro: {datos.error}"}
+
+        # Si la respuesta es una lista de unidades (lrcdnp) no trae superficies, uso ni año:
+        # se pide el detalle de la unidad pedida (o la primera) y, con detalle_unidades, del resto
+        unidades, sin_detalle = datos.unidades, []
+        if datos.es_lista and unidades:
+            if request.detalle_unidades:
+                pedidas = [u.rc for u in unidades]
+            else:
+                pedidas = [rc_original if any(u.rc == rc_original for u in unidades) else unidades[0].rc]
+            unidades, sin_detalle = _detallar_unidades(unidades, pedidas)
+        if not unidades:
+            return {"encontrado": False, "error": "El Catastro no devolvió inmuebles para esta referencia"}
+
+        # Unidad principal: la pedida si llegó con 20 caracteres, si no la primera
+        principal = next((u for u in unidades if u.rc == rc_original), unidades[0])
 
         # 2. Buscar coordenadas (siempre con 14 caracteres)
-        url_coord = f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_CPMRC?Provincia=&Municipio=&SRS=EPSG:4326&RC={rc}"
-        req2 = urllib.request.Request(url_coord, headers={"User-Agent": "Mozilla/5.0"})
-        resp2 = urllib.request.urlopen(req2, context=ctx, timeout=15)
-        xml_coord = resp2.read().decode("utf-8")
-        
-        # Comprobar errores en respuesta de coordenadas
-        error_coord = _check_catastro_error(xml_coord)
-        if error_coord:
-            print(f"DEBUG buscar-rc: Error del Catastro (coords): {error_coord}")
-            return {"encontrado": False, "error": f"Catastro: {error_coord}"}
+        url_coord = url_ovc(RUTA_COORDENADAS, "Consulta_CPMRC", Provincia="", Municipio="", SRS="EPSG:4326", RC=rc)
+        coords = CatastroParser.parse(catastro.get(url_coord, "Consulta_CPMRC"))
 
-        # Parsear coordenadas con regex (más robusto que ElementTree)
-        xcen_match = re.search(r'<[^>]*xcen[^>]*>([0-9.\-]+)</[^>]*>', xml_coord, re.IGNORECASE)
-        ycen_match = re.search(r'<[^>]*ycen[^>]*>([0-9.\-]+)</[^>]*>', xml_coord, re.IGNORECASE)
+        # Comprobar errores en respuesta de coordenadas
+        if coords.error:
+            print(f"DEBUG buscar-rc: Error del Catastro (coords): {coords.error}")
+            return {"encontrado": False, "error": f"Catastro: {coords.error}"}
 
-        if not xcen_match or not ycen_match:
+        coord = next((c for c in coords.coordenadas if c.lon is not None and c.lat is not None), None)
+        if coord is None:
             return {
                 "encontrado": False,
                 "error": "No se encontraron coordenadas para esta referencia catastral"
             }
-        
-        lon = float(xcen_match.group(1))
-        lat = float(ycen_match.group(1))
 
-        # 3. Extraer info del inmueble del XML de datos
-        # Búsqueda directa vía regex para ser inmunes a namespaces y nesting variable
-        def extract_tag(tag_name, xml_text):
-            # Busca <cat:tag>contenido</cat:tag> o <tag>contenido</tag>
-            # El cierre tmb puede llevar prefix: </cat:tag>
-            pattern = rf'<{tag_name}[^>]*>(.*?)</[^>]*?{tag_name}>'
-            match = re.search(pattern, xml_text, re.IGNORECASE | re.DOTALL)
-            return match.group(1).strip() if match else ""
+        lon = coord.lon
+        lat = coord.lat
 
-        direccion = extract_tag('ldt', xml_datos)
-        municipio_result = extract_tag('nm', xml_datos)
-        provincia_result = extract_tag('np', xml_datos)
-        uso = extract_tag('tuso', xml_datos)
-        
-        # Superficies (pueden venir en varios sitios, pillamos cualquiera > 0)
-        def get_float(tag):
-            try: return float(extract_tag(tag, xml_datos).replace(',', '.'))
-            except: return 0.0
+        # 3. Info del inmueble (unidad principal)
+        direccion = principal.direccion
+        municipio_result = principal.municipio
+        provincia_result = principal.provincia
+        uso = principal.uso
+        superficie_parcela = max((u.superficie_parcela for u in unidades), default=0.0)
+        superficie_construida = principal.superficie_construida
+        anio_const = principal.anio_const
 
-        superficie_parcela = max(get_float('spt'), get_float('supf'))
-        superficie_construida = max(get_float('sfc'), get_float('sup'), get_float('sct'))
-        
-        # Año de construcción (etiqueta 'aco' o 'ant')
-        anio_str = extract_tag('aco', xml_datos) or extract_tag('ant', xml_datos)
-        try: anio_const = int(anio_str)
-        except: anio_const = 0
-        
-        # Consolidar superficies (usando las variables locales recién extraídas)
-        # superficie_parcela y superficie_construida ya están calculadas arriba
-        
         # 4. Detectar zona de valoración vía WMS + fallback por distancia al centro
         zona_detectada = TaxCalculator.get_valuation_zone(lat, lon)
         print(f"DEBUG buscar-rc: RC={rc}, Lat={lat}, Lon={lon}, Zona WMS={zona_detectada}")
 
-        # Normalizar nombre municipio para buscar en MUNICIPALITIES
-        import unicodedata
-        def norm(t): return ''.join(c for c in unicodedata.normalize('NFD', t) if unicodedata.category(c) != 'Mn').lower()
-        muni_norm = norm(municipio_result)
-        muni_key = next((k for k in MUNICIPALITIES if norm(k) == muni_norm), None)
+        # Resolver nombre municipio en el índice normalizado (sin acentos/mayúsculas)
+        muni_key = resolver_municipio(municipio_result)
 
         # Si WMS no detectó zona, intentar fallback geográfico para Andújar
         if not zona_detectada and muni_key == "Andújar":
@@ -818,133 +987,219 @@ async def buscar_por_referencia_catastral(request: BuscarRCRequest):
             "anio_const": anio_const,
             "zona_valor": zona_detectada,
             "valor_rep": valor_rep,
-            "zona_info": zona_info
+            "zona_info": zona_info,
+            "num_unidades": len(unidades),
+            "unidades": [u.to_dict() for u in unidades],
+            "unidades_sin_detalle": sin_detalle,
         }
 
     except urllib.error.HTTPError as e:
         return {"encontrado": False, "error": f"Error HTTP {e.code} del servicio del Catastro"}
+    except UpstreamError as e:
+        return _error_upstream(e)
     except Exception as e:
         print(f"Error proxy catastro: {e}")
         return {"encontrado": False, "error": f"Error consultando el Catastro: {str(e)}"}
 
 
 @app.post("/catastro/buscar-rustica")
-async def buscar_parcela_rustica(request: BuscarRusticaRequest):
+def buscar_parcela_rustica(request: BuscarRusticaRequest):
     """
     Proxy para buscar parcela rústica por provincia/municipio/polígono/parcela.
     """
     try:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        # 1. Buscar RC por datos rústicos
-        url = (
-            f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCallejero.asmx/Consulta_DNPPP?"
-            f"Provincia={urllib.parse.quote(request.provincia)}"
-            f"&Municipio={urllib.parse.quote(request.municipio)}"
-            f"&Poligono={urllib.parse.quote(request.poligono)}"
-            f"&Parcela={urllib.parse.quote(request.parcela)}"
+        resultado, _ = consultar_con_cache(
+            _consultar_rustica, request.provincia, request.municipio, request.poligono, request.parcela
         )
-        req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        resp = urllib.request.urlopen(req, context=ctx, timeout=15)
-        xml_text = resp.read().decode("utf-8")
-
-        # Parsear RC del resultado
-        import re
-        pc1_match = re.search(r'<[^>]*pc1[^>]*>([^<]+)</[^>]*>', xml_text, re.IGNORECASE)
-        pc2_match = re.search(r'<[^>]*pc2[^>]*>([^<]+)</[^>]*>', xml_text, re.IGNORECASE)
-
-        if pc1_match and pc2_match:
-            rc = pc1_match.group(1) + pc2_match.group(1)
-            
-            # 2. Buscar coordenadas con la RC encontrada
-            url_coord = f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_CPMRC?Provincia=&Municipio=&SRS=EPSG:4326&RC={rc}"
-            req2 = urllib.request.Request(url_coord, headers={"User-Agent": "Mozilla/5.0"})
-            resp2 = urllib.request.urlopen(req2, context=ctx, timeout=15)
-            xml_coord = resp2.read().decode("utf-8")
-
-            xcen_match = re.search(r'<[^>]*xcen[^>]*>([0-9.\-]+)</[^>]*>', xml_coord, re.IGNORECASE)
-            ycen_match = re.search(r'<[^>]*ycen[^>]*>([0-9.\-]+)</[^>]*>', xml_coord, re.IGNORECASE)
-
-            if xcen_match and ycen_match:
-                return {
-                    "encontrado": True,
-                    "rc": rc,
-                    "lat": float(ycen_match.group(1)),
-                    "lon": float(xcen_match.group(1)),
-                    "municipio": request.municipio,
-                    "provincia": request.provincia,
-                    "poligono": request.poligono,
-                    "parcela": request.parcela,
-                }
-            else:
-                return {"encontrado": False, "error": "Parcela encontrada pero sin coordenadas"}
-        else:
-            return {"encontrado": False, "error": "Parcela rústica no encontrada"}
+        if not resultado.get("encontrado"):
+            return resultado
+        return {
+            **resultado,
+            "municipio": request.municipio,
+            "provincia": request.provincia,
+            "poligono": request.poligono,
+            "parcela": request.parcela,
+        }
 
+    except UpstreamError as e:
+        return _error_upstream(e)
     except Exception as e:
         print(f"Error proxy catastro rústica: {e}")
         return {"encontrado": False, "error": f"Error: {str(e)}"}
 
+
+def _consultar_rustica(provincia: str, municipio: str, poligono: str, parcela: str) -> Dict[str, Any]:
+    """
+    Consulta_DNPPP (RC de la parcela) + Consulta_CPMRC (coordenadas).
+    Los fallos de red se propagan (UpstreamError / HTTPError) para no cachearlos.
+    """
+    # 1. Buscar RC por datos rústicos
+    url = url_ovc(
+        RUTA_CALLEJERO, "Consulta_DNPPP",
+        Provincia=provincia, Municipio=municipio, Poligono=poligono, Parcela=parcela,
+    )
+    datos = CatastroParser.parse(catastro.get(url, "Consulta_DNPPP"))
+    if datos.error:
+        return {"encontrado": False, "error": f"Catastro: {datos.error}"}
+    if not datos.unidades or not datos.unidades[0].rc14:
+        return {"encontrado": False, "error": "Parcela rústica no encontrada"}
+
+    unidad = datos.unidades[0]
+    rc = unidad.rc14
+
+    # 2. Buscar coordenadas con la RC encontrada
+    url_coord = url_ovc(RUTA_COORDENADAS, "Consulta_CPMRC", Provincia="", Municipio="", SRS="EPSG:4326", RC=rc)
+    coords = CatastroParser.parse(catastro.get(url_coord, "Consulta_CPMRC"))
+    coord = next((c for c in coords.coordenadas if c.lon is not None and c.lat is not None), None)
+    if coord is None:
+        return {"encontrado": False, "rc": rc, "error": "Parcela encontrada pero sin coordenadas"}
+
+    return {
+        "encontrado": True,
+        "rc": rc,
+        "lat": coord.lat,
+        "lon": coord.lon,
+        "direccion": unidad.direccion,
+        "superficie": sum(c.superficie for c in unidad.cultivos),
+    }
+
+
+class BuscarRusticaLoteRequest(BaseModel):
+    provincia: str
+    municipio: str
+    poligonos: str   # "12" o rangos/listas: "12-14,18"
+    parcelas: str    # "1-300" o "4,7,10-12"
+
+
+@app.post("/catastro/buscar-rustica/lote")
+def buscar_parcela_rustica_lote(request: BuscarRusticaLoteRequest):
+    """
+    Búsqueda masiva de parcelas rústicas: todas las combinaciones polígono × parcela
+    de los rangos dados. DNPPP y CPMRC se encadenan por parcela y las parcelas se
+    resuelven en paralelo (LOTE_CONCURRENCIA) con caché compartida con /catastro/buscar-rustica.
+    Respuesta NDJSON: una línea por parcela según se resuelven y una línea final {"resumen": ...}.
+    """
+    try:
+        poligonos = expandir_rango(request.poligonos, LOTE_MAX_PARCELAS)
+        parcelas = expandir_rango(request.parcelas, LOTE_MAX_PARCELAS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Rango no válido: {e}")
+    if len(poligonos) * len(parcelas) > LOTE_MAX_PARCELAS:
+        raise HTTPException(status_code=400, detail=f"Máximo {LOTE_MAX_PARCELAS} parcelas por petición")
+
+    combinaciones = [(pol, par) for pol in poligonos for par in parcelas]
+    lineas = (
+        json.dumps(r, ensure_ascii=False) + "\n"
+        for r in BatchRusticLookup.resolver(
+            request.provincia, request.municipio, combinaciones, _consultar_rustica, LOTE_CONCURRENCIA
+        )
+    )
+    return StreamingResponse(lineas, media_type="application/x-ndjson")
+
 class BuscarCoordsRequest(BaseModel):
     lat: float
     lon: float
 
 @app.post("/catastro/buscar-por-coordenadas")
-async def buscar_por_coordenadas(request: BuscarCoordsRequest):
+def buscar_por_coordenadas(request: BuscarCoordsRequest):
     """
     Proxy para buscar una Referencia Catastral dada una coordenada inversa (Reverse Geocoding).
     Se le envía lat/lon y el servicio OVCCoordenadas.asmx/Consulta_RCCOOR extrae la RC.
     """
-    try:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
+    return _rc_por_coordenadas(request.lat, request.lon)
+
 
+def _rc_por_coordenadas(lat: float, lon: float) -> Dict[str, Any]:
+    """Consulta_RCCOOR para un punto; nunca lanza (los errores van en el dict)"""
+    try:
         # 1. Llamar a la API Consulta_RCCOOR de Catastro (SRS=EPSG:4326 que es Lat/Lon)
         # Ojo: la API requiere que SRS sea EPSG:4326 y Coordenada X=Lon, Y=Lat
-        url_coord = f"https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_RCCOOR?SRS=EPSG:4326&Coordenada_X={request.lon}&Coordenada_Y={request.lat}"
-        
-        req = urllib.request.Request(url_coord, headers={"User-Agent": "Mozilla/5.0"})
-        resp = urllib.request.urlopen(req, context=ctx, timeout=15)
-        xml_text = resp.read().decode("utf-8")
-        
-        # 2. Comprobar errores del Catastro usando la función compartida
-        error_catastro = _check_catastro_error(xml_text)
-        if error_catastro:
-            print(f"DEBUG buscar-coords: Error de catastro: {error_catastro}")
-            return {"encontrado": False, "error": f"Catastro: {error_catastro}"}
+        url_coord = url_ovc(
+            RUTA_COORDENADAS, "Consulta_RCCOOR",
+            SRS="EPSG:4326", Coordenada_X=lon, Coordenada_Y=lat,
+        )
+        resultado = CatastroParser.parse(catastro.get(url_coord, "Consulta_RCCOOR"))
+
+        # 2. Comprobar errores del Catastro
+        if resultado.error:
+            print(f"DEBUG buscar-coords: Error de catastro: {resultado.error}")
+            return {"encontrado": False, "error": f"Catastro: {resultado.error}"}
 
         # 3. Extraer la parcela principal (pc1 y pc2 componen la primera parte de la RC)
-        import re
-        pc1_match = re.search(r'<[^>]*pc1[^>]*>([^<]+)</[^>]*>', xml_text, re.IGNORECASE)
-        pc2_match = re.search(r'<[^>]*pc2[^>]*>([^<]+)</[^>]*>', xml_text, re.IGNORECASE)
-        
-        if pc1_match and pc2_match:
+        coord = next((c for c in resultado.coordenadas if c.rc14), None)
+
+        if coord:
             # RC básica de 14 caracteres (lo necesario para hacer una búsqueda estándar posterior)
-            rc_base = pc1_match.group(1).strip() + pc2_match.group(1).strip()
-            
-            # Buscar dirección también si viene en ldt
-            ldt_match = re.search(r'<[^>]*ldt[^>]*>([^<]+)</[^>]*>', xml_text, re.IGNORECASE)
-            direccion = ldt_match.group(1).strip() if ldt_match else ""
-            
-            print(f"DEBUG buscar-coords: Detectada RC {rc_base} en {request.lat}, {request.lon}")
+            rc_base = coord.rc14
+            print(f"DEBUG buscar-coords: Detectada RC {rc_base} en {lat}, {lon}")
             return {
                 "encontrado": True,
                 "rc": rc_base,
-                "direccion": direccion
+                "direccion": coord.direccion
             }
         else:
             return {"encontrado": False, "error": "Las coordenadas proporcionadas no caen sobre ninguna parcela catastral válida (viales o dominio público)."}
 
     except urllib.error.HTTPError as e:
         return {"encontrado": False, "error": f"Error HTTP {e.code} del servicio del Catastro"}
+    except UpstreamError as e:
+        return _error_upstream(e)
     except Exception as e:
         print(f"Error reverse geocoding catastro: {e}")
         return {"encontrado": False, "error": f"Error del servidor API: {str(e)}"}
-        print(f"Error proxy catastro rústica: {e}")
-        return {"encontrado": False, "error": f"Error: {str(e)}"}
+
+
+class PuntoLote(BaseModel):
+    lat: float
+    lon: float
+    id: Optional[str] = None
+
+class BuscarCoordsLoteRequest(BaseModel):
+    puntos: List[PuntoLote]
+    tolerancia_m: float = 5.0
+
+
+def _stream_geocodificacion(puntos: List[PuntoEntrada], tolerancia_m: float) -> StreamingResponse:
+    if not puntos:
+        raise HTTPException(status_code=400, detail="No se encontraron puntos")
+    if len(puntos) > LOTE_MAX_PUNTOS:
+        raise HTTPException(status_code=400, detail=f"Máximo {LOTE_MAX_PUNTOS} puntos por petición")
+
+    lineas = (
+        json.dumps(r, ensure_ascii=False) + "\n"
+        for r in BatchReverseGeocoder.resolver(puntos, _rc_por_coordenadas, tolerancia_m, LOTE_CONCURRENCIA)
+    )
+    return StreamingResponse(lineas, media_type="application/x-ndjson")
+
+
+@app.post("/catastro/buscar-por-coordenadas/lote")
+def buscar_por_coordenadas_lote(request: BuscarCoordsLoteRequest):
+    """
+    Geocodificación inversa de una lista de puntos.
+    Los puntos a menos de 'tolerancia_m' (misma celda de rejilla) se consultan una sola vez.
+    Respuesta NDJSON: una línea por punto (con su 'indice' de entrada) según se resuelven,
+    y una última línea {"resumen": ...}.
+    """
+    puntos = [PuntoEntrada(indice=i, lat=p.lat, lon=p.lon, id=p.id) for i, p in enumerate(request.puntos)]
+    return _stream_geocodificacion(puntos, request.tolerancia_m)
+
+
+@app.post("/catastro/buscar-por-coordenadas/lote/archivo")
+def buscar_por_coordenadas_lote_archivo(
+    file: UploadFile = File(...),
+    tolerancia_m: float = Query(5.0, description="Lado de la celda de agrupación en metros"),
+    epsg: Optional[str] = Query(None, description="EPSG de las columnas x/y de un CSV (p. ej. 25830)")
+):
+    """
+    Igual que /catastro/buscar-por-coordenadas/lote desde un GeoJSON (Point/MultiPoint)
+    o un CSV con columnas lat/lon (o x/y en el sistema 'epsg').
+    """
+    # Síncrono a propósito: la lectura del archivo corre en el threadpool
+    try:
+        puntos = BatchReverseGeocoder.leer_puntos(file.file.read(), file.filename or "", epsg)
+    except (ValueError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _stream_geocodificacion(puntos, tolerancia_m)
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -976,6 +1231,11 @@ class CalcularTaxRequest(BaseModel):
     custom_tipo_urbano: Optional[float] = None
     custom_tipo_rustico: Optional[float] = None
     custom_anio_ponencia: Optional[int] = None
+    # Varias construcciones en la misma finca: [{"uso", "categoria", "anio_const", "estado", "sup_const"}, ...]
+    construcciones: Optional[List[Dict[str, Any]]] = None
+
+class CalcularLoteRequest(BaseModel):
+    inmuebles: List[CalcularTaxRequest]
 
 @app.post("/catastro/calcular-ibi")
 async def calcular_ibi(request: CalcularTaxRequest):
@@ -994,9 +1254,68 @@ async def calcular_ibi(request: CalcularTaxRequest):
         print(f"Error en calculo IBI: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/catastro/calcular-ibi-lote")
+def calcular_ibi_lote(request: CalcularLoteRequest):
+    """
+    Valoración masiva: calcula Valor Catastral e IBI para una lista de inmuebles.
+    Cada elemento admite los mismos parámetros que /catastro/calcular-ibi
+    y el resultado de cada fila es idéntico al del cálculo individual.
+    """
+    try:
+        resultados = BatchTaxCalculator.calculate_records([i.dict() for i in request.inmuebles])
+        return {"num_inmuebles": len(resultados), "resultados": resultados}
+    except Exception as e:
+        print(f"Error en calculo IBI por lotes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/catastro/calcular-ibi-lote/archivo")
+def calcular_ibi_lote_archivo(
+    file: UploadFile = File(...),
+    formato: str = Query("csv", description="Formato de salida: csv, parquet o json")
+):
+    """
+    Valoración masiva desde una tabla (CSV, Parquet o JSON) con una fila por inmueble.
+    Las columnas son los parámetros de /catastro/calcular-ibi; 'construcciones' puede venir como JSON.
+    """
+    # Síncrono a propósito: pandas/NumPy corren en el threadpool y no bloquean el event loop
+    try:
+        df = BatchTaxCalculator.leer_tabla(file.file.read(), file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Mismos valores por defecto que el cálculo individual
+        for campo, info in CalcularTaxRequest.model_fields.items():
+            if campo not in df and info.default is not None:
+                df[campo] = info.default
+
+        resultado = BatchTaxCalculator.calculate(df)
+        if "rc" in df:
+            resultado.insert(0, "rc", df["rc"].to_numpy())
+
+        if formato == "json":
+            return {"num_inmuebles": len(resultado), "resultados": resultado.to_dict("records")}
+        if formato == "parquet":
+            contenido = resultado.to_parquet(index=False)
+            media_type = "application/vnd.apache.parquet"
+        else:
+            contenido = resultado.to_csv(index=False).encode("utf-8")
+            media_type = "text/csv"
+            formato = "csv"
+
+        return StreamingResponse(
+            iter([contenido]),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="valoracion_lote.{formato}"'}
+        )
+    except Exception as e:
+        print(f"Error en calculo IBI por lotes (archivo): {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/catastro/municipios-disponibles")
 async def get_municipios():
-    return list(MUNICIPALITIES.keys())
+    # Sale del índice de ponencias: no carga los datos de ningún municipio
+    return ponencias.nombres()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,232 @@
+"""
+Servidor local que imita los servicios OVC del Catastro (sin tráfico real)
+Sirve respuestas grabadas de fixtures/ovc/ para Consulta_DNPRC, Consulta_CPMRC,
+Consulta_RCCOOR, Consulta_DNPPP y WMS GetFeatureInfo, con latencia y tasa de
+error configurables para medir el proxy y su comportamiento ante degradación.
+
+Uso:
+    python ovc_stub_server.py --puerto 8081 --latencia lognormal:80:0.5 --tasa-error 0.05
+    CATASTRO_OVC_BASE_URL=http://127.0.0.1:8081 uvicorn main:app
+
+Distribuciones de latencia (milisegundos):
+    fija:50 | uniforme:20:200 | lognormal:MEDIANA:SIGMA | exponencial:MEDIA
+
+Configuración en caliente (sin reiniciar):
+    GET /_stub/config?latencia=fija:2000&tasa_error=0.5&tasa_timeout=0
+    GET /_stub/stats
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+DIRECTORIO_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ovc")
+
+# Método OVC -> (subdirectorio de fixtures, parámetro que da el nombre del archivo)
+METODOS = {
+    "Consulta_DNPRC": ("dnprc", "RC"),
+    "Consulta_CPMRC": ("cpmrc", "RC"),
+    "Consulta_RCCOOR": ("rccoor", None),
+    "Consulta_DNPPP": ("dnppp", None),
+}
+
+
+class Latencia:
+    """Distribución de latencia a partir de una especificación 'tipo:param1:param2'"""
+
+    def __init__(self, spec: str = "fija:0"):
+        partes = spec.split(":")
+        self.spec = spec
+        self.tipo = partes[0]
+        self.params = [float(p) for p in partes[1:]]
+        if self.tipo not in ("fija", "uniforme", "lognormal", "exponencial"):
+            raise ValueError(f"Distribución de latencia no soportada: {spec}")
+
+    def muestra_s(self, rnd: random.Random) -> float:
+        p = self.params
+        if self.tipo == "fija":
+            ms = p[0] if p else 0.0
+        elif self.tipo == "uniforme":
+            ms = rnd.uniform(p[0], p[1])
+        elif self.tipo == "lognormal":
+            # p[0] = mediana (ms), p[1] = sigma del logaritmo
+            ms = p[0] * rnd.lognormvariate(0.0, p[1])
+        else:
+            ms = rnd.expovariate(1.0 / p[0])
+        return max(ms, 0.0) / 1000.0
+
+
+class Fixtures:
+    """Respuestas grabadas por método; se cargan una vez en memoria"""
+
+    def __init__(self, directorio: str = DIRECTORIO_FIXTURES):
+        self._archivos: Dict[str, Dict[str, bytes]] = {}
+        for sub in os.listdir(directorio):
+            ruta = os.path.join(directorio, sub)
+            if not os.path.isdir(ruta):
+                continue
+            self._archivos[sub] = {}
+            for archivo in os.listdir(ruta):
+                if archivo.endswith(".xml"):
+                    with open(os.path.join(ruta, archivo), "rb") as f:
+                        self._archivos[sub][archivo[:-4]] = f.read()
+
+    def respuesta(self, sub: str, clave: Optional[str]) -> Optional[bytes]:
+        """Fixture exacta (p. ej. por RC) o _default del método"""
+        grupo = self._archivos.get(sub, {})
+        if clave and clave.upper() in grupo:
+            return grupo[clave.upper()]
+        return grupo.get("_default")
+
+
+class EstadoStub:
+    """Configuración y contadores compartidos entre hilos"""
+
+    def __init__(self, latencia: str, tasa_error: float, tasa_timeout: float,
+                 timeout_s: float, semilla: Optional[int]):
+        self.latencia = Latencia(latencia)
+        self.tasa_error = tasa_error
+        self.tasa_timeout = tasa_timeout
+        self.timeout_s = timeout_s
+        self.rnd = random.Random(semilla)
+        self.lock = threading.Lock()
+        self.peticiones: Dict[str, int] = {}
+        self.errores = 0
+        self.timeouts = 0
+
+    def sortear(self) -> Tuple[float, str]:
+        """Devuelve (espera en segundos, resultado: ok | error | timeout)"""
+        with self.lock:
+            r = self.rnd.random()
+            if r < self.tasa_timeout:
+                self.timeouts += 1
+                return self.timeout_s, "timeout"
+            espera = self.latencia.muestra_s(self.rnd)
+            if r < self.tasa_timeout + self.tasa_error:
+                self.errores += 1
+                return espera, "error"
+            return espera, "ok"
+
+    def contar(self, metodo: str) -> None:
+        with self.lock:
+            self.peticiones[metodo] = self.peticiones.get(metodo, 0) + 1
+
+    def configurar(self, params: Dict[str, str]) -> None:
+        with self.lock:
+            if "latencia" in params:
+                self.latencia = Latencia(params["latencia"])
+            if "tasa_error" in params:
+                self.tasa_error = float(params["tasa_error"])
+            if "tasa_timeout" in params:
+                self.tasa_timeout = float(params["tasa_timeout"])
+
+    def resumen(self) -> Dict[str, object]:
+        with self.lock:
+            return {
+                "latencia": self.latencia.spec,
+                "tasa_error": self.tasa_error,
+                "tasa_timeout": self.tasa_timeout,
+                "peticiones": dict(self.peticiones),
+                "errores": self.errores,
+                "timeouts": self.timeouts,
+            }
+
+
+def _handler(fixtures: Fixtures, estado: EstadoStub):
+    class OVCStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _enviar(self, codigo: int, cuerpo: bytes, tipo: str = "text/xml; charset=utf-8"):
+            self.send_response(codigo)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(url.query, keep_blank_values=True).items()}
+
+            # Endpoints de control del propio stub
+            if url.path == "/_stub/stats":
+                return self._enviar(200, json.dumps(estado.resumen()).encode(), "application/json")
+            if url.path == "/_stub/config":
+                try:
+                    estado.configurar(params)
+                except ValueError as e:
+                    return self._enviar(400, str(e).encode(), "text/plain")
+                return self._enviar(200, json.dumps(estado.resumen()).encode(), "application/json")
+
+            # Resolver método OVC o WMS
+            metodo = url.path.rsplit("/", 1)[-1]
+            if metodo in METODOS:
+                sub, param = METODOS[metodo]
+                cuerpo = fixtures.respuesta(sub, params.get(param) if param else None)
+            elif url.path.endswith("ServidorWMS.aspx") and params.get("REQUEST") == "GetFeatureInfo":
+                metodo = "WMS_GetFeatureInfo"
+                cuerpo = fixtures.respuesta("wms", None)
+            else:
+                return self._enviar(404, b"Metodo no soportado por el stub", "text/plain")
+
+            estado.contar(metodo)
+            espera, resultado = estado.sortear()
+            if espera:
+                time.sleep(espera)
+            if resultado == "timeout":
+                # El cliente ya habrá abandonado; cerramos sin respuesta
+                self.close_connection = True
+                return
+            if resultado == "error" or cuerpo is None:
+                return self._enviar(503, b"Service Unavailable", "text/plain")
+            tipo = "text/xml; charset=ISO-8859-1" if metodo == "WMS_GetFeatureInfo" else "text/xml; charset=utf-8"
+            self._enviar(200, cuerpo, tipo)
+
+        def log_message(self, *args):
+            pass
+
+    return OVCStubHandler
+
+
+def crear_servidor(host: str = "127.0.0.1", puerto: int = 8081, latencia: str = "fija:0",
+                   tasa_error: float = 0.0, tasa_timeout: float = 0.0, timeout_s: float = 30.0,
+                   semilla: Optional[int] = None,
+                   directorio: str = DIRECTORIO_FIXTURES) -> ThreadingHTTPServer:
+    """Crea el servidor (sin arrancarlo). puerto=0 elige uno libre."""
+    estado = EstadoStub(latencia, tasa_error, tasa_timeout, timeout_s, semilla)
+    servidor = ThreadingHTTPServer((host, puerto), _handler(Fixtures(directorio), estado))
+    servidor.daemon_threads = True
+    servidor.estado = estado
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local de los servicios OVC del Catastro")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8081)
+    parser.add_argument("--latencia", default="fija:0", help="fija:MS | uniforme:MIN:MAX | lognormal:MEDIANA:SIGMA | exponencial:MEDIA")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--tasa-timeout", type=float, default=0.0, help="Fracción de peticiones que no responden")
+    parser.add_argument("--timeout-s", type=float, default=30.0, help="Espera antes de cortar una petición 'timeout'")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.host, args.puerto, args.latencia, args.tasa_error,
+                              args.tasa_timeout, args.timeout_s, args.semilla)
+    print(f"Stub OVC escuchando en http://{args.host}:{servidor.server_address[1]} "
+          f"(latencia={args.latencia}, error={args.tasa_error}, timeout={args.tasa_timeout})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.tax_calculator import TaxCalculator, MUNICIPALITIES
+from core.batch_tax_calculator import BatchTaxCalculator
+
+USOS = ["vivienda", "industrial", "oficinas", "comercial", "garajes", "agricola", "desconocido"]
+
+def _inmueble_aleatorio(rnd):
+    p = {
+        "municipio": rnd.choice(list(MUNICIPALITIES) + ["Pueblo Inventado"]),
+        "clase": rnd.choice(["urbano", "rustico", "bice"]),
+        "sup_parcela": round(rnd.uniform(0, 2000), 2),
+        "valor_rep": rnd.choice([0, round(rnd.uniform(10, 600), 2)]),
+        "zona_valor": rnd.choice([None, "R37", "R37C", "R55", "X99"]),
+        "edif_max": rnd.choice([0, 1, 2.5]),
+        "edif_real": round(rnd.uniform(0, 3), 2),
+        "ha": round(rnd.uniform(0, 50), 4),
+        "tipo_eval": round(rnd.uniform(0, 900), 2),
+        "uso_suelo_rust": rnd.choice(["residencial", "agricola", "varios", "otro"]),
+        "sup_ocupada": round(rnd.uniform(0, 500), 2),
+        "uso_const": rnd.choice(USOS),
+        "categoria": rnd.randint(0, 10),
+        "sup_const": rnd.choice([0, round(rnd.uniform(10, 900), 2)]),
+        "anio_const": rnd.randint(1850, 2030),
+        "estado": rnd.choice(["normal", "regular", "deficiente", "ruinoso"]),
+        "custom_mbc": rnd.choice([None, 0, 800.0]),
+        "custom_rm": rnd.choice([None, 0.5, 0.6]),
+        "custom_tipo_urbano": rnd.choice([None, 0.006]),
+        "custom_anio_ponencia": rnd.choice([None, 2005, 2020]),
+        "construcciones": None,
+    }
+    if rnd.random() < 0.3:
+        p["construcciones"] = [
+            {"uso": rnd.choice(USOS), "categoria": rnd.randint(1, 9), "anio_const": rnd.randint(1900, 2020),
+             "estado": rnd.choice(["normal", "regular"]), "sup_const": round(rnd.uniform(1, 300), 2)}
+            for _ in range(rnd.randint(0, 4))
+        ]
+    return p
+
+def test_lote_igual_a_calculo_individual():
+    # El cálculo vectorizado debe dar exactamente el mismo resultado que TaxCalculator.calculate
+    rnd = random.Random(2010)
+    inmuebles = [_inmueble_aleatorio(rnd) for _ in range(3000)]
+    esperados = [TaxCalculator.calculate(p) for p in inmuebles]
+    obtenidos = BatchTaxCalculator.calculate_records(inmuebles)
+    assert len(obtenidos) == len(esperados)
+    for esperado, obtenido in zip(esperados, obtenidos):
+        assert esperado == obtenido
+
+def test_endpoints_de_lote():
+    # Endpoints síncronos (threadpool): la subida se lee con file.file
+    from fastapi.testclient import TestClient
+    from main import app
+    cliente = TestClient(app)
+    inmuebles = [_inmueble_aleatorio(random.Random(i)) for i in range(3)]
+    r = cliente.post("/catastro/calcular-ibi-lote", json={"inmuebles": inmuebles})
+    assert r.status_code == 200, r.text
+    assert r.json()["num_inmuebles"] == 3
+
+    csv = "rc,municipio,clase,sup_parcela,valor_rep\nRC1,Andújar,urbano,300,250\nRC2,Madrid,urbano,120,0\n"
+    r = cliente.post("/catastro/calcular-ibi-lote/archivo", params={"formato": "json"},
+                     files={"file": ("lote.csv", csv.encode("utf-8"))})
+    assert r.status_code == 200, r.text
+    assert [f["rc"] for f in r.json()["resultados"]] == ["RC1", "RC2"]
+
+if __name__ == '__main__':
+    test_lote_igual_a_calculo_individual()
+    test_endpoints_de_lote()
+    print("OK")
@@ -0,0 +1,86 @@
+import sys
+import os
+import json
+import threading
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import core.upstream as upstream
+from core.batch_reverse_geocoder import BatchReverseGeocoder, PuntoEntrada
+from core.coordinate_transformer import CoordinateTransformer
+from ovc_stub_server import crear_servidor
+from main import _rc_por_coordenadas
+
+
+def _nube(n, lat=38.0394, lon=-4.0571, radio_grados=0.00002):
+    # Puntos de levantamiento concentrados en ~2 m alrededor de un centro
+    return [PuntoEntrada(indice=i, lat=lat + radio_grados * ((i % 3) - 1) / 2,
+                         lon=lon + radio_grados * ((i % 5) - 2) / 4, id=f"P{i}") for i in range(n)]
+
+
+def test_agrupar_por_celda():
+    puntos = _nube(40) + [PuntoEntrada(indice=40, lat=38.0500, lon=-4.0500)]
+    grupos = BatchReverseGeocoder.agrupar(puntos, 25.0)
+    assert sum(len(g) for g in grupos.values()) == 41
+    assert len(grupos) <= 5
+    assert list(grupos.values())[-1][0].indice == 40
+    # Sin tolerancia solo se fusionan los idénticos
+    assert len(BatchReverseGeocoder.agrupar(puntos, 0)) == 16
+
+
+def test_resolver_contra_el_stub(monkeypatch):
+    servidor = crear_servidor(puerto=0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(upstream, "OVC_BASE_URL", f"http://127.0.0.1:{servidor.server_address[1]}")
+    try:
+        puntos = _nube(100)
+        salida = list(BatchReverseGeocoder.resolver(puntos, _rc_por_coordenadas, tam_celda_m=25.0))
+        resumen = salida[-1]["resumen"]
+        filas = salida[:-1]
+
+        assert sorted(f["indice"] for f in filas) == list(range(100))
+        assert all(f["encontrado"] and f["rc"] == "8409103VH0180N" for f in filas)
+        assert resumen["consultas"] == servidor.estado.resumen()["peticiones"]["Consulta_RCCOOR"]
+        assert resumen["consultas"] <= 5 and resumen["encontrados"] == 100
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_leer_geojson_y_csv():
+    geojson = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": "a", "geometry": {"type": "Point", "coordinates": [-4.05, 38.04]}, "properties": {}},
+        {"type": "Feature", "geometry": {"type": "MultiPoint", "coordinates": [[-4.0, 38.0], [-4.1, 38.1]]}, "properties": {"id": "m"}},
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}, "properties": {}},
+    ]}
+    puntos = BatchReverseGeocoder.leer_puntos(json.dumps(geojson).encode(), "puntos.geojson")
+    assert [(p.id, p.lat, p.lon) for p in puntos] == [("a", 38.04, -4.05), ("m-0", 38.0, -4.0), ("m-1", 38.1, -4.1)]
+
+    csv_texto = "Nombre;Latitud;Longitud\nA;38,04;-4,05\nB;;\nC;38.1;-4.1\n"
+    puntos = BatchReverseGeocoder.leer_puntos(csv_texto.encode(), "puntos.csv")
+    assert [(p.indice, p.id, p.lat) for p in puntos] == [(0, "A", 38.04), (2, "C", 38.1)]
+
+
+def test_csv_xy_necesita_epsg():
+    csv_texto = "id,x,y\nA,410000.5,4210000.5\n"
+    # x/y en una exportación catastral son UTM: sin EPSG no se interpretan como lon/lat
+    with pytest.raises(ValueError, match="epsg"):
+        BatchReverseGeocoder.leer_puntos(csv_texto.encode(), "puntos.csv")
+
+    punto, = BatchReverseGeocoder.leer_puntos(csv_texto.encode(), "puntos.csv", epsg="25830")
+    lon, lat = CoordinateTransformer.utm_to_latlon([(410000.5, 4210000.5)], "25830")[0]
+    assert (punto.id, punto.lat, punto.lon) == ("A", pytest.approx(lat), pytest.approx(lon))
+    assert 38 < punto.lat < 38.1 and -4.1 < punto.lon < -4
+    with pytest.raises(ValueError, match="EPSG"):
+        BatchReverseGeocoder.leer_puntos(csv_texto.encode(), "puntos.csv", epsg="99999")
+
+
+def test_endpoint_archivo_rechaza_xy_sin_epsg():
+    from fastapi.testclient import TestClient
+    from main import app
+    r = TestClient(app).post("/catastro/buscar-por-coordenadas/lote/archivo",
+                             files={"file": ("puntos.csv", b"id,x,y\nA,410000.5,4210000.5\n")})
+    assert r.status_code == 400 and "epsg" in r.json()["detail"]
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,59 @@
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import core.upstream as upstream
+from core.batch_rustic_lookup import BatchRusticLookup, expandir_rango, rustica_cache
+from ovc_stub_server import crear_servidor
+from main import _consultar_rustica
+
+
+def test_expandir_rango():
+    assert expandir_rango("1-3, 7,10-11") == ["1", "2", "3", "7", "10", "11"]
+    assert expandir_rango("5,5,4-6") == ["5", "4", "6"]
+    for invalido in ("", "3-1", "a", "1-x"):
+        try:
+            expandir_rango(invalido)
+            assert False, invalido
+        except ValueError:
+            pass
+    try:
+        expandir_rango("1-500", maximo=300)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_poligono_completo_en_paralelo_y_cache(monkeypatch):
+    servidor = crear_servidor(puerto=0, latencia="fija:20")
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(upstream, "OVC_BASE_URL", f"http://127.0.0.1:{servidor.server_address[1]}")
+    monkeypatch.setattr(upstream.catastro, "limitador", upstream.TokenBucket(10000, 10000))
+    rustica_cache.clear()
+    try:
+        parcelas = [("49", str(n)) for n in range(1, 301)]
+        inicio = time.monotonic()
+        salida = list(BatchRusticLookup.resolver("23", "39", parcelas, _consultar_rustica, max_concurrencia=16))
+        duracion = time.monotonic() - inicio
+
+        resumen = salida[-1]["resumen"]
+        assert resumen == {"parcelas": 300, "encontradas": 300, "desde_cache": 0, "errores": 0}
+        assert sorted(int(f["parcela"]) for f in salida[:-1]) == list(range(1, 301))
+        assert all(f["rc"] == "23039A04900005" for f in salida[:-1])
+        # 600 llamadas de 20 ms en serie serían 12 s
+        assert duracion < 6
+
+        peticiones = dict(servidor.estado.resumen()["peticiones"])
+        salida = list(BatchRusticLookup.resolver("23", "39", [("049", "001")] + parcelas[:10], _consultar_rustica))
+        assert salida[-1]["resumen"]["desde_cache"] == 11
+        assert servidor.estado.resumen()["peticiones"] == peticiones
+    finally:
+        rustica_cache.clear()
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import contextlib
+import pytest
+from shapely.geometry import Point, Polygon
+from core.dxf_reader import DXFReader
+from core.shp_reader import SHPReader
+from core.kml_reader import KMLReader
+from benchmarks.tejido_sintetico import generar_tejido, escribir_todos
+from benchmarks import suite
+
+
+def test_tejido_determinista_y_valido():
+    tejido = generar_tejido(300, semilla=7)
+    assert [p.exterior for p in tejido] == [p.exterior for p in generar_tejido(300, semilla=7)]
+    assert len(tejido) == 300
+    assert any(p.huecos for p in tejido) and any(p.solapada for p in tejido)
+    for p in tejido:
+        poligono = Polygon(p.exterior, p.huecos)
+        assert poligono.is_valid
+        assert poligono.contains(Point(p.etiqueta))
+        assert len(p.rc) == 14 and p.rc.isalnum()
+
+
+def test_formatos_se_leen_con_los_lectores(tmp_path):
+    tejido = generar_tejido(120)
+    rutas = escribir_todos(tejido, str(tmp_path))
+    huecos = sum(len(p.huecos) for p in tejido)
+    with contextlib.redirect_stdout(io.StringIO()):
+        dxf = DXFReader.leer_borde_parcelas(rutas["dxf"], ["PG-LP"], "PG-LT")
+        shp = SHPReader.leer_desde_zip(rutas["shp"])
+        kmz = KMLReader.leer_desde_kmz(rutas["kmz"])
+    # En DXF los huecos son polilíneas sueltas; en el resto, anillos interiores
+    assert len(dxf) == len(tejido) + huecos
+    assert {p.referencia_catastral for p in dxf if p.referencia_catastral} == {p.rc for p in tejido}
+    assert len(shp) == len(kmz) == len(tejido)
+    assert sum(len(p.interiores) for p in shp) == sum(len(p.interiores) for p in kmz) == huecos
+    with open(rutas["gml"], encoding="utf-8") as f:
+        assert f.read().count("<cp:CadastralParcel ") == len(tejido)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="la suite usa fork")
+def test_suite_y_comparacion():
+    documento = suite.ejecutar_suite([50], filtro="limpiar_topologia", informar=lambda _: None)
+    (fila,) = documento["resultados"]
+    assert fila["estado"] == "ok" and fila["parcelas"] == 50 and fila["segundos"] > 0
+
+    baseline = {"resultados": [dict(fila, segundos=fila["segundos"] / 2)]}
+    (cmp,) = suite.comparar(documento, baseline, umbral=1.5)
+    assert cmp["regresion"] and cmp["cociente"] == pytest.approx(2.0, rel=0.01)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,39 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import pytest
+from benchmarks import carga
+
+
+def test_mezcla_y_resumen():
+    assert carga.parse_mezcla("analyze:1, catastro:5,ibi") == {"analyze": 1.0, "catastro": 5.0, "ibi": 1.0}
+    with pytest.raises(ValueError):
+        carga.parse_mezcla("borrar:1")
+
+    resultados = [carga.Resultado("ibi", 0, s / 1000, 200) for s in range(1, 101)]
+    resultados += [carga.Resultado("ibi", 0, 0.5, 503), carga.Resultado("sonda", 0, 0.001, 200)]
+    resumen = carga.resumir(resultados, duracion_s=10)
+    assert resumen["ibi"]["peticiones"] == 101 and resumen["ibi"]["errores"] == 1
+    assert resumen["ibi"]["p50_ms"] == pytest.approx(51, abs=1)
+    assert resumen["total"]["peticiones"] == 101  # la sonda no cuenta en el total
+
+
+def test_pesados_sin_parcelas_se_rechaza(capsys):
+    with pytest.raises(SystemExit) as e:
+        carga.main(["--pesados", "2", "--parcelas-pesado", "0"])
+    assert e.value.code == 2 and "--parcelas-pesado" in capsys.readouterr().err
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="RSS por worker solo en Linux")
+def test_carga_corta_contra_uvicorn():
+    informe = carga.ejecutar(duracion_s=2, concurrencia=4, mezcla="catastro:2,ibi:1,generate:1",
+                             latencia_upstream="fija:5")
+    ops = informe["operaciones"]
+    assert ops["total"]["peticiones"] > 10
+    assert ops["total"]["tasa_error"] == 0
+    assert {"catastro", "ibi", "generate", "sonda"} <= set(ops)
+    assert any(m["rss_max_mb"] > 0 for m in informe["memoria"].values())
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
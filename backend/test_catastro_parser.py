@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.catastro_parser import CatastroParser
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _leer(*ruta):
+    with open(os.path.join(DIR, *ruta), "rb") as f:
+        return f.read()
+
+
+def test_lista_de_unidades_completa():
+    r = CatastroParser.parse(_leer("full_catastro_response.xml"))
+    assert r.es_lista and r.error is None
+    assert len(r.unidades) == 15
+    assert len({u.rc for u in r.unidades}) == 15
+    assert all(u.rc14 == "8409103VH0180N" and len(u.rc) == 20 for u in r.unidades)
+    assert r.unidades[1].rc == "8409103VH0180N0002SO"
+    assert r.unidades[1].direccion.startswith("CL SECTOR SEVILLA 21")
+    assert r.unidades[1].municipio == "ANDUJAR"
+
+
+def test_detalle_de_unidad():
+    r = CatastroParser.parse(_leer("full_catastro_20_response.xml"))
+    assert not r.es_lista
+    u = r.unidades[0]
+    assert u.rc == "8409103VH0180N0001AI"
+    assert u.clase == "UR"
+    assert u.uso == "Residencial"
+    assert u.superficie_construida == 180.0
+    assert u.coef_participacion == 100.0
+    assert u.anio_const == 1978
+    assert u.direccion.startswith("CL SECTOR SEVILLA 21 Es:1 Pl:01 Pt:01")
+    assert [(c.uso, c.superficie, c.planta) for c in u.construcciones] == [("VIVIENDA", 180.0, "01")]
+
+
+def test_namespace_y_prefijos_indiferentes():
+    xml = _leer("full_catastro_20_response.xml").decode("utf-8")
+    con_prefijo = xml.replace('xmlns="http://www.catastro.meh.es/"', 'xmlns:cat="http://www.catastro.meh.es/"')
+    con_prefijo = con_prefijo.replace("<", "<cat:").replace("<cat:/", "</cat:").replace("<cat:?", "<?")
+    sin_ns = xml.replace(' xmlns="http://www.catastro.meh.es/"', "")
+    for variante in (con_prefijo, sin_ns):
+        assert CatastroParser.parse(variante).unidades[0].to_dict() == CatastroParser.parse(xml).unidades[0].to_dict()
+
+
+def test_coordenadas_rustica_y_errores():
+    r = CatastroParser.parse(_leer("fixtures", "ovc", "cpmrc", "8409103VH0180N.xml"))
+    c = r.coordenadas[0]
+    assert c.rc14 == "8409103VH0180N" and c.lon == -4.05712218 and c.lat == 38.03947155
+
+    r = CatastroParser.parse(_leer("fixtures", "ovc", "dnppp", "_default.xml"))
+    u = r.unidades[0]
+    assert u.rc14 == "23039A04900005" and u.clase == "RU"
+    assert (u.poligono, u.parcela) == ("49", "5")
+    assert u.cultivos[0].superficie == 48213.0
+
+    r = CatastroParser.parse(_leer("fixtures", "ovc", "cpmrc", "_error_no_existe.xml"))
+    assert r.error == "LA REFERENCIA CATASTRAL NO EXISTE"
+    assert r.coordenadas == []
+
+
+def test_xml_invalido():
+    try:
+        CatastroParser.parse("<html><body>Servicio no disponible")
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    test_lista_de_unidades_completa()
+    test_detalle_de_unidad()
+    test_namespace_y_prefijos_indiferentes()
+    test_coordenadas_rustica_y_errores()
+    test_xml_invalido()
+    print("OK")
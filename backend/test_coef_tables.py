@@ -0,0 +1,52 @@
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.tax_calculator import (
+    _H_TABLE, USO_TO_GRUPO, COEF_TIPOLOGIA, COEF_CONSERVACION, _get_cat_grupo,
+    get_coef_antiguedad, codigos_uso, codigos_estado,
+    coef_antiguedad_vec, coef_tipologia_vec, coef_conservacion_vec,
+)
+
+USOS = list(USO_TO_GRUPO) + ["desconocido"]
+CATEGORIAS = list(range(-1, 12))
+ANIO_PONENCIA = 2010
+ANIOS = list(range(ANIO_PONENCIA - 1005, ANIO_PONENCIA + 5))  # T de -4 a 1006
+
+def _coef_antiguedad_por_tramos(anio_ponencia, anio_const, uso_const, categoria):
+    # Implementación original (recorrido lineal de tramos) como referencia
+    T = (anio_ponencia + 1) - anio_const
+    if T < 0:
+        return 1.00
+    grupo_uso = USO_TO_GRUPO.get(uso_const, "uso1")
+    grupo_cat = _get_cat_grupo(int(categoria))
+    for t_max, coef in _H_TABLE[grupo_uso][grupo_cat]:
+        if T <= t_max:
+            return round(coef, 2)
+    return 0.17
+
+def test_tabla_h_densa():
+    # Todas las combinaciones uso x categoría x T, escalar y vectorizado
+    usos, cats, anios = (np.array(v).reshape(-1) for v in np.meshgrid(
+        np.array(USOS, dtype=object), CATEGORIAS, ANIOS, indexing="ij"))
+    esperado = np.array([_coef_antiguedad_por_tramos(ANIO_PONENCIA, int(a), u, int(c)) for u, c, a in zip(usos, cats, anios)])
+    escalar = np.array([get_coef_antiguedad(ANIO_PONENCIA, int(a), u, int(c)) for u, c, a in zip(usos, cats, anios)])
+    vectorizado = coef_antiguedad_vec(np.full(len(usos), ANIO_PONENCIA), anios.astype(np.int64), codigos_uso(usos), cats.astype(np.int64))
+    assert np.array_equal(escalar, esperado)
+    assert np.array_equal(vectorizado, esperado)
+
+def test_tabla_tipologia_densa():
+    for uso in list(COEF_TIPOLOGIA) + ["desconocido"]:
+        for cat in CATEGORIAS:
+            esperado = COEF_TIPOLOGIA.get(uso, COEF_TIPOLOGIA["vivienda"]).get(cat, 1.0)
+            assert coef_tipologia_vec(codigos_uso([uso]), [cat])[0] == esperado
+
+def test_tabla_conservacion_densa():
+    for estado in list(COEF_CONSERVACION) + ["desconocido"]:
+        assert coef_conservacion_vec(codigos_estado([estado]))[0] == COEF_CONSERVACION.get(estado, 1.00)
+
+if __name__ == '__main__':
+    test_tabla_h_densa()
+    test_tabla_tipologia_densa()
+    test_tabla_conservacion_densa()
+    print("OK")
@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import numpy as np
+import pytest
+import ezdxf
+from core.dxf_reader import DXFReader
+
+
+def test_vertices_como_ezdxf():
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    rng = np.random.default_rng(3)
+    for n in (3, 7, 40):
+        pts = (rng.random((n, 2)) * 1000 + (440000, 4470000)).tolist()
+        msp.add_lwpolyline(pts, close=True)
+        msp.add_polyline2d(pts, close=True)
+    msp.add_polyline2d([])  # sin vértices
+
+    lw = list(msp.query("LWPOLYLINE"))
+    for poly, xy in zip(lw, map(DXFReader.vertices_lwpolyline, lw)):
+        assert xy.tolist() == [[p[0], p[1]] for p in poly.get_points()]
+        assert np.shares_memory(xy, poly.lwpoints.values)  # vista, sin copia
+
+    legacy = list(msp.query("POLYLINE"))
+    for poly, xy in zip(legacy, DXFReader.vertices_polylines(legacy)):
+        assert xy.tolist() == [[v.dxf.location.x, v.dxf.location.y] for v in poly.vertices]
+    assert DXFReader.vertices_polylines([]) == []
+
+
+def test_lwpolyline_y_polyline_dan_la_misma_parcela(tmp_path):
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    # L de 300 m²: el centroide de áreas no es el promedio de vértices
+    forma = [(0, 0), (20, 0), (20, 10), (10, 10), (10, 20), (0, 20)]
+    msp.add_lwpolyline(forma, close=True, dxfattribs={"layer": "LW"})
+    msp.add_polyline2d(forma, close=True, dxfattribs={"layer": "LEGACY"})
+    ruta = str(tmp_path / "mixto.dxf")
+    doc.saveas(ruta)
+
+    for capa in ("LW", "LEGACY"):
+        parcela, = DXFReader.leer_borde_parcelas(ruta, [capa], "")
+        assert parcela.coordenadas == forma + [forma[0]]
+        assert parcela.area == pytest.approx(300)
+        assert parcela.punto_referencia == pytest.approx((25 / 3, 25 / 3))
+        assert parcela.capa_origen == capa and parcela.nombre_archivo == "mixto"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import pytest
+from shapely.geometry import Polygon
+from core.gml_reader import GMLReader
+from benchmarks.tejido_sintetico import generar_tejido, escribir_gml
+
+EDIFICIO = """<?xml version="1.0" encoding="UTF-8"?>
+<FeatureCollection xmlns="http://www.opengis.net/wfs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2"
+    xmlns:bu-ext2d="http://inspire.jrc.ec.europa.eu/schemas/bu-ext2d/2.0" xmlns:base="urn:x-inspire:specification:gmlas:BaseTypes:3.2">
+<member><bu-ext2d:Building gml:id="ES.SDGC.BU.9872023VH5797S">
+  <bu-ext2d:geometry><gml:MultiSurface srsName="urn:ogc:def:crs:EPSG::4258">
+    <gml:surfaceMember><gml:Polygon><gml:exterior><gml:LinearRing>
+      <gml:posList srsDimension="2">40.4160 -3.7040 40.4160 -3.7030 40.4170 -3.7030 40.4170 -3.7040 40.4160 -3.7040</gml:posList>
+    </gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>
+    <gml:surfaceMember><gml:Polygon><gml:exterior><gml:LinearRing>
+      <gml:pos>40.4180 -3.7040</gml:pos><gml:pos>40.4180 -3.7030</gml:pos><gml:pos>40.4190 -3.7030</gml:pos><gml:pos>40.4180 -3.7040</gml:pos>
+    </gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>
+  </gml:MultiSurface></bu-ext2d:geometry>
+  <bu-ext2d:inspireId><base:Identifier><base:localId>9872023VH5797S</base:localId></base:Identifier></bu-ext2d:inspireId>
+</bu-ext2d:Building></member>
+</FeatureCollection>
+"""
+
+
+def test_gml_inspire_como_el_tejido(tmp_path):
+    tejido = generar_tejido(300)
+    parcelas = GMLReader.leer_gml(escribir_gml(tejido, str(tmp_path / "municipio.gml")), "25830")
+
+    area = {p.rc: Polygon(p.exterior, p.huecos).area for p in tejido}
+    assert [p.referencia_catastral for p in parcelas] == [p.rc for p in tejido]
+    for p in parcelas:
+        # posList redondeado al cm: ~1 m² de error en parcelas de 200 m de perímetro
+        assert p.area == pytest.approx(area[p.referencia_catastral], abs=2.0)
+        assert p.tipo_entidad == "CP" and p.capa_origen == "municipio.gml"
+    assert sum(len(p.interiores) for p in parcelas) == sum(len(p.huecos) for p in tejido)
+
+
+def test_edificio_multisuperficie_en_etrs89_lat_lon(tmp_path):
+    ruta = tmp_path / "edificios.gml"
+    ruta.write_text(EDIFICIO)
+    parcelas = GMLReader.leer_gml(str(ruta), "25830")
+
+    assert [p.nombre_archivo for p in parcelas] == ["9872023VH5797S.1", "9872023VH5797S.2"]
+    assert {p.tipo_entidad for p in parcelas} == {"BU"}
+    # Orden lat lon de EPSG:4258 -> Madrid en UTM 30N
+    x, y = parcelas[0].punto_referencia
+    assert 440000 < x < 441000 and 4474000 < y < 4475000
+    assert parcelas[0].area == pytest.approx(9420, rel=0.01)
+    assert len(parcelas[1].coordenadas) == 4
+
+
+def test_analyze_conserva_el_tipo_del_gml(tmp_path):
+    from fastapi.testclient import TestClient
+    from main import app
+    r = TestClient(app).post("/analyze", files={"file": ("edificios.gml", EDIFICIO.encode("utf-8"))})
+    assert r.status_code == 200, r.text
+    assert [p["tipo_entidad"] for p in r.json()["parcelas"]] == ["BU", "BU"]
+
+
+MIEMBRO = """<member><bu-ext2d:Building gml:id="B{n}">
+  <bu-ext2d:geometry><gml:MultiSurface{srs}>
+    <gml:surfaceMember><gml:Polygon><gml:exterior><gml:LinearRing>
+      <gml:posList>{pos}</gml:posList>
+    </gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>
+  </gml:MultiSurface></bu-ext2d:geometry>
+</bu-ext2d:Building></member>
+"""
+
+
+def test_crs_por_miembro(tmp_path):
+    lat_lon = "40.4160 -3.7040 40.4160 -3.7030 40.4170 -3.7030 40.4170 -3.7040 40.4160 -3.7040"
+    utm = "440000 4470000 440100 4470000 440100 4470100 440000 4470100 440000 4470000"
+    miembros = [
+        MIEMBRO.format(n=1, srs="", pos=lat_lon),  # sin srsName antes del primero que lo declara
+        MIEMBRO.format(n=2, srs=' srsName="urn:ogc:def:crs:EPSG::4258"', pos=lat_lon),
+        MIEMBRO.format(n=3, srs=' srsName="urn:ogc:def:crs:EPSG::25830"', pos=utm),
+        MIEMBRO.format(n=4, srs="", pos=lat_lon),
+    ]
+    cabecera, pie = EDIFICIO.split("<member>")[0], "</FeatureCollection>\n"
+    ruta = tmp_path / "mixto.gml"
+    ruta.write_text(cabecera + "".join(miembros) + pie)
+
+    parcelas = GMLReader.leer_gml(str(ruta), "25830")
+    assert [p.nombre_archivo for p in parcelas] == [f"GML_FEATURE_{n}" for n in (1, 2, 3, 4)]
+    for p in parcelas[:2] + parcelas[3:]:
+        # Todos en lat lon de EPSG:4258 (el primero y el último heredan el CRS del archivo)
+        x, y = p.punto_referencia
+        assert 440000 < x < 441000 and 4474000 < y < 4475000
+        assert p.area == pytest.approx(9420, rel=0.01)
+    assert parcelas[2].area == pytest.approx(10000)
+    assert parcelas[2].punto_referencia == pytest.approx((440050, 4470050))
+
+    # La ventana también se aplica a los miembros leídos antes de conocer el CRS
+    ventana = GMLReader.leer_gml(str(ruta), "25830", bbox=(439900, 4469900, 440200, 4470200))
+    assert [p.nombre_archivo for p in ventana] == ["GML_FEATURE_3"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
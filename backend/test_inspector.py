@@ -0,0 +1,104 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import contextlib
+import pytest
+from core.inspector import Inspector, inspeccion_cache, sugerir_epsg
+from core.dxf_reader import DXFReader
+from benchmarks.tejido_sintetico import generar_tejido, escribir_todos
+
+
+@pytest.fixture(scope="module")
+def rutas(tmp_path_factory):
+    return escribir_todos(generar_tejido(300), str(tmp_path_factory.mktemp("tejido")))
+
+
+def test_escaneo_dxf_como_ezdxf(tmp_path):
+    import ezdxf
+    doc = ezdxf.new("R2010")
+    doc.layers.add("VACÍA")
+    doc.layers.add("PG-LI")
+    msp = doc.modelspace()
+    msp.add_lwpolyline([(440000, 4470000), (440010, 4470000), (440010, 4470010)], close=True, dxfattribs={"layer": "PG-LI"})
+    # POLYLINE 2D: su punto 10/20 (0, 0) no cuenta en la envolvente, los VERTEX sí
+    msp.add_polyline2d([(440020, 4470020), (440030, 4470020), (440030, 4470035)], close=True, dxfattribs={"layer": "PG-LI"})
+    msp.add_line((440000, 4469990), (440005, 4469995), dxfattribs={"layer": "Líneas"})
+    msp.add_text("EDIFICIO", dxfattribs={"layer": "Líneas", "insert": (440001, 4470001)})
+    # Espacio papel: no cuenta
+    doc.layout("Layout1").add_line((0, 0), (1, 1), dxfattribs={"layer": "PG-LI"})
+    ruta = str(tmp_path / "edificios.dxf")
+    doc.saveas(ruta)
+
+    capas = {c["nombre"]: c for c in Inspector.escanear_dxf(ruta)}
+    assert sorted((c["nombre"], c["geometrias"], c["textos"]) for c in capas.values()) == \
+        DXFReader.obtener_capas_con_detalle(ruta)
+    assert capas["PG-LI"]["bbox"] == (440000, 4470000, 440030, 4470035)
+    assert capas["Líneas"]["bbox"] == (440000, 4469990, 440005, 4470001)  # incluye el texto
+    assert capas["VACÍA"]["bbox"] is None
+
+    resultado = Inspector.inspeccionar(ruta, "dxf")
+    assert resultado["tipo_entidad_sugerido"] == "BU" and resultado["epsg_sugerido"] == "25830"
+    assert resultado["capas_parcelas"] == ["Líneas", "PG-LI"] and resultado["capa_textos"] == "Líneas"
+
+
+def test_envolvente_de_textos(tmp_path):
+    import ezdxf
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    msp.add_lwpolyline([(440000, 4470000), (440050, 4470000), (440050, 4470050)], close=True, dxfattribs={"layer": "PG-LP"})
+    # En MTEXT el 11/21 es el vector de dirección, no un punto
+    msp.add_mtext("1234567VH1234S", dxfattribs={"layer": "PG-LT", "insert": (440061, 4470061),
+                                                "text_direction": (0.866, 0.5, 0)})
+    # TEXT sin justificar: el 11/21 (si lo hay) no cuenta; justificado, sí
+    msp.add_text("A", dxfattribs={"layer": "PG-LT", "insert": (440010, 4470010), "align_point": (0, 0)})
+    msp.add_text("B", dxfattribs={"layer": "PG-LT", "insert": (440020, 4470020), "halign": 1,
+                                  "align_point": (440070, 4470020)})
+    ruta = str(tmp_path / "textos.dxf")
+    doc.saveas(ruta)
+
+    capas = {c["nombre"]: c for c in Inspector.escanear_dxf(ruta)}
+    assert capas["PG-LT"]["bbox"] == (440010, 4470010, 440070, 4470061)
+    resultado = Inspector.inspeccionar(ruta, "dxf")
+    assert resultado["bbox"] == (440000, 4470000, 440070, 4470061)
+    assert resultado["epsg_sugerido"] == "25830"
+
+
+def test_formatos_sin_leer_geometrias(rutas):
+    dxf = Inspector.inspeccionar(rutas["dxf"], "dxf")
+    assert (dxf["capas_parcelas"], dxf["capa_textos"], dxf["tipo_entidad_sugerido"]) == (["PG-LP"], "PG-LT", "CP")
+    referencia = dxf["bbox"]
+
+    for formato in ("shp", "gml", "fgb"):
+        resultado = Inspector.inspeccionar(rutas[formato], formato)
+        assert sum(c["geometrias"] for c in resultado["capas"]) == 300, formato
+        assert resultado["bbox"] == pytest.approx(referencia, abs=0.01), formato
+        assert resultado["epsg_sugerido"] == "25830", formato
+    for formato in ("kml", "kmz", "geojsonseq"):
+        resultado = Inspector.inspeccionar(rutas[formato], formato)
+        assert sum(c["geometrias"] for c in resultado["capas"]) == 300, formato
+        assert resultado["epsg_sugerido"] == "4326" and -5 < resultado["bbox"][0] < -3, formato
+
+    assert sugerir_epsg((200000, 3100000, 210000, 3110000)) == "32628"
+    assert sugerir_epsg((0, 0, 500, 500)) is None
+
+
+def test_inspect_cacheado_por_contenido(rutas):
+    from fastapi.testclient import TestClient
+    from main import app
+    inspeccion_cache.clear()
+    cliente = TestClient(app)
+    with open(rutas["shp"], "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+        contenido = f.read()
+        primera = cliente.post("/inspect", files={"file": ("municipio.zip", contenido)})
+        segunda = cliente.post("/inspect", files={"file": ("otro_nombre.zip", contenido)})
+        erronea = cliente.post("/inspect", files={"file": ("municipio.pdf", contenido)})
+    assert primera.status_code == 200 and not primera.json()["en_cache"]
+    assert segunda.json()["en_cache"] and segunda.json()["hash"] == primera.json()["hash"]
+    assert primera.json()["capas"][0] == {"nombre": "parcelas.shp", "geometrias": 300, "textos": 0,
+                                          "bbox": pytest.approx(primera.json()["bbox"])}
+    assert erronea.status_code == 400
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
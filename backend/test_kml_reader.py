@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import zipfile
+import pytest
+from core.kml_reader import KMLReader
+
+KML = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+<Document><name>Andújar</name><Folder>
+  <Placemark><name>23039A04900001</name>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>
+      -4.0600,38.0400,0 -4.0590,38.0400,0 -4.0590,38.0410,0 -4.0600,38.0410,0 -4.0600,38.0400,0
+    </coordinates></LinearRing></outerBoundaryIs>
+    <innerBoundaryIs><LinearRing><coordinates>
+      -4.0597,38.0403 -4.0593,38.0403 -4.0593,38.0407 -4.0597,38.0407 -4.0597,38.0403
+    </coordinates></LinearRing></innerBoundaryIs></Polygon>
+  </Placemark>
+  <Placemark><name>Olivar</name><MultiGeometry>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>-4.05,38.04 -4.049,38.04 -4.049,38.041 -4.05,38.04</coordinates></LinearRing></outerBoundaryIs></Polygon>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>-4.04,38.04,0 -4.039,38.04 x,y -4.039,38.041,0 -4.04,38.04,0</coordinates></LinearRing></outerBoundaryIs></Polygon>
+  </MultiGeometry></Placemark>
+  <Placemark><Point><coordinates>-4.05,38.04</coordinates></Point></Placemark>
+</Folder></Document></kml>
+"""
+
+
+def test_kmz_en_streaming_desde_el_zip(tmp_path):
+    ruta = str(tmp_path / "parcelas.kmz")
+    with zipfile.ZipFile(ruta, "w") as z:
+        z.writestr("files/leyenda.png", b"")
+        z.writestr("doc.kml", KML)
+
+    parcelas = KMLReader.leer_desde_kmz(ruta, "25830")
+    assert [p.nombre_archivo for p in parcelas] == ["23039A04900001", "Olivar_1", "Olivar_2"]
+    assert [p.referencia_catastral for p in parcelas] == ["23039A04900001", "", ""]
+    assert len(parcelas[0].coordenadas) == 5 and len(parcelas[0].interiores) == 1
+    assert parcelas[0].area == pytest.approx(8180, rel=0.01)
+    assert len(parcelas[2].coordenadas) == 4  # la tupla no numérica se descarta
+    assert {p.capa_origen for p in parcelas} == {"doc.kml"}
+
+
+def test_kml_latin1_y_coordenadas_en_bloque(tmp_path):
+    ruta = tmp_path / "parcelas.kml"
+    ruta.write_bytes(KML.replace("Olivar", "Viña").encode("latin-1"))
+    parcelas = KMLReader.leer_kml(str(ruta))
+    assert [p.nombre_archivo for p in parcelas] == ["23039A04900001", "Viña_1", "Viña_2"]
+
+    assert KMLReader._parse_coordinates(" 1,2,0\n 3,4,0 ") == [(1.0, 2.0), (3.0, 4.0)]
+    assert KMLReader._parse_coordinates("1,2 3,4,5 x,6 7,8") == [(1.0, 2.0), (3.0, 4.0), (7.0, 8.0)]
+
+
+def test_area_y_centroide_vectorizados_como_shapely(tmp_path):
+    from shapely.geometry import Polygon
+    degeneradas = """<Placemark><name>linea</name><Polygon><outerBoundaryIs><LinearRing><coordinates>
+        -4.05,38.04 -4.04,38.04 -4.03,38.04 -4.05,38.04</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>
+      <Placemark><name>dos</name><Polygon><outerBoundaryIs><LinearRing><coordinates>
+        -4.05,38.04 -4.04,38.05</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>"""
+    ruta = tmp_path / "mixto.kml"
+    ruta.write_text(KML.replace("</Folder>", "</Folder>" + degeneradas))
+
+    parcelas = KMLReader.leer_kml(str(ruta), "25830")
+    assert [p.nombre_archivo for p in parcelas][-2:] == ["linea", "dos"]
+    for p in parcelas[:-1]:
+        poligono = Polygon(p.coordenadas, p.interiores)
+        assert p.area == pytest.approx(poligono.area, rel=1e-9, abs=1e-9)
+        assert p.punto_referencia == pytest.approx((poligono.centroid.x, poligono.centroid.y), abs=1e-6)
+    assert parcelas[-1].area == 0.0 and len(parcelas[-1].coordenadas) == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
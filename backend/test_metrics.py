@@ -0,0 +1,93 @@
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import pytest
+import core.upstream as upstream
+from core.metrics import PROMETHEUS_AVAILABLE
+from ovc_stub_server import crear_servidor
+
+pytestmark = pytest.mark.skipif(not PROMETHEUS_AVAILABLE, reason="prometheus-client no instalado")
+
+
+def _dxf_dos_parcelas(ruta):
+    """Dos parcelas contiguas en la capa PG-LP, una con un hueco"""
+    import ezdxf
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    x0, y0 = 430000.0, 4210000.0
+    msp.add_lwpolyline([(x0, y0), (x0 + 100, y0), (x0 + 100, y0 + 80), (x0, y0 + 80)], close=True,
+                       dxfattribs={"layer": "PG-LP"})
+    msp.add_lwpolyline([(x0 + 100, y0), (x0 + 200, y0), (x0 + 200, y0 + 80), (x0 + 100, y0 + 80)], close=True,
+                       dxfattribs={"layer": "PG-LP"})
+    msp.add_lwpolyline([(x0 + 20, y0 + 20), (x0 + 40, y0 + 20), (x0 + 40, y0 + 40), (x0 + 20, y0 + 40)], close=True,
+                       dxfattribs={"layer": "PG-LP"})
+    doc.saveas(ruta)
+
+
+def _cliente():
+    from fastapi.testclient import TestClient
+    from main import app
+    return TestClient(app)
+
+
+def _muestra(texto, nombre, **etiquetas):
+    """Valor de una serie del texto de exposición (None si no aparece)"""
+    for linea in texto.splitlines():
+        if not linea.startswith(nombre + "{") and linea.split(" ")[0] != nombre:
+            continue
+        if all(f'{k}="{v}"' in linea for k, v in etiquetas.items()):
+            return float(linea.rsplit(" ", 1)[1])
+    return None
+
+
+def test_etapas_de_analyze(tmp_path):
+    ruta = str(tmp_path / "parcelas.dxf")
+    _dxf_dos_parcelas(ruta)
+    cliente = _cliente()
+    with open(ruta, "rb") as f:
+        r = cliente.post("/analyze", files={"file": ("parcelas.dxf", f.read())})
+    assert r.status_code == 200, r.text
+    assert r.json()["num_huecos"] == 1
+
+    texto = cliente.get("/metrics").text
+    for nombre in ("guardado", "lectura", "topologia", "anidamiento", "conflictos", "proyeccion", "serializacion"):
+        assert _muestra(texto, "catastro_analyze_etapa_segundos_count", etapa=nombre, formato="dxf") >= 1, nombre
+    assert _muestra(texto, "catastro_analyze_parcelas_sum", formato="dxf") >= r.json()["num_parcelas"]
+    assert _muestra(texto, "catastro_analyze_vertices_sum", formato="dxf") > 0
+
+
+def test_latencia_upstream_errores_y_caches(monkeypatch):
+    servidor = crear_servidor(puerto=0, latencia="fija:5", tasa_error=1.0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(upstream, "OVC_BASE_URL", f"http://127.0.0.1:{servidor.server_address[1]}")
+    cliente = _cliente()
+    try:
+        r = cliente.post("/catastro/buscar-rustica", json={
+            "provincia": "23", "municipio": "39", "poligono": "99", "parcela": "1"
+        })
+        assert r.status_code == 200
+        assert not r.json()["encontrado"]
+    finally:
+        servidor.shutdown()
+
+    texto = cliente.get("/metrics").text
+    assert _muestra(texto, "catastro_upstream_segundos_count", metodo="Consulta_DNPPP") >= 1
+    assert _muestra(texto, "catastro_upstream_errores_total", metodo="Consulta_DNPPP", tipo="http_5xx") >= 1
+    assert _muestra(texto, "catastro_cache_consultas_total", cache="rustica", resultado="fallo") >= 1
+    assert _muestra(texto, "catastro_cache_ratio_aciertos", cache="zonas") is not None
+
+
+def test_multiproceso_conserva_metricas_de_cache(tmp_path, monkeypatch):
+    from core import metrics
+    _cliente()  # la app registra el colector de cachés
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    texto = metrics.exportar().decode("utf-8")
+    assert _muestra(texto, "catastro_cache_ratio_aciertos", cache="zonas") is not None
+    # Y sigue sirviendo el registro global sin la variable
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+    assert _muestra(metrics.exportar().decode("utf-8"), "catastro_cache_ratio_aciertos", cache="zonas") is not None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
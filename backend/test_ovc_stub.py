@@ -0,0 +1,85 @@
+import sys
+import os
+import threading
+import urllib.request
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import core.upstream as upstream
+from core.zone_cache import zone_cache
+from ovc_stub_server import crear_servidor, Latencia
+from main import (
+    BuscarRCRequest, BuscarRusticaRequest, BuscarCoordsRequest,
+    buscar_por_referencia_catastral, buscar_parcela_rustica, buscar_por_coordenadas,
+)
+
+
+def _arrancar(**kw):
+    servidor = crear_servidor(puerto=0, semilla=1, **kw)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def test_proxies_contra_el_stub(monkeypatch):
+    servidor, base = _arrancar()
+    monkeypatch.setattr(upstream, "OVC_BASE_URL", base)
+    zone_cache.clear()
+    try:
+        res = buscar_por_referencia_catastral(BuscarRCRequest(referencia_catastral="8409103VH0180N"))
+        assert res["encontrado"]
+        assert res["municipio"] == "ANDUJAR"
+        assert abs(res["lat"] - 38.03947155) < 1e-9
+        assert res["zona_valor"] == "R47"
+        assert res["num_unidades"] == 15
+        assert len(res["unidades_sin_detalle"]) == 14  # solo se detalla la primera
+
+        res = buscar_parcela_rustica(BuscarRusticaRequest(provincia="23", municipio="39", poligono="49", parcela="5"))
+        assert res["encontrado"] and res["rc"] == "23039A04900005"
+
+        res = buscar_por_coordenadas(BuscarCoordsRequest(lat=38.0394, lon=-4.0571))
+        assert res["encontrado"] and res["rc"] == "8409103VH0180N"
+
+        stats = servidor.estado.resumen()
+        assert stats["peticiones"]["Consulta_DNPRC"] == 2  # lista de 15 unidades + detalle de la primera
+
+        res = buscar_por_referencia_catastral(BuscarRCRequest(referencia_catastral="8409103VH0180N",
+                                                              detalle_unidades=True))
+        assert res["num_unidades"] == 15 and len(res["unidades_sin_detalle"]) == 5  # límite de 10
+        stats = servidor.estado.resumen()
+        assert stats["peticiones"]["Consulta_DNPRC"] == 2 + 1 + 10
+        assert stats["peticiones"]["WMS_GetFeatureInfo"] == 1
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_errores_y_config_en_caliente():
+    servidor, base = _arrancar(tasa_error=1.0)
+    try:
+        url = f"{base}/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_CPMRC?RC=8409103VH0180N"
+        try:
+            urllib.request.urlopen(url, timeout=5)
+            assert False
+        except urllib.error.HTTPError as e:
+            assert e.code == 503
+
+        with urllib.request.urlopen(f"{base}/_stub/config?tasa_error=0", timeout=5) as r:
+            assert json.loads(r.read())["tasa_error"] == 0.0
+        with urllib.request.urlopen(url, timeout=5) as r:
+            assert b"<xcen>" in r.read()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_distribuciones_de_latencia():
+    import random
+    rnd = random.Random(0)
+    assert Latencia("fija:50").muestra_s(rnd) == 0.05
+    assert all(0.02 <= Latencia("uniforme:20:40").muestra_s(rnd) <= 0.04 for _ in range(100))
+    muestras = sorted(Latencia("lognormal:80:0.5").muestra_s(rnd) for _ in range(2001))
+    assert 0.07 < muestras[1000] < 0.09
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
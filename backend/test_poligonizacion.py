@@ -0,0 +1,95 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import math
+import numpy as np
+import pytest
+import ezdxf
+from core.poligonizacion import agrupar_extremos, poligonizar, segmentos_de_arco
+from core.dxf_reader import DXFReader
+from benchmarks.tejido_sintetico import generar_tejido
+
+
+def test_agrupar_extremos_une_vecinos_de_celda():
+    # 0 y 1 comparten celda, 2 está en la contigua (a 4 mm de 1); 3 queda lejos
+    xy = np.array([[0.0, 0.0], [0.009, 0.0], [0.013, 0.0], [5.0, 5.0]])
+    _, grupo = agrupar_extremos(xy, 0.01)
+    assert grupo[0] == grupo[1] == grupo[2] != grupo[3]
+
+
+def test_poligonizar_segmentos_con_holgura():
+    rng = np.random.default_rng(1)
+    cuadrado = np.array([(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)], dtype=float)
+    segmentos = np.stack((cuadrado[:-1], cuadrado[1:]), axis=1)
+    # Cada lado dos veces (una invertida), con extremos movidos hasta 3 mm y la diagonal
+    segmentos = np.concatenate((segmentos, segmentos[:, ::-1], [[(0, 0), (10, 10)]]))
+    segmentos = segmentos + rng.uniform(-0.003, 0.003, segmentos.shape)
+
+    caras = poligonizar(segmentos, 0.01)
+    assert len(caras) == 2
+    assert sorted(c.area for c in caras) == pytest.approx([50, 50], abs=0.1)
+
+
+def test_dxf_con_lineas_y_arcos(tmp_path):
+    tejido = generar_tejido(60, frac_huecos=0, frac_solapes=0)
+    rng = np.random.default_rng(7)
+
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    for p in tejido:
+        # Cada parcela dibuja sus lados: los linderos compartidos quedan repetidos y sin coincidir
+        for a, b in zip(p.exterior[:-1], p.exterior[1:]):
+            ja, jb = rng.uniform(-0.003, 0.003, (2, 2))
+            msp.add_line((a[0] + ja[0], a[1] + ja[1]), (b[0] + jb[0], b[1] + jb[1]), dxfattribs={"layer": "LINDEROS"})
+        msp.add_text(p.rc, dxfattribs={"layer": "RC", "height": 1.0, "insert": p.etiqueta})
+
+    # Círculo de dos arcos y cuadrado de dos polilíneas abiertas en L
+    msp.add_arc((0, 0), 5, 0, 180, dxfattribs={"layer": "OTROS"})
+    msp.add_arc((0, 0), 5, 180, 360, dxfattribs={"layer": "OTROS"})
+    msp.add_lwpolyline([(20, 0), (30, 0), (30, 10)], dxfattribs={"layer": "OTROS"})
+    msp.add_lwpolyline([(30, 10), (20, 10), (20, 0)], dxfattribs={"layer": "OTROS"})
+    ruta = str(tmp_path / "plano_topografico.dxf")
+    doc.saveas(ruta)
+
+    parcelas = DXFReader.leer_borde_parcelas(ruta, ["LINDEROS"], "RC")
+    assert sorted(p.referencia_catastral for p in parcelas) == sorted(p.rc for p in tejido)
+
+    otras = sorted(DXFReader.leer_borde_parcelas(ruta, ["OTROS"], "RC"), key=lambda p: p.area)
+    # Cuerdas con flecha de 1 cm: el círculo pierde ~0,2 m²
+    assert [p.area for p in otras] == pytest.approx([math.pi * 25, 100], abs=0.5)
+
+    ventana = DXFReader.leer_borde_parcelas(ruta, ["OTROS"], "RC", bbox=(25, 5, 26, 6))
+    assert len(ventana) == 1 and ventana[0].area == pytest.approx(100)
+
+
+def test_linea_suelta_no_descarta_polilineas_abiertas(tmp_path):
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    msp.add_lwpolyline([(0, 0), (10, 0), (10, 10), (0, 10)], dxfattribs={"layer": "PG-LP"})  # abierta
+    msp.add_lwpolyline([(20, 0), (30, 0), (30, 10), (20, 10)], close=True, dxfattribs={"layer": "PG-LP"})
+    ruta = str(tmp_path / "mixto.dxf")
+    doc.saveas(ruta)
+    assert len(DXFReader.leer_borde_parcelas(ruta, ["PG-LP"], "")) == 2
+
+    # Una línea de acotación en la capa no cierra nada: las dos parcelas siguen ahí
+    msp.add_line((5, 5), (15, 15), dxfattribs={"layer": "PG-LP"})
+    doc.saveas(ruta)
+    parcelas = DXFReader.leer_borde_parcelas(ruta, ["PG-LP"], "")
+    assert sorted(p.area for p in parcelas) == pytest.approx([100, 100])
+
+    # Si la LINE sí cierra la polilínea abierta, la cara sale una vez (no cerrada a la fuerza además)
+    msp.add_line((0, 10), (0, 0), dxfattribs={"layer": "PG-LP"})
+    doc.saveas(ruta)
+    parcelas = DXFReader.leer_borde_parcelas(ruta, ["PG-LP"], "")
+    assert sorted(p.area for p in parcelas) == pytest.approx([100, 100])
+
+
+def test_arco_respeta_flecha():
+    segmentos = segmentos_de_arco(0, 0, 100, 350, 10, flecha=0.01)
+    assert np.allclose(segmentos[0, 0], (100 * math.cos(math.radians(350)), 100 * math.sin(math.radians(350))))
+    medios = segmentos.mean(axis=1)
+    assert (100 - np.hypot(medios[:, 0], medios[:, 1])).max() <= 0.01
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+import pytest
+from core.ponencia_store import PonenciaStore, VistaPonencias, MunicipioPonencia, ponencias
+
+
+def _ponencia(municipio, **extra):
+    return {"municipio": municipio, "provincia": "Jaén", "anio_ponencia": 2010, "mbc": 550.0, "mbr": 450.0,
+            "rm": 0.5, "coef_ibi_rustica": 1.0, "tipo_ibi": {"urbano": 0.006, "rustico": 0.01}, **extra}
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    for archivo, data in {
+        "a.json": _ponencia("Úbeda", orden=2),
+        "b.json": _ponencia("Andújar", orden=1, alias=["Andujar"]),
+        "c.json": _ponencia("Baeza"),
+    }.items():
+        (tmp_path / archivo).write_text(json.dumps(data), encoding="utf-8")
+    return tmp_path
+
+
+def test_indice_ordenado_y_con_alias(directorio):
+    store = PonenciaStore(str(directorio))
+    # Sin index.json se construye recorriendo los JSON; "orden" manda y los que no lo tienen van al final
+    assert store.nombres() == ["Andújar", "Andujar", "Úbeda", "Baeza"]
+    assert store._cargados == {}  # listar no carga ningún municipio
+
+    PonenciaStore.escribir_indice(str(directorio))
+    (directorio / "c.json").unlink()  # con índice ya no se recorre el directorio
+    assert PonenciaStore(str(directorio)).nombres() == ["Andújar", "Andujar", "Úbeda", "Baeza"]
+
+
+def test_resolver_ignora_mayusculas_y_acentos(directorio):
+    store = PonenciaStore(str(directorio))
+    assert store.resolver("Andújar") == "Andújar"
+    assert store.resolver("ANDUJAR") == "Andújar"  # gana el nombre principal sobre el alias
+    assert store.resolver("ubeda") == "Úbeda"
+    assert store.resolver("Jaén") is None and store.resolver("") is None
+
+
+def test_lru_acotada(directorio):
+    store = PonenciaStore(str(directorio), max_cargados=2)
+    assert store.obtener("Andujar") is store.obtener("Andújar")  # el alias comparte la entrada
+    store.obtener("Úbeda")
+    store.obtener("Andújar")  # pasa a ser el más reciente
+    store.obtener("Baeza")
+    assert list(store._cargados) == ["b.json", "c.json"]
+
+    assert "orden" not in store.datos("Andújar") and "alias" not in store.datos("Andújar")
+    with pytest.raises(TypeError):
+        store.datos("Andújar")["mbc"] = 0
+    with pytest.raises(KeyError):
+        store.obtener("Jaén")
+
+
+def test_vista_ponencias(directorio):
+    store = PonenciaStore(str(directorio))
+    datos, compilados = VistaPonencias(store, compilado=False), VistaPonencias(store, compilado=True)
+    assert list(datos) == store.nombres() and len(compilados) == 4
+    assert datos["Baeza"]["mbc"] == 550.0
+    assert isinstance(compilados["Baeza"], MunicipioPonencia)
+    assert "Jaén" not in datos and datos.get("Jaén") is None
+
+
+def test_orden_de_municipios_disponibles():
+    assert ponencias.nombres()[:3] == ["Andújar", "Fuencaliente", "Madrid"]
+    assert ponencias.nombres() == list(PonenciaStore.construir_indice(ponencias.directorio))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import pytest
+import core.profiling as profiling
+from test_metrics import _dxf_dos_parcelas
+
+
+@pytest.fixture
+def cliente(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from main import app
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "secreto")
+    monkeypatch.setattr(profiling, "PROFILING_DIR", str(tmp_path / "perfiles"))
+    return TestClient(app)
+
+
+def _analizar(cliente, tmp_path, cabeceras):
+    ruta = str(tmp_path / "parcelas.dxf")
+    _dxf_dos_parcelas(ruta)
+    with open(ruta, "rb") as f:
+        return cliente.post("/analyze", files={"file": ("parcelas.dxf", f.read())}, headers=cabeceras)
+
+
+def test_analyze_perfilado(cliente, tmp_path):
+    r = _analizar(cliente, tmp_path, {"X-Profile-Token": "secreto"})
+    assert r.status_code == 200
+    id_informe = r.headers["X-Profile-Id"]
+
+    informe = cliente.get(f"/profiling/{id_informe}", headers={"X-Profile-Token": "secreto"}).json()
+    assert informe["ruta"] == "/analyze" and informe["estado_http"] == 200
+    assert {"lectura", "topologia", "serializacion"} <= set(informe["etapas_s"])
+    assert informe["entidades"]["parcelas"] == 2
+    assert informe["entidades"]["huecos"] == 1
+    assert informe["memoria_pico_mb"] >= 0
+    assert "leer_borde_parcelas" in informe["perfil"]
+
+    prof = cliente.get(f"/profiling/{id_informe}/prof", headers={"X-Profile-Token": "secreto"})
+    assert prof.status_code == 200 and len(prof.content) > 0
+
+
+def test_sin_token_no_se_perfila(cliente, tmp_path):
+    r = _analizar(cliente, tmp_path, {"X-Profile-Token": "otro"})
+    assert r.status_code == 200
+    assert "X-Profile-Id" not in r.headers
+    assert not os.path.exists(profiling.PROFILING_DIR)
+    assert cliente.get("/profiling/" + "0" * 32, headers={"X-Profile-Token": "otro"}).status_code == 404
+    assert cliente.get("/profiling/../main.py", headers={"X-Profile-Token": "secreto"}).status_code == 404
+
+
+def test_rutas_perfilables():
+    assert profiling.ruta_perfilable("/analyze")
+    assert profiling.ruta_perfilable("/generate-kmz")
+    assert profiling.ruta_perfilable("/catastro/calcular-ibi")
+    assert not profiling.ruta_perfilable("/catastro/calcular-ibi-lote")
+    assert not profiling.ruta_perfilable("/health")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import zipfile
+import pytest
+import shapefile
+from core import shp_reader
+from core.shp_reader import SHPReader
+
+
+def _capa(desplazamiento=0):
+    """MultiPolygon con RC en 'refcat', polígono con hueco y rótulo en 'ID', RC en 'ID' y uno sin nada"""
+    shp, shx, dbf = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    w = shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POLYGON)
+    w.field("refcat", "C", 20)
+    w.field("ID", "C", 20)
+    w.poly([[(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)], [(20, 0), (20, 10), (30, 10), (30, 0), (20, 0)]])
+    w.record("8409103VH0180N", "")
+    w.poly([[(0, 20), (0, 30), (10, 30), (10, 20), (0, 20)], [(2, 22), (8, 22), (8, 28), (2, 28), (2, 22)]])
+    w.record("", "huerto norte")
+    w.poly([[(20, 20), (20, 30), (30, 30), (30, 20), (20, 20)]])
+    w.record("", "23039a04900001")
+    w.poly([[(40 + desplazamiento, 20), (40, 30), (50, 30), (50, 20), (40 + desplazamiento, 20)]])
+    w.record("", "")
+    w.close()
+    return {"shp": shp.getvalue(), "shx": shx.getvalue(), "dbf": dbf.getvalue()}
+
+
+def _zip_shp(ruta_zip, carpetas=("capas/",)):
+    with zipfile.ZipFile(ruta_zip, "w") as z:
+        for i, carpeta in enumerate(carpetas):
+            for ext, datos in _capa(desplazamiento=i).items():
+                z.writestr(f"{carpeta}parcelas.{ext}", datos)
+        z.writestr("__MACOSX/capas/._parcelas.shp", b"basura")
+
+
+def test_lectura_desde_zip_sin_extraer(tmp_path):
+    ruta = str(tmp_path / "parcelas.zip")
+    _zip_shp(ruta)
+    assert SHPReader.listar_shp(ruta) == ["capas/parcelas.shp"]
+
+    parcelas = SHPReader.leer_desde_zip(ruta)
+    assert [p.nombre_archivo for p in parcelas] == [
+        "8409103VH0180N.1", "8409103VH0180N.2", "huerto norte", "23039A04900001", "SHP_FEATURE_4",
+    ]
+    assert [p.referencia_catastral for p in parcelas] == ["", "", "", "23039A04900001", ""]
+    assert parcelas[2].area == pytest.approx(100 - 36)
+    assert parcelas[2].interiores == [[(2.0, 22.0), (8.0, 22.0), (8.0, 28.0), (2.0, 28.0), (2.0, 22.0)]]
+    assert parcelas[1].coordenadas[0] == (20.0, 0.0) and parcelas[1].punto_referencia == (25.0, 5.0)
+    assert {p.capa_origen for p in parcelas} == {"capas/parcelas.shp"}
+
+
+def test_ventana_conserva_numeracion(tmp_path):
+    ruta = str(tmp_path / "parcelas.zip")
+    _zip_shp(ruta)
+    parcelas = SHPReader.leer_desde_zip(ruta, bbox=(39, 19, 51, 31))
+    assert [p.nombre_archivo for p in parcelas] == ["SHP_FEATURE_4"]
+
+
+def test_varias_capas_en_paralelo(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "municipios.zip")
+    carpetas = ("23050/", "23039/", "23001/")
+    _zip_shp(ruta, carpetas)
+    monkeypatch.setattr(shp_reader, "SHP_MAX_WORKERS", 1)
+    serie = SHPReader.leer_desde_zip(ruta)
+
+    # Por debajo del umbral de tamaño no se arranca ningún proceso
+    shp_reader._descartar_pool()
+    monkeypatch.setattr(shp_reader, "SHP_MAX_WORKERS", 2)
+    SHPReader.leer_desde_zip(ruta)
+    assert shp_reader._pool is None
+
+    monkeypatch.setattr(shp_reader, "SHP_MIN_BYTES_PARALELO", 0)
+    paralelo = SHPReader.leer_desde_zip(ruta)
+    # El pool se ha usado (si se cae y se lee en serie, se descarta) y se reutiliza
+    pool = shp_reader._pool
+    assert pool is not None
+    assert SHPReader.leer_desde_zip(ruta) and shp_reader._pool is pool
+    # Orden determinista (rutas del ZIP ordenadas) y origen de cada capa conservado
+    assert [p.capa_origen for p in paralelo] == [c + "parcelas.shp" for c in sorted(carpetas) for _ in range(5)]
+    assert [p.coordenadas[0] for p in paralelo if p.nombre_archivo == "SHP_FEATURE_4"] == [(42.0, 20.0), (41.0, 20.0), (40.0, 20.0)]
+    assert [(p.capa_origen, p.coordenadas, p.nombre_archivo) for p in paralelo] == \
+        [(p.capa_origen, p.coordenadas, p.nombre_archivo) for p in serie]
+
+
+def test_zip_sin_shp(tmp_path):
+    ruta = str(tmp_path / "vacio.zip")
+    with zipfile.ZipFile(ruta, "w") as z:
+        z.writestr("leeme.txt", "nada")
+    with pytest.raises(Exception, match="No se encontró"):
+        SHPReader.leer_desde_zip(ruta)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,138 @@
+import sys
+import os
+import threading
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.single_flight import SingleFlight, FileSingleFlight, ErrorCompartido, FCNTL_AVAILABLE
+from core.upstream import UpstreamClient, url_ovc, RUTA_COORDENADAS
+import core.upstream as upstream
+from ovc_stub_server import crear_servidor
+
+
+def test_llamadas_simultaneas_comparten_resultado():
+    sf = SingleFlight()
+    llamadas = []
+
+    def lento():
+        llamadas.append(1)
+        time.sleep(0.2)
+        return object()
+
+    with ThreadPoolExecutor(20) as pool:
+        resultados = list(pool.map(lambda _: sf.do("k", lento), range(20)))
+    assert len(llamadas) == 1
+    assert all(r is resultados[0] for r in resultados)
+    assert sf.stats() == {"ejecutadas": 1, "compartidas": 19, "en_vuelo": 0}
+
+    # Una vez terminada, la siguiente llamada vuelve a ejecutar
+    sf.do("k", lento)
+    assert len(llamadas) == 2
+
+
+def test_errores_se_comparten_y_no_se_quedan():
+    sf = SingleFlight()
+
+    def falla():
+        time.sleep(0.1)
+        raise ValueError("caído")
+
+    def llamar(_):
+        try:
+            sf.do("k", falla)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(5) as pool:
+        assert list(pool.map(llamar, range(5))) == ["caído"] * 5
+    assert sf.do("k", lambda: "ok") == "ok"
+
+
+def _worker_archivo(directorio, contador, barrera, salida):
+    fsf = FileSingleFlight(directorio)
+    barrera.wait()
+
+    def consultar():
+        with contador.get_lock():
+            contador.value += 1
+        time.sleep(0.3)
+        return "respuesta"
+
+    salida.put(fsf.do("https://ovc/Consulta_DNPRC?RC=X", consultar))
+
+
+def test_coalescencia_entre_procesos():
+    if not FCNTL_AVAILABLE:
+        return
+    ctx = multiprocessing.get_context("fork")
+    contador = ctx.Value("i", 0)
+    barrera = ctx.Barrier(4)
+    salida = ctx.Queue()
+    with tempfile.TemporaryDirectory() as d:
+        procesos = [ctx.Process(target=_worker_archivo, args=(d, contador, barrera, salida)) for _ in range(4)]
+        for p in procesos:
+            p.start()
+        for p in procesos:
+            p.join(10)
+        assert [salida.get(timeout=1) for _ in range(4)] == ["respuesta"] * 4
+        assert contador.value == 1
+
+        # Una petición posterior (no simultánea) vuelve a consultar
+        fsf = FileSingleFlight(d)
+        assert fsf.do("https://ovc/Consulta_DNPRC?RC=X", lambda: "nueva") == "nueva"
+
+
+def test_error_entre_procesos_falla_rapido_a_los_que_esperan():
+    if not FCNTL_AVAILABLE:
+        return
+    with tempfile.TemporaryDirectory() as d:
+        lider = FileSingleFlight(d, compartir_errores=(ValueError,))
+        llamadas = []
+
+        def caido():
+            llamadas.append(1)
+            time.sleep(0.3)
+            raise ValueError("Catastro caído")
+
+        def esperar():
+            time.sleep(0.1)  # llega con el líder en vuelo
+            try:
+                FileSingleFlight(d).do("k", lambda: llamadas.append(1) or "no")
+            except ErrorCompartido as e:
+                return str(e)
+
+        with ThreadPoolExecutor(3) as pool:
+            seguidores = [pool.submit(esperar) for _ in range(2)]
+            try:
+                lider.do("k", caido)
+                assert False
+            except ValueError:
+                pass
+            assert [f.result() for f in seguidores] == ["Catastro caído"] * 2
+        assert len(llamadas) == 1
+
+        # El error no se queda: una petición posterior vuelve a intentarlo
+        assert FileSingleFlight(d).do("k", lambda: "ok") == "ok"
+
+
+def test_cliente_upstream_coalesce_gets(monkeypatch):
+    servidor = crear_servidor(puerto=0, latencia="fija:200")
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(upstream, "OVC_BASE_URL", f"http://127.0.0.1:{servidor.server_address[1]}")
+    try:
+        cliente = UpstreamClient()
+        url = url_ovc(RUTA_COORDENADAS, "Consulta_CPMRC", Provincia="", Municipio="", SRS="EPSG:4326", RC="8409103VH0180N")
+        with ThreadPoolExecutor(10) as pool:
+            respuestas = list(pool.map(lambda _: cliente.get(url, "Consulta_CPMRC"), range(10)))
+        assert len(set(respuestas)) == 1
+        assert servidor.estado.resumen()["peticiones"]["Consulta_CPMRC"] == 1
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
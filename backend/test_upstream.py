@@ -0,0 +1,206 @@
+import sys
+import os
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.upstream import UpstreamClient, CircuitBreaker, TokenBucket, UpstreamError, CircuitOpenError, RateLimitError
+
+
+class _Servidor:
+    """Servidor HTTP local que responde según una lista de códigos (el último se repite)"""
+
+    def __init__(self, codigos, retardo_s=0.0):
+        self.codigos = list(codigos)
+        self.peticiones = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                n = servidor.peticiones
+                servidor.peticiones += 1
+                codigo = servidor.codigos[min(n, len(servidor.codigos) - 1)]
+                time.sleep(retardo_s)
+                self.send_response(codigo)
+                self.end_headers()
+                self.wfile.write(f"<ok>{n}</ok>".encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _cliente(**kw):
+    kw.setdefault("backoff_base_s", 0.01)
+    kw.setdefault("backoff_max_s", 0.02)
+    kw.setdefault("tasa_rps", 1000)
+    kw.setdefault("rafaga", 1000)
+    return UpstreamClient(**kw)
+
+
+def test_reintenta_errores_5xx():
+    srv = _Servidor([503, 502, 200])
+    try:
+        assert _cliente(reintentos=2).get(srv.url, "ep") == "<ok>2</ok>"
+        assert srv.peticiones == 3
+    finally:
+        srv.cerrar()
+
+
+def test_4xx_no_se_reintenta():
+    srv = _Servidor([404])
+    try:
+        try:
+            _cliente(reintentos=3).get(srv.url, "ep")
+            assert False
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+        assert srv.peticiones == 1
+    finally:
+        srv.cerrar()
+
+
+def test_circuito_abierto_falla_rapido():
+    srv = _Servidor([500])
+    try:
+        cliente = _cliente(reintentos=0)
+        for _ in range(10):
+            try:
+                cliente.get(srv.url, "ep")
+            except UpstreamError as e:
+                assert e.codigo_http == 500
+        assert cliente.breaker("ep").estado == CircuitBreaker.ABIERTO
+
+        llamadas = srv.peticiones
+        inicio = time.monotonic()
+        try:
+            cliente.get(srv.url, "ep")
+            assert False
+        except CircuitOpenError:
+            pass
+        assert time.monotonic() - inicio < 0.05
+        assert srv.peticiones == llamadas
+        # Otro endpoint no se ve afectado
+        assert cliente.breaker("otro").permitir()
+    finally:
+        srv.cerrar()
+
+
+def test_circuito_semiabierto_se_recupera():
+    cb = CircuitBreaker(min_peticiones=2, enfriamiento_s=0.05)
+    cb.registrar(False)
+    cb.registrar(False)
+    assert not cb.permitir()
+    time.sleep(0.06)
+    assert cb.permitir()          # petición de prueba
+    assert not cb.permitir()      # solo una a la vez
+    cb.registrar(True)
+    assert cb.estado == CircuitBreaker.CERRADO
+
+
+def test_limite_de_tasa_no_bloquea_el_circuito_semiabierto():
+    srv = _Servidor([200])
+    try:
+        cliente = _cliente(tasa_rps=1000, rafaga=1, espera_cupo_s=0)
+        cb = cliente.breaker("ep")
+        cb.min_peticiones, cb.enfriamiento_s = 2, 0.01
+        cb.registrar(False)
+        cb.registrar(False)
+        time.sleep(0.02)
+        cliente.limitador.adquirir()  # sin cupo para la petición de prueba
+        try:
+            cliente.get(srv.url, "ep")
+            assert False
+        except RateLimitError:
+            pass
+        assert srv.peticiones == 0
+
+        time.sleep(0.01)
+        assert cliente.get(srv.url, "ep") == "<ok>0</ok>"
+        assert cb.estado == CircuitBreaker.CERRADO
+    finally:
+        srv.cerrar()
+
+
+def test_timeout_no_se_reintenta():
+    srv = _Servidor([200], retardo_s=0.3)
+    try:
+        inicio = time.monotonic()
+        try:
+            _cliente(reintentos=2).get(srv.url, "ep", timeout=0.1)
+            assert False
+        except UpstreamError:
+            pass
+        assert srv.peticiones == 1
+        assert time.monotonic() - inicio < 0.3
+    finally:
+        srv.cerrar()
+
+
+def test_espera_de_cupo_no_agota_el_presupuesto():
+    srv = _Servidor([200])
+    try:
+        # Sin cupo y con un token por segundo: la espera no cabe en el presupuesto
+        cliente = UpstreamClient(reintentos=0, tasa_rps=1, rafaga=1, presupuesto_s=0.5)
+        cliente.limitador.adquirir()
+        inicio = time.monotonic()
+        try:
+            cliente.get(srv.url, "ep")
+            assert False
+        except RateLimitError:
+            pass
+        assert time.monotonic() - inicio < 0.6
+
+        # El cupo llega, pero ya sin tiempo para la llamada: UpstreamError sin llamar y sin retener la prueba
+        cliente = _cliente(presupuesto_s=0.1)
+        cb = cliente.breaker("ep")
+        cb.min_peticiones, cb.enfriamiento_s = 2, 0.01
+        cb.registrar(False)
+        cb.registrar(False)
+        time.sleep(0.02)
+        cliente.limitador.adquirir = lambda espera_max=0.0: time.sleep(0.1) or True
+        try:
+            cliente.get(srv.url, "ep")
+            assert False
+        except UpstreamError as e:
+            assert not isinstance(e, RateLimitError) and "presupuesto" in str(e)
+        assert srv.peticiones == 0
+        assert cb.estado == CircuitBreaker.SEMIABIERTO and cb.permitir()
+    finally:
+        srv.cerrar()
+
+
+def test_token_bucket():
+    tb = TokenBucket(tasa=50, capacidad=2)
+    assert tb.adquirir() and tb.adquirir()
+    assert not tb.adquirir(0)
+    assert tb.adquirir(0.1)
+
+
+def test_hedging_devuelve_la_primera_respuesta():
+    srv = _Servidor([200], retardo_s=0.01)
+    try:
+        cliente = _cliente(hedging=True, hedging_min_muestras=5)
+        for _ in range(6):
+            cliente.get(srv.url, "ep")
+        assert cliente.get(srv.url, "ep").startswith("<ok>")
+    finally:
+        srv.cerrar()
+
+
+if __name__ == '__main__':
+    test_reintenta_errores_5xx()
+    test_4xx_no_se_reintenta()
+    test_circuito_abierto_falla_rapido()
+    test_circuito_semiabierto_se_recupera()
+    test_token_bucket()
+    test_hedging_devuelve_la_primera_respuesta()
+    print("OK")
@@ -0,0 +1,61 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import contextlib
+import pytest
+from shapely.geometry import Polygon
+from core.vector_reader import VectorReader
+from benchmarks.tejido_sintetico import generar_tejido, escribir_fgb, escribir_geojsonseq
+
+
+def _ventana(parcela, margen=1.0):
+    xmin, ymin, xmax, ymax = Polygon(parcela.exterior).bounds
+    return xmin - margen, ymin - margen, xmax + margen, ymax + margen
+
+
+def test_fgb_y_geojsonseq_como_el_tejido(tmp_path):
+    tejido = generar_tejido(200)
+    fgb = VectorReader.leer(escribir_fgb(tejido, str(tmp_path / "t.fgb")))
+    # GeoJSONSeq va en WGS84: se reproyecta al EPSG pedido
+    seq = VectorReader.leer(escribir_geojsonseq(tejido, str(tmp_path / "t.geojsonseq")), "25830")
+
+    area = {p.rc: Polygon(p.exterior, p.huecos).area for p in tejido}
+    # GeoJSON guarda 7 decimales de grado (~1 cm)
+    for parcelas, tolerancia in ((fgb, 1e-9), (seq, 1e-3)):
+        assert sorted(p.referencia_catastral for p in parcelas) == sorted(area)
+        for p in parcelas:
+            assert p.area == pytest.approx(area[p.referencia_catastral], rel=tolerancia)
+    assert sum(len(p.interiores) for p in fgb) == sum(len(p.huecos) for p in tejido)
+
+
+def test_bbox_solo_lee_lo_que_corta(tmp_path):
+    tejido = generar_tejido(500)
+    objetivo = tejido[137]
+    for ruta in (escribir_fgb(tejido, str(tmp_path / "t.fgb")),
+                 escribir_geojsonseq(tejido, str(tmp_path / "t.geojsonseq"))):
+        parcelas = VectorReader.leer(ruta, "25830", _ventana(objetivo))
+        assert objetivo.rc in {p.referencia_catastral for p in parcelas}
+        assert len(parcelas) < 20
+
+
+def test_analyze_con_bbox(tmp_path):
+    from fastapi.testclient import TestClient
+    from main import app
+    tejido = generar_tejido(300)
+    ruta = escribir_fgb(tejido, str(tmp_path / "municipio.fgb"))
+    cliente = TestClient(app)
+    with open(ruta, "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+        contenido = f.read()
+        completo = cliente.post("/analyze", files={"file": ("municipio.fgb", contenido)})
+        ventana = ",".join(str(v) for v in _ventana(tejido[0]))
+        barrio = cliente.post("/analyze", params={"bbox": ventana}, files={"file": ("municipio.fgb", contenido)})
+        erroneo = cliente.post("/analyze", params={"bbox": "1,2,3"}, files={"file": ("municipio.fgb", contenido)})
+    assert completo.status_code == 200 and barrio.status_code == 200
+    assert completo.json()["num_parcelas"] == 300
+    assert 0 < barrio.json()["num_parcelas"] < 20
+    assert erroneo.status_code == 400
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
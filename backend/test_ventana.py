@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import contextlib
+import pytest
+from shapely.geometry import Polygon, box
+from core.dxf_reader import DXFReader
+from core.shp_reader import SHPReader
+from core.kml_reader import KMLReader
+from core.gml_reader import GMLReader
+from core.vector_reader import VectorReader
+from benchmarks.tejido_sintetico import generar_tejido, escribir_todos
+
+TEJIDO = generar_tejido(400)
+
+
+def _ventana(parcela, margen=5.0):
+    xmin, ymin, xmax, ymax = Polygon(parcela.exterior).bounds
+    return xmin - margen, ymin - margen, xmax + margen, ymax + margen
+
+
+def _esperadas(ventana):
+    """RC de las parcelas cuya envolvente corta la ventana"""
+    return {p.rc for p in TEJIDO if box(*Polygon(p.exterior).bounds).intersects(box(*ventana))}
+
+
+@pytest.fixture(scope="module")
+def rutas(tmp_path_factory):
+    return escribir_todos(TEJIDO, str(tmp_path_factory.mktemp("tejido")))
+
+
+def test_todos_los_lectores_filtran_por_envolvente(rutas):
+    ventana = _ventana(TEJIDO[211])
+    esperadas = _esperadas(ventana)
+    assert 1 < len(esperadas) < 20
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        exactos = {
+            "dxf": DXFReader.leer_borde_parcelas(rutas["dxf"], ["PG-LP"], "PG-LT", ventana),
+            "shp": SHPReader.leer_desde_zip(rutas["shp"], ventana),
+            "gml": GMLReader.leer_gml(rutas["gml"], "25830", ventana),
+            "fgb": VectorReader.leer(rutas["fgb"], "25830", ventana),
+        }
+        # KML va en WGS84: la ventana se compara en lon/lat, como rectángulo envolvente
+        kml = KMLReader.leer_desde_kmz(rutas["kmz"], "25830", ventana)
+
+    for formato, parcelas in exactos.items():
+        assert {p.referencia_catastral for p in parcelas if p.referencia_catastral} == esperadas, formato
+    rcs_kml = {p.referencia_catastral for p in kml}
+    assert esperadas <= rcs_kml and len(rcs_kml) < 2 * len(esperadas) + 5
+
+
+def test_analyze_con_punto_y_radio(rutas):
+    from fastapi.testclient import TestClient
+    from main import app
+    cliente = TestClient(app)
+    x, y = TEJIDO[50].etiqueta
+    with open(rutas["dxf"], "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+        contenido = f.read()
+        cerca = cliente.post("/analyze", params={"punto": f"{x},{y}", "radio": 30},
+                             files={"file": ("municipio.dxf", contenido)})
+        ambos = cliente.post("/analyze", params={"punto": f"{x},{y}", "radio": 30, "bbox": "0,0,1,1"},
+                             files={"file": ("municipio.dxf", contenido)})
+        sin_radio = cliente.post("/analyze", params={"punto": f"{x},{y}"},
+                                 files={"file": ("municipio.dxf", contenido)})
+    assert cerca.status_code == 200
+    rcs = {p["referencia_catastral"] for p in cerca.json()["parcelas"]}
+    assert TEJIDO[50].rc in rcs and len(rcs) < 20
+    assert ambos.status_code == 400 and sin_radio.status_code == 400
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
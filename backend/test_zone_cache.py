@@ -0,0 +1,85 @@
+import sys
+import os
+import math
+import time
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from core.zone_cache import ZoneCache, METROS_POR_GRADO
+
+ANDUJAR = (38.0394, -4.0571)
+
+
+def _centro(cache, fila, columna):
+    """Centro (lat, lon) de una celda de la rejilla de la caché"""
+    paso_lat = cache.tam_celda_m / METROS_POR_GRADO
+    lat = (fila + 0.5) * paso_lat
+    paso_lon = cache.tam_celda_m / (METROS_POR_GRADO * math.cos(math.radians(lat)))
+    return lat, (columna + 0.5) * paso_lon
+
+
+def _vecina(cache, df, dc):
+    fila, columna = cache.celda(*ANDUJAR)
+    return _centro(cache, fila + df, columna + dc)
+
+
+def test_acierto_directo():
+    cache = ZoneCache()
+    assert cache.get(*ANDUJAR) is None
+    cache.put(*ANDUJAR, "R37")
+    assert cache.get(*ANDUJAR) == "R37"
+    assert cache.get(*_vecina(cache, 0, 0)) == "R37"  # otro punto de la misma celda
+    assert cache.stats() == {"entradas": 1, "aciertos": 2, "aciertos_vecinos": 0, "fallos": 1}
+
+
+def test_vecinas_deben_coincidir():
+    cache = ZoneCache()
+    cache.put(*_vecina(cache, 0, 1), "R37")
+    assert cache.get(*ANDUJAR) is None  # una sola vecina no tiene con quién coincidir
+
+    cache.put(*_vecina(cache, -1, 0), "R37")
+    assert cache.get(*ANDUJAR) == "R37"
+    assert cache.stats()["aciertos_vecinos"] == 1
+
+    cache.put(*_vecina(cache, 1, 1), "R40")  # discrepan: hay un límite de zona cerca
+    assert cache.get(*ANDUJAR) is None
+
+
+def test_vecinas_solo_diagonales_no_bastan():
+    cache = ZoneCache()
+    for df, dc in ((-1, -1), (1, 1), (-1, 1)):
+        cache.put(*_vecina(cache, df, dc), "R37")
+    assert cache.get(*ANDUJAR) is None
+
+    cache.put(*_vecina(cache, 1, 0), "R37")
+    assert cache.get(*ANDUJAR) == "R37"
+
+
+def test_min_vecinos_no_baja_de_dos():
+    cache = ZoneCache(min_vecinos=1)
+    cache.put(*_vecina(cache, 0, 1), "R37")
+    assert cache.get(*ANDUJAR) is None
+
+
+def test_caducidad():
+    cache = ZoneCache(ttl_segundos=0.05)
+    cache.put(*ANDUJAR, "R37")
+    assert cache.get(*ANDUJAR) == "R37"
+    time.sleep(0.06)
+    assert cache.get(*ANDUJAR) is None
+    assert cache.stats()["entradas"] == 0
+
+
+def test_expulsa_la_menos_usada():
+    cache = ZoneCache(max_entradas=2)
+    a, b, c = (_vecina(cache, 0, 5 * k) for k in range(3))  # celdas alejadas: sin aciertos por vecindad
+    cache.put(*a, "A")
+    cache.put(*b, "B")
+    assert cache.get(*a) == "A"  # 'a' pasa a ser la más reciente
+    cache.put(*c, "C")
+    assert cache.get(*b) is None
+    assert (cache.get(*a), cache.get(*c)) == ("A", "C")
+    assert cache.stats()["entradas"] == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))